@@ -0,0 +1,233 @@
+# CampoDigital - Analítica de vendedores con pandas
+# Carga pedidos, detalles, productos y reseñas en bloque y calcula los indicadores con
+# groupby vectorizados. Las recargas son incrementales: solo se leen las filas
+# modificadas desde la última marca (updated_at de pedidos y productos, id de reseñas).
+#   python analytics.py --seller 1
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from app import DatabaseManager, _placeholders
+
+# Los pedidos cancelados no cuentan como venta
+EXCLUDED_ORDER_STATUSES = ('cancelled',)
+
+# Pedidos cuyos detalles se piden en cada consulta IN
+DETAIL_BATCH_SIZE = 1000
+
+ORDER_COLUMNS = ['id', 'buyer_id', 'seller_id', 'status', 'total_amount', 'created_at', 'updated_at']
+DETAIL_COLUMNS = ['order_id', 'product_id', 'quantity', 'subtotal']
+PRODUCT_COLUMNS = ['id', 'user_id', 'name', 'category', 'updated_at']
+REVIEW_COLUMNS = ['id', 'reviewed_id', 'product_id', 'rating', 'created_at']
+
+
+def _cents(values):
+    # DECIMAL(10, 2) -> centavos enteros: sumas exactas y agregaciones vectorizadas
+    return np.round(pd.to_numeric(values, errors='coerce').fillna(0).astype('float64') * 100).astype('int64')
+
+
+def _frame(rows, columns):
+    return pd.DataFrame.from_records(rows, columns=columns) if rows else pd.DataFrame(columns=columns)
+
+
+# Conversión de tipos de cada tabla; se aplica también a los marcos vacíos iniciales
+# para que los informes funcionen antes de la primera carga
+
+def _typed_orders(orders):
+    orders['total_cents'] = _cents(orders['total_amount'])
+    orders['created_at'] = pd.to_datetime(orders['created_at'])
+    return orders
+
+
+def _typed_details(details):
+    details['quantity'] = pd.to_numeric(details['quantity'], errors='coerce').astype('float64')
+    details['subtotal_cents'] = _cents(details['subtotal'])
+    return details
+
+
+def _typed_reviews(reviews):
+    reviews['created_at'] = pd.to_datetime(reviews['created_at'])
+    reviews['rating'] = reviews['rating'].astype('int64')
+    return reviews
+
+
+class SellerAnalytics:
+    def __init__(self, db_manager):
+        self.db = db_manager
+        self.orders = _typed_orders(_frame([], ORDER_COLUMNS)).set_index('id')
+        self.details = _typed_details(_frame([], DETAIL_COLUMNS))
+        self.products = _frame([], PRODUCT_COLUMNS).set_index('id')
+        self.reviews = _typed_reviews(_frame([], REVIEW_COLUMNS)).set_index('id')
+        # Marcas de agua: la siguiente recarga empieza donde terminó la anterior
+        self.orders_watermark = None
+        self.products_watermark = None
+        self.reviews_watermark = 0
+
+    def refresh(self):
+        # Trae lo nuevo o modificado y lo combina con lo ya cargado. La marca avanza
+        # hasta la última fila leída (no hasta "ahora"), así un error a mitad de lectura
+        # no deja huecos; con >= se releen las filas del mismo segundo y se deduplican.
+        changed_orders = self._refresh_orders()
+        self._refresh_details(changed_orders)
+        self._refresh_products()
+        new_reviews = self._refresh_reviews()
+        return {'orders': len(changed_orders), 'reviews': new_reviews}
+
+    def _incremental(self, table, columns, watermark):
+        if watermark is None:
+            query = f"SELECT {', '.join(columns)} FROM {table} ORDER BY updated_at, id"
+            params = ()
+        else:
+            query = (f"SELECT {', '.join(columns)} FROM {table} WHERE updated_at >= %s "
+                     f"ORDER BY updated_at, id")
+            params = (watermark,)
+        return _frame(list(self.db.iter_query(query, params)), columns)
+
+    @staticmethod
+    def _merge(current, changed):
+        changed = changed.set_index('id')
+        if current.empty:
+            return changed
+        return pd.concat([current[~current.index.isin(changed.index)], changed])
+
+    def _refresh_orders(self):
+        changed = self._incremental('orders', ORDER_COLUMNS, self.orders_watermark)
+        if changed.empty:
+            return []
+        self.orders = self._merge(self.orders, _typed_orders(changed))
+        self.orders_watermark = changed['updated_at'].max()
+        return changed['id'].tolist()
+
+    def _refresh_details(self, order_ids):
+        # Los detalles no tienen updated_at: se recargan los de los pedidos modificados
+        if not order_ids:
+            return
+        query = """
+        SELECT order_id, product_id, quantity, subtotal
+        FROM order_details
+        WHERE order_id IN ({})
+        """
+        rows = []
+        for start in range(0, len(order_ids), DETAIL_BATCH_SIZE):
+            batch = order_ids[start:start + DETAIL_BATCH_SIZE]
+            rows.extend(self.db.fetch_all(query.format(_placeholders(batch)), tuple(batch)))
+        changed = _typed_details(_frame(rows, DETAIL_COLUMNS))
+        kept = self.details[~self.details['order_id'].isin(order_ids)]
+        self.details = pd.concat([kept, changed], ignore_index=True) if not kept.empty else changed
+
+    def _refresh_products(self):
+        changed = self._incremental('products', PRODUCT_COLUMNS, self.products_watermark)
+        if changed.empty:
+            return
+        self.products = self._merge(self.products, changed)
+        self.products_watermark = changed['updated_at'].max()
+
+    def _refresh_reviews(self):
+        # Las reseñas no se editan: basta con la marca de id
+        query = f"""
+        SELECT {', '.join(REVIEW_COLUMNS)}
+        FROM reviews
+        WHERE id > %s
+        ORDER BY id
+        """
+        changed = _frame(list(self.db.iter_query(query, (self.reviews_watermark,))), REVIEW_COLUMNS)
+        if changed.empty:
+            return 0
+        self.reviews = self._merge(self.reviews, _typed_reviews(changed))
+        self.reviews_watermark = int(changed['id'].max())
+        return len(changed)
+
+    def _sales(self):
+        orders = self.orders[~self.orders['status'].isin(EXCLUDED_ORDER_STATUSES)]
+        return orders.assign(month=orders['created_at'].dt.to_period('M'))
+
+    def _sales_lines(self):
+        # Detalles de pedidos válidos con vendedor, mes, nombre y categoría del producto
+        sales = self._sales()[['seller_id', 'month']]
+        lines = self.details.join(sales, on='order_id', how='inner')
+        lines = lines.join(self.products[['name', 'category']], on='product_id', how='left')
+        lines['category'] = lines['category'].fillna('Sin categoría')
+        return lines
+
+    def seller_monthly(self, seller_ids=None):
+        # Por vendedor y mes: pedidos, ingresos, ticket medio, reseñas y calificación media
+        sales = self._sales()
+        if seller_ids is not None:
+            sales = sales[sales['seller_id'].isin(seller_ids)]
+        report = sales.groupby(['seller_id', 'month']).agg(
+            orders=('total_cents', 'size'), revenue_cents=('total_cents', 'sum'))
+        report['revenue'] = report['revenue_cents'] / 100
+        report['average_ticket'] = (report['revenue_cents'] / report['orders']).round() / 100
+
+        ratings = self.rating_trend(seller_ids)[['reviews', 'average_rating']]
+        # Unión externa: los meses con reseñas pero sin ventas también aparecen
+        report = report.join(ratings, how='outer').drop(columns='revenue_cents')
+        for column in ('orders', 'reviews'):
+            report[column] = report[column].fillna(0).astype('int64')
+        report['revenue'] = report['revenue'].fillna(0.0)
+        return report.sort_index()
+
+    def category_monthly(self, seller_ids=None):
+        # Por vendedor, categoría y mes: ingresos, unidades y pedidos distintos
+        lines = self._sales_lines()
+        if seller_ids is not None:
+            lines = lines[lines['seller_id'].isin(seller_ids)]
+        report = lines.groupby(['seller_id', 'category', 'month']).agg(
+            revenue_cents=('subtotal_cents', 'sum'), units=('quantity', 'sum'),
+            orders=('order_id', 'nunique'))
+        report['revenue'] = report.pop('revenue_cents') / 100
+        return report.sort_index()
+
+    def rating_trend(self, seller_ids=None):
+        # Por vendedor y mes: reseñas recibidas, media del mes y media acumulada
+        reviews = self.reviews
+        if seller_ids is not None:
+            reviews = reviews[reviews['reviewed_id'].isin(seller_ids)]
+        reviews = reviews.assign(month=reviews['created_at'].dt.to_period('M'))
+        trend = reviews.groupby(['reviewed_id', 'month']).agg(
+            reviews=('rating', 'size'), rating_sum=('rating', 'sum'))
+        trend.index = trend.index.set_names(['seller_id', 'month'])
+        trend['average_rating'] = trend['rating_sum'] / trend['reviews']
+        totals = trend.groupby(level='seller_id')[['rating_sum', 'reviews']].cumsum()
+        trend['cumulative_rating'] = totals['rating_sum'] / totals['reviews']
+        return trend.drop(columns='rating_sum').sort_index()
+
+    def top_products(self, n=5, seller_ids=None):
+        # Los n productos con más ingresos de cada vendedor
+        lines = self._sales_lines()
+        if seller_ids is not None:
+            lines = lines[lines['seller_id'].isin(seller_ids)]
+        totals = lines.groupby(['seller_id', 'product_id', 'name'], dropna=False).agg(
+            revenue_cents=('subtotal_cents', 'sum'), units=('quantity', 'sum'),
+            orders=('order_id', 'nunique')).reset_index()
+        totals = totals.sort_values(['seller_id', 'revenue_cents'], ascending=[True, False])
+        top = totals.groupby('seller_id').head(n)
+        top = top.assign(revenue=top.pop('revenue_cents') / 100)
+        return top.set_index(['seller_id', 'product_id'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analítica de vendedores de CampoDigital")
+    parser.add_argument('--seller', type=int, action='append', help="Limita el informe a estos vendedores")
+    parser.add_argument('--top', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    db = DatabaseManager()
+    db.connect()
+    try:
+        analytics = SellerAnalytics(db)
+        print(f"Filas cargadas: {analytics.refresh()}")
+        with pd.option_context('display.width', 160, 'display.max_rows', 200):
+            print("\n--- Ventas por vendedor y mes ---")
+            print(analytics.seller_monthly(args.seller))
+            print("\n--- Ventas por categoría ---")
+            print(analytics.category_monthly(args.seller))
+            print("\n--- Productos más vendidos ---")
+            print(analytics.top_products(args.top, args.seller))
+    finally:
+        db.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,28 @@
 import mysql.connector
 from mysql.connector import Error
+from mysql.connector.errors import InterfaceError, OperationalError, PoolError
+import argparse
+import base64
 import datetime
-import hashlib
+import itertools
+import logging
 import os  # Importamos os pero no EX_CONFIG que no existe
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import lru_cache, wraps
 from typing import List, Dict, Any, Optional, Tuple
 from decimal import Decimal
 import json
 
+from cache import MISS
+from log_config import configure_logging
+from passwords import HashingBusyError, default_hasher
+from geo_index import GridIndex, bounding_box
+from text_search import InvertedIndex, build_boolean_query
+
 DB_CONFIG = {
     'host': 'localhost',
     'database': 'campodigital',
@@ -14,77 +30,1109 @@ DB_CONFIG = {
     'password': 'DIOS1234',  
 }
 
+# Filas por sentencia/commit en las inserciones masivas
+BULK_CHUNK_SIZE = 500
+
+# Filas que se piden al servidor en cada lote al recorrer resultados grandes
+STREAM_BATCH_SIZE = 1000
+
+# Sentencias preparadas que se conservan por conexión (0 desactiva la caché)
+STATEMENT_CACHE_SIZE = 0
+
+# Registros de la capa de datos (conexiones, consultas) y de los modelos; los niveles se
+# ajustan por módulo (ver log_config)
+logger = logging.getLogger('campodigital.db')
+pool_logger = logging.getLogger('campodigital.pool')
+models_logger = logging.getLogger('campodigital.models')
+
+# Parámetros por defecto del pool de conexiones (tiempos en segundos)
+POOL_CONFIG = {
+    'min_size': 2,
+    'max_size': 10,
+    'checkout_timeout': 5.0,
+    'idle_timeout': 300.0,
+    'health_check': True,
+    # Las conexiones devueltas hace menos de esto se prestan sin ping
+    'health_check_after': 5.0,
+}
+
+# Enrutamiento de lecturas a réplicas (ver DatabaseManager). Tiempos en segundos.
+#   balance: 'round_robin' o 'least_latency' (media móvil de la latencia de lectura)
+#   read_your_writes_window: tras una escritura, las lecturas del mismo hilo o usuario
+#     (acting_as) siguen en el primario durante este tiempo
+#   max_lag_seconds: réplicas con más retraso de replicación quedan fuera (None no mide)
+#   retry_after: tiempo que una réplica caída queda excluida antes de reintentarla
+# Con caché de lectura, lo leído de una réplica puede llegar con hasta max_lag_seconds
+# de retraso y conservarse hasta que venza el TTL.
+REPLICA_CONFIG = {
+    'balance': 'round_robin',
+    'read_your_writes_window': 5.0,
+    'max_lag_seconds': 10.0,
+    'lag_check_interval': 5.0,
+    'retry_after': 30.0,
+}
+
+# Errores de una réplica que hacen repetir la lectura en otra (o en el primario)
+FAILOVER_ERRORS = (InterfaceError, OperationalError, PoolError)
+
+# Errores que dejan la conexión inservible (caída, tiempo agotado, protocolo). Los de
+# datos (clave duplicada, SQL inválido) no la afectan y se devuelve al pool.
+CONNECTION_ERRORS = (InterfaceError, OperationalError)
+
+class InsufficientStockError(Exception):
+    def __init__(self, product_id, quantity):
+        super().__init__(f"Inventario insuficiente para reservar {quantity} del producto {product_id}")
+        self.product_id = product_id
+        self.quantity = quantity
+
+class ConnectionPool:
+    def __init__(self, config, min_size=2, max_size=10, checkout_timeout=5.0,
+                 idle_timeout=300.0, health_check=True, health_check_after=5.0):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError("Tamaños de pool inválidos: se requiere 0 <= min_size <= max_size y max_size >= 1")
+        self.config = config
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.idle_timeout = idle_timeout
+        self.health_check = health_check
+        self.health_check_after = health_check_after
+
+        # Conexiones libres como (conexión, instante de devolución); las más recientes a la derecha
+        self._idle = deque()
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'created': 0,
+            'evicted': 0,
+            'health_check_failures': 0,
+            'peak_in_use': 0,
+        }
+
+    def open(self):
+        # Precargar las conexiones mínimas
+        for _ in range(self.min_size):
+            connection = self._new_connection()
+            with self._cond:
+                self._idle.append((connection, time.monotonic()))
+                self._size += 1
+
+    def acquire(self, timeout=None):
+        timeout = self.checkout_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        self.evict_idle()
+
+        connection = None
+        released_at = None
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError("El pool de conexiones está cerrado")
+                if self._idle:
+                    # LIFO: reutilizar la conexión más caliente y dejar envejecer las demás
+                    connection, released_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # Reservar el cupo ahora y abrir la conexión fuera del candado
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolError(f"Tiempo de espera agotado ({timeout}s) al obtener una conexión del pool")
+                waited = True
+                self._cond.wait(remaining)
+            self._in_use += 1
+
+        try:
+            if connection is None:
+                connection = self._new_connection()
+            elif (self.health_check and time.monotonic() - released_at >= self.health_check_after
+                  and not self._is_healthy(connection)):
+                # Solo se comprueban las que llevan un rato ociosas: una recién devuelta
+                # estaba respondiendo y el ping costaría un viaje al servidor en cada préstamo
+                self._close_quietly(connection)
+                with self._cond:
+                    self._stats['health_check_failures'] += 1
+                pool_logger.warning("Conexión del pool descartada por no responder al ping")
+                connection = self._new_connection()
+        except Error:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        elapsed = time.monotonic() - start
+        with self._cond:
+            self._stats['checkouts'] += 1
+            self._stats['waits'] += 1 if waited else 0
+            self._stats['wait_time_total'] += elapsed
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], elapsed)
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._in_use)
+        return connection
+
+    def release(self, connection):
+        try:
+            # No devolver al pool transacciones a medio terminar
+            if connection.in_transaction:
+                connection.rollback()
+        except Error:
+            self.discard(connection)
+            return
+
+        with self._cond:
+            self._in_use -= 1
+            if self._closed:
+                self._size -= 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+                connection = None
+            self._cond.notify()
+        if connection is not None:
+            self._close_quietly(connection)
+
+    def discard(self, connection):
+        # Sacar del pool una conexión que quedó inservible
+        with self._cond:
+            self._in_use -= 1
+            self._size -= 1
+            self._cond.notify()
+        self._close_quietly(connection)
+
+    def evict_idle(self):
+        # Cerrar conexiones ociosas por encima del mínimo que superan idle_timeout
+        if not self.idle_timeout:
+            return 0
+        expired = []
+        now = time.monotonic()
+        with self._cond:
+            while (self._idle and self._size > self.min_size
+                   and now - self._idle[0][1] > self.idle_timeout):
+                connection, _ = self._idle.popleft()
+                expired.append(connection)
+                self._size -= 1
+            self._stats['evicted'] += len(expired)
+        for connection in expired:
+            self._close_quietly(connection)
+        if expired:
+            pool_logger.debug("Conexiones ociosas cerradas: %d", len(expired))
+        return len(expired)
+
+    def stats(self):
+        with self._cond:
+            checkouts = self._stats['checkouts']
+            stats = dict(self._stats)
+            stats.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'utilization': self._in_use / self.max_size,
+                'peak_utilization': self._stats['peak_in_use'] / self.max_size,
+                'avg_wait_ms': (self._stats['wait_time_total'] / checkouts * 1000) if checkouts else 0.0,
+                'max_wait_ms': self._stats['wait_time_max'] * 1000,
+            })
+        return stats
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for connection in idle:
+            self._close_quietly(connection)
+
+    def _new_connection(self):
+        connection = mysql.connector.connect(**self.config)
+        with self._cond:
+            self._stats['created'] += 1
+        return connection
+
+    def _is_healthy(self, connection):
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Error:
+            return False
+
+    def _close_quietly(self, connection):
+        try:
+            connection.close()
+        except Error:
+            pass
+
+class StatementCache:
+    # Cursores preparados (cursor(prepared=True)) de una conexión, uno por texto SQL,
+    # con expulsión LRU. Cada conexión la usa un solo hilo a la vez, así que no lleva candado.
+    def __init__(self, connection, max_size):
+        self.connection = connection
+        self.max_size = max_size
+        self._statements = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._statements)
+
+    def get(self, query):
+        # Devuelve (texto_canónico, cursor). El conector solo reutiliza la sentencia si
+        # recibe el mismo objeto str que la preparó, por eso se guarda el texto original.
+        entry = self._statements.get(query)
+        if entry is not None:
+            self._statements.move_to_end(query)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = (query, self.connection.cursor(prepared=True, dictionary=True))
+        self._statements[query] = entry
+        while len(self._statements) > self.max_size:
+            _, (_, cursor) = self._statements.popitem(last=False)
+            self._close_quietly(cursor)
+            self.evictions += 1
+        return entry
+
+    def discard(self, query):
+        entry = self._statements.pop(query, None)
+        if entry is not None:
+            self._close_quietly(entry[1])
+
+    def _close_quietly(self, cursor):
+        try:
+            cursor.close()
+        except Error:
+            pass
+
+class Replica:
+    # Réplica de solo lectura: su propio pool (o una conexión), disponibilidad, retraso
+    # de replicación medido y latencia media de sus lecturas
+    def __init__(self, config, pool_config=None):
+        self.config = config
+        self.name = f"{config.get('host', 'localhost')}:{config.get('port', 3306)}"
+        self.pool_config = pool_config
+        self.pool = None
+        self.connection = None
+        self.down_until = 0.0
+        self.lag = None
+        self.lag_checked_at = float('-inf')
+        self.latency = None
+        self.reads = 0
+        self.failures = 0
+        self.lag_lock = threading.Lock()
+
+    def open(self):
+        if self.pool_config is not None:
+            self.pool = ConnectionPool(self.config, **self.pool_config)
+            self.pool.open()
+        else:
+            self.connection = mysql.connector.connect(**self.config)
+
+    def close(self):
+        if self.pool:
+            self.pool.close()
+            self.pool = None
+        self._close_connection()
+
+    def _close_connection(self):
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            try:
+                connection.close()
+            except Error:
+                pass
+
+    def available(self, now):
+        return now >= self.down_until
+
+    def mark_down(self, retry_after, error):
+        self.down_until = time.monotonic() + retry_after
+        self.failures += 1
+        if self.pool is None:
+            self._close_connection()
+        logger.warning("Réplica %s excluida durante %ss: %s", self.name, retry_after, error)
+
+    def record_read(self, elapsed):
+        # Media móvil exponencial: pesa más lo reciente y absorbe picos aislados
+        self.reads += 1
+        self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+
+    @contextmanager
+    def session(self):
+        if self.pool is None:
+            if self.connection is None:
+                self.connection = mysql.connector.connect(**self.config)
+            connection = self.connection
+        else:
+            connection = self.pool.acquire()
+        cursor = connection.cursor(dictionary=True, buffered=True)
+        broken = False
+        try:
+            yield connection, cursor
+        except CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            try:
+                cursor.close()
+            except Error:
+                pass
+            if self.pool is not None:
+                if broken:
+                    self.pool.discard(connection)
+                else:
+                    self.pool.release(connection)
+            else:
+                # La conexión única no se confirma nunca: sin cerrar la transacción, la
+                # primera lectura fijaría la instantánea (REPEATABLE READ) para siempre
+                try:
+                    connection.rollback()
+                except Error:
+                    self._close_connection()
+
+    def measure_lag(self, retry_after):
+        # Segundos de retraso según SHOW REPLICA STATUS (SHOW SLAVE STATUS antes de
+        # MySQL 8.0.22). Replicación detenida -> infinito. Un servidor sin replicación
+        # configurada (p. ej. dos instancias independientes en pruebas) cuenta como 0.
+        self.lag_checked_at = time.monotonic()
+        try:
+            with self.session() as (connection, cursor):
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except (InterfaceError, OperationalError):
+                    raise
+                except Error:
+                    cursor.execute("SHOW SLAVE STATUS")
+                row = cursor.fetchone()
+        except FAILOVER_ERRORS as e:
+            self.mark_down(retry_after, e)
+            return self.lag
+        except Error as e:
+            # Sin privilegio REPLICATION CLIENT no se puede medir: se deja sin dato
+            logger.warning("No se pudo medir el retraso de la réplica %s: %s", self.name, e)
+            self.lag = None
+            return None
+        if row is None:
+            self.lag = 0
+        else:
+            lag = row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+            self.lag = float('inf') if lag is None else lag
+        return self.lag
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            'name': self.name,
+            'available': self.available(now),
+            'lag_seconds': self.lag,
+            'latency_ms': self.latency * 1000 if self.latency is not None else None,
+            'reads': self.reads,
+            'failures': self.failures,
+            'pool': self.pool.stats() if self.pool else None,
+        }
+
 class DatabaseManager:
-    def __init__(self, config=DB_CONFIG):
+    # Con replicas (lista de configuraciones, completas o solo con lo que cambia respecto
+    # a config, p. ej. {'port': 3307}) las lecturas de los métodos marcados con
+    # @replica_read van a una réplica; las de una transacción, las de una sesión abierta
+    # y las posteriores a una escritura del mismo hilo o usuario siguen en el primario.
+    def __init__(self, config=DB_CONFIG, pool_config=None, cache=None,
+                 statement_cache_size=STATEMENT_CACHE_SIZE, instrumentation=None,
+                 replicas=None, replica_config=None):
         self.config = config
+        self.pool_config = pool_config
+        self.pool = None
+        self.replicas = [Replica(dict(config, **replica), pool_config) for replica in replicas or ()]
+        self.replica_config = dict(REPLICA_CONFIG, **(replica_config or {}))
+        if self.replica_config['balance'] not in ('round_robin', 'least_latency'):
+            raise ValueError(f"Balanceo de réplicas no soportado: {self.replica_config['balance']}")
+        self._round_robin = itertools.count()
+        # Última escritura por usuario (acting_as) para leer lo propio en el primario
+        self._recent_writes = OrderedDict()
+        self._writes_lock = threading.Lock()
+        self._routing_stats = {'replica_reads': 0, 'primary_reads': 0, 'pinned_reads': 0,
+                               'failovers': 0}
+        self._routing_lock = threading.Lock()
+        # Métricas por consulta (instrumentation.Instrumentation); None no mide nada
+        self.instrumentation = instrumentation
+        # Caché de lectura compartida por los modelos (LRUCache, RedisCache o None)
+        self.cache = cache
+        # Sentencias preparadas por conexión; se liberan junto con la conexión
+        self.statement_cache_size = statement_cache_size
+        self._statement_caches = weakref.WeakKeyDictionary()
+        self._statement_lock = threading.Lock()
         self.connection = None
         self.cursor = None
+        # Conexión/cursor y último id insertado de cada hilo
+        self._local = threading.local()
 
     def connect(self):
+        # Una réplica que no responde no impide arrancar: queda excluida y se reintenta
+        for replica in self.replicas:
+            try:
+                replica.open()
+            except Error as e:
+                replica.mark_down(self.replica_config['retry_after'], e)
         try:
+            if self.pool_config is not None:
+                self.pool = ConnectionPool(self.config, **self.pool_config)
+                self.pool.open()
+                logger.info("Pool de conexiones a MySQL inicializado")
+                return True
             self.connection = mysql.connector.connect(**self.config)
             if self.connection.is_connected():
                 self.cursor = self.connection.cursor(dictionary=True)
-                print("Conexión exitosa a la base de datos MySQL")
+                logger.info("Conexión exitosa a la base de datos MySQL")
                 return True
         except Error as e:
-            print(f"Error al conectar a MySQL: {e}")
+            logger.error("Error al conectar a MySQL: %s", e)
             return False
 
     def disconnect(self):
+        for replica in self.replicas:
+            replica.close()
+        if self.pool:
+            self.pool.close()
+            logger.info("Pool de conexiones a MySQL cerrado")
         if self.connection and self.connection.is_connected():
             if self.cursor:
                 self.cursor.close()
             self.connection.close()
-            print("Conexión a MySQL cerrada")
+            logger.info("Conexión a MySQL cerrada")
 
-    def execute_query(self, query, params=None):
+    @contextmanager
+    def session(self):
+        # Entrega a la unidad de trabajo su propia conexión y cursor.
+        # Las llamadas anidadas en el mismo hilo reutilizan la sesión activa.
+        current = getattr(self._local, 'session', None)
+        if current is not None:
+            yield current
+            return
+        if self.pool is None:
+            yield self.connection, self.cursor
+            return
+
+        connection = self.pool.acquire()
+        # Cursor con buffer para no dejar resultados pendientes al devolver la conexión
+        cursor = connection.cursor(dictionary=True, buffered=True)
+        self._local.session = (connection, cursor)
+        broken = False
         try:
-            self.cursor.execute(query, params or ())
-            self.connection.commit()
-            print("Consulta ejecutada exitosamente")
+            yield connection, cursor
+        except CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            self._local.session = None
+            try:
+                cursor.close()
+            except Error:
+                pass
+            # Sin ping al devolver: solo se descarta si falló la propia conexión
+            if broken:
+                self.pool.discard(connection)
+            else:
+                self.pool.release(connection)
+
+    @contextmanager
+    def transaction(self):
+        # Agrupa varias operaciones de los modelos en un único commit.
+        # Dentro de la transacción execute_query/execute_many no confirman y propagan
+        # los errores, de modo que cualquier fallo revierte todo el bloque.
+        if self.in_transaction():
+            # Transacción anidada: se une a la exterior
+            self._local.transaction_depth += 1
+            try:
+                yield self._local.transaction
+            finally:
+                self._local.transaction_depth -= 1
+            return
+
+        with self.session() as (connection, cursor):
+            self._local.transaction = (connection, cursor)
+            self._local.transaction_depth = 1
+            self._local.after_commit = []
+            try:
+                yield connection, cursor
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+            finally:
+                callbacks = self._local.after_commit
+                self._local.transaction_depth = 0
+                self._local.transaction = None
+                self._local.after_commit = []
+            # Solo se llega aquí si el commit tuvo éxito
+            self._record_write()
+            for callback in callbacks:
+                callback()
+
+    def in_transaction(self):
+        return getattr(self._local, 'transaction_depth', 0) > 0
+
+    def after_commit(self, callback):
+        # Ejecuta callback cuando se confirme la transacción en curso (o ya, si no hay)
+        if self.in_transaction():
+            self._local.after_commit.append(callback)
+        else:
+            callback()
+
+    @contextmanager
+    def replica_reads(self):
+        # Las lecturas del bloque pueden ir a una réplica (ver _route_read)
+        self._local.replica_reads = getattr(self._local, 'replica_reads', 0) + 1
+        try:
+            yield
+        finally:
+            self._local.replica_reads -= 1
+
+    @contextmanager
+    def acting_as(self, user_id):
+        # Asocia las operaciones del bloque a un usuario: tras escribir, sus lecturas
+        # siguen en el primario durante la ventana aunque lleguen por otro hilo
+        previous = getattr(self._local, 'user_id', None)
+        self._local.user_id = user_id
+        try:
+            yield
+        finally:
+            self._local.user_id = previous
+
+    def _record_write(self):
+        if not self.replicas:
+            return
+        now = time.monotonic()
+        self._local.last_write = now
+        user_id = getattr(self._local, 'user_id', None)
+        if user_id is None:
+            return
+        window = self.replica_config['read_your_writes_window']
+        with self._writes_lock:
+            self._recent_writes[user_id] = now
+            self._recent_writes.move_to_end(user_id)
+            # Las entradas están en orden de escritura: se olvidan las fuera de la ventana
+            while self._recent_writes and now - next(iter(self._recent_writes.values())) >= window:
+                self._recent_writes.popitem(last=False)
+
+    def _wrote_recently(self):
+        window = self.replica_config['read_your_writes_window']
+        now = time.monotonic()
+        if now - getattr(self._local, 'last_write', float('-inf')) < window:
             return True
+        user_id = getattr(self._local, 'user_id', None)
+        if user_id is None:
+            return False
+        with self._writes_lock:
+            written = self._recent_writes.get(user_id)
+        return written is not None and now - written < window
+
+    def _route_read(self):
+        # Réplica para la lectura en curso o None para leer del primario
+        if not self.replicas or not getattr(self._local, 'replica_reads', 0):
+            return None
+        if self.in_transaction() or getattr(self._local, 'session', None) is not None:
+            return None
+        if self._wrote_recently():
+            self._count_route('pinned_reads')
+            return None
+        return self._pick_replica()
+
+    def _pick_replica(self, exclude=()):
+        config = self.replica_config
+        now = time.monotonic()
+        candidates = []
+        for replica in self.replicas:
+            if replica in exclude or not replica.available(now):
+                continue
+            max_lag = config['max_lag_seconds']
+            if max_lag is not None:
+                # Solo un hilo mide cada réplica; los demás usan la última medición
+                if (now - replica.lag_checked_at >= config['lag_check_interval']
+                        and replica.lag_lock.acquire(blocking=False)):
+                    try:
+                        replica.measure_lag(config['retry_after'])
+                    finally:
+                        replica.lag_lock.release()
+                if not replica.available(now) or (replica.lag is not None and replica.lag > max_lag):
+                    continue
+            candidates.append(replica)
+        if not candidates:
+            return None
+        if config['balance'] == 'least_latency':
+            # Las que aún no tienen medición van primero para obtenerla
+            return min(candidates, key=lambda replica: -1.0 if replica.latency is None else replica.latency)
+        return candidates[next(self._round_robin) % len(candidates)]
+
+    def _read(self, read):
+        # Ejecuta read(connection, cursor) en la réplica elegida. Si la réplica falla
+        # se repite en otra y, en último término, en el primario.
+        replica = self._route_read()
+        tried = []
+        while replica is not None:
+            start = time.perf_counter()
+            try:
+                with replica.session() as (connection, cursor):
+                    result = read(connection, cursor)
+            except FAILOVER_ERRORS as e:
+                # Un pool agotado no es una réplica caída: solo se prueba en otra
+                if not isinstance(e, PoolError):
+                    replica.mark_down(self.replica_config['retry_after'], e)
+                self._count_route('failovers')
+                tried.append(replica)
+                replica = self._pick_replica(tried)
+                continue
+            replica.record_read(time.perf_counter() - start)
+            self._count_route('replica_reads')
+            return result
+        if self.replicas:
+            self._count_route('primary_reads')
+        with self.session() as (connection, cursor):
+            return read(connection, cursor)
+
+    def _count_route(self, key):
+        with self._routing_lock:
+            self._routing_stats[key] += 1
+
+    def replica_stats(self):
+        if not self.replicas:
+            return None
+        with self._routing_lock:
+            stats = dict(self._routing_stats)
+        return dict(stats, replicas=[replica.stats() for replica in self.replicas])
+
+    def pool_stats(self):
+        return self.pool.stats() if self.pool else None
+
+    def statement_cache_stats(self):
+        with self._statement_lock:
+            caches = list(self._statement_caches.values())
+        hits = sum(cache.hits for cache in caches)
+        misses = sum(cache.misses for cache in caches)
+        return {
+            'connections': len(caches),
+            'statements': sum(len(cache) for cache in caches),
+            'hits': hits,
+            'prepares': misses,
+            'evictions': sum(cache.evictions for cache in caches),
+            'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+    def _execute(self, connection, cursor, query, params):
+        # Las sentencias con parámetros usan una sentencia preparada de la caché de la
+        # conexión cuando está activa: el servidor las analiza una sola vez por conexión.
+        # Devuelve el cursor con el resultado.
+        if not (self.statement_cache_size and params):
+            cursor.execute(query, params or ())
+            return cursor
+        with self._statement_lock:
+            statements = self._statement_caches.get(connection)
+            if statements is None:
+                statements = StatementCache(connection, self.statement_cache_size)
+                self._statement_caches[connection] = statements
+        query, prepared = statements.get(query)
+        try:
+            prepared.execute(query, tuple(params))
+        except Error:
+            statements.discard(query)
+            raise
+        return prepared
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache else None
+
+    def query_stats(self, by='query'):
+        return self.instrumentation.snapshot(by) if self.instrumentation else None
+
+    def execute_query(self, query, params=None):
+        instrumentation = self.instrumentation
+        start = time.perf_counter() if instrumentation else 0.0
+        try:
+            with self.session() as (connection, cursor):
+                try:
+                    used = self._execute(connection, cursor, query, params)
+                    if not self.in_transaction():
+                        connection.commit()
+                except Error:
+                    if not self.in_transaction():
+                        connection.rollback()
+                    raise
+                self._local.last_insert_id = used.lastrowid
+                self._local.last_row_count = used.rowcount
+                self._record_write()
+                if instrumentation:
+                    instrumentation.observe(query, params, start, row_count=used.rowcount)
+                logger.debug("Consulta ejecutada exitosamente: %s filas", used.rowcount)
+                return True
+        except Error as e:
+            if instrumentation:
+                instrumentation.observe(query, params, start, error=e)
+            logger.error("Error al ejecutar la consulta: %s", e)
+            if self.in_transaction():
+                raise
+            return False
+
+    def execute_many(self, query, params_list):
+        # Ejecuta la sentencia para todas las filas en un único commit.
+        # Para INSERT ... VALUES el conector la reescribe como inserción multi-fila.
+        instrumentation = self.instrumentation
+        start = time.perf_counter() if instrumentation else 0.0
+        try:
+            with self.session() as (connection, cursor):
+                try:
+                    cursor.executemany(query, params_list)
+                    if not self.in_transaction():
+                        connection.commit()
+                except Error:
+                    if not self.in_transaction():
+                        connection.rollback()
+                    raise
+                self._local.last_insert_id = cursor.lastrowid
+                self._record_write()
+                if instrumentation:
+                    instrumentation.observe(query, None, start, row_count=cursor.rowcount)
+                return True
         except Error as e:
-            print(f"Error al ejecutar la consulta: {e}")
-            self.connection.rollback()
+            if instrumentation:
+                instrumentation.observe(query, None, start, error=e)
+            logger.error("Error al ejecutar la consulta masiva: %s", e)
+            if self.in_transaction():
+                raise
             return False
 
     def fetch_all(self, query, params=None):
+        instrumentation = self.instrumentation
+        start = time.perf_counter() if instrumentation else 0.0
         try:
-            self.cursor.execute(query, params or ())
-            return self.cursor.fetchall()
+            rows = self._read(lambda connection, cursor:
+                              self._execute(connection, cursor, query, params).fetchall())
         except Error as e:
-            print(f"Error al obtener datos: {e}")
+            if instrumentation:
+                instrumentation.observe(query, params, start, error=e)
+            logger.error("Error al obtener datos: %s", e)
             return []
+        if instrumentation:
+            instrumentation.observe(query, params, start, rows=rows)
+        return rows
 
     def fetch_one(self, query, params=None):
+        instrumentation = self.instrumentation
+        start = time.perf_counter() if instrumentation else 0.0
         try:
-            self.cursor.execute(query, params or ())
-            return self.cursor.fetchone()
+            row = self._read(lambda connection, cursor:
+                             self._fetch_first(self._execute(connection, cursor, query, params), cursor))
         except Error as e:
-            print(f"Error al obtener datos: {e}")
+            if instrumentation:
+                instrumentation.observe(query, params, start, error=e)
+            logger.error("Error al obtener datos: %s", e)
             return None
+        if instrumentation:
+            instrumentation.observe(query, params, start, rows=[row] if row else [])
+        return row
+
+    @staticmethod
+    def _fetch_first(used, cursor):
+        if used is cursor:
+            return cursor.fetchone()
+        # Los cursores preparados no tienen buffer: hay que leer todo el resultado
+        rows = used.fetchall()
+        return rows[0] if rows else None
+
+    def iter_query(self, query, params=None, batch_size=None, strict=False):
+        # Recorre el resultado con un cursor sin buffer y fetchmany: las filas llegan
+        # del servidor a medida que se consumen y la memoria se mantiene constante.
+        # El origen (réplica o primario) se decide al llamar, no al empezar a recorrer.
+        # Un error a mitad del recorrido se registra y termina el generador; con
+        # strict=True se propaga, para quien no puede aceptar un resultado truncado.
+        return self._iter_query(self._route_read(), query, params, batch_size, strict)
+
+    def _iter_query(self, replica, query, params, batch_size, strict=False):
+        # El cursor ocupa la conexión hasta agotarse, por eso se usa una dedicada
+        # (prestada del pool o abierta solo para este recorrido)
+        batch_size = batch_size or STREAM_BATCH_SIZE
+        exhausted = False
+        pool, config = (replica.pool, replica.config) if replica else (self.pool, self.config)
+        try:
+            connection = pool.acquire() if pool else mysql.connector.connect(**config)
+        except Error as e:
+            if replica is None:
+                logger.error("Error al obtener datos: %s", e)
+                if strict:
+                    raise
+                return
+            # Réplica inalcanzable: el recorrido se hace en el primario
+            if not isinstance(e, PoolError):
+                replica.mark_down(self.replica_config['retry_after'], e)
+            self._count_route('failovers')
+            yield from self._iter_query(None, query, params, batch_size, strict)
+            return
+
+        # Para las métricas solo cuenta el tiempo esperando al servidor, no el de quien
+        # consume las filas
+        instrumentation = self.instrumentation
+        db_time = 0.0
+        row_count = 0
+        try:
+            cursor = connection.cursor(dictionary=True, buffered=False)
+            try:
+                start = time.perf_counter()
+                cursor.execute(query, params or ())
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    db_time += time.perf_counter() - start
+                    if not rows:
+                        break
+                    row_count += len(rows)
+                    yield from rows
+                    start = time.perf_counter()
+                exhausted = True
+            finally:
+                if exhausted:
+                    cursor.close()
+            if instrumentation:
+                instrumentation.observe(query, params, time.perf_counter() - db_time, row_count=row_count)
+        except Error as e:
+            if instrumentation:
+                instrumentation.observe(query, params, time.perf_counter() - db_time, error=e)
+            logger.error("Error al obtener datos: %s", e)
+            if strict:
+                raise
+        finally:
+            # Si el recorrido se abandonó a medias quedan filas pendientes en el
+            # socket: es más barato cerrar la conexión que leerlas todas
+            if pool and exhausted:
+                pool.release(connection)
+            elif pool:
+                pool.discard(connection)
+            else:
+                connection.close()
 
     def get_last_insert_id(self):
-        return self.cursor.lastrowid
+        return getattr(self._local, 'last_insert_id', None)
+
+    def get_last_row_count(self):
+        # Filas afectadas por la última execute_query de este hilo
+        return getattr(self._local, 'last_row_count', None)
+
+def encode_cursor(created_at, row_id):
+    # Cursor opaco de paginación con la clave (created_at, id) de la última fila
+    raw = json.dumps([created_at.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Cursor de paginación inválido: {cursor!r}") from e
+
+@lru_cache(maxsize=256)
+def build_update_query(table, columns):
+    # columns: tupla ordenada de columnas ya validadas. Cada conjunto de campos produce
+    # siempre el mismo objeto str, así que la caché de sentencias preparadas lo reutiliza.
+    set_clause = ", ".join(f"{column} = %s" for column in columns)
+    return f"UPDATE {table} SET {set_clause} WHERE id = %s"
+
+@lru_cache(maxsize=256)
+def build_bulk_update_query(table, columns, row_count):
+    # Actualiza row_count filas en una sentencia cruzando la tabla con una tabla derivada
+    # de valores: (id, columnas...) por fila, en ese orden
+    first = "SELECT %s AS id, " + ", ".join(f"%s AS {column}" for column in columns)
+    rest = "SELECT " + ", ".join(["%s"] * (len(columns) + 1))
+    derived = " UNION ALL ".join([first] + [rest] * (row_count - 1))
+    set_clause = ", ".join(f"t.{column} = v.{column}" for column in columns)
+    return f"UPDATE {table} t JOIN ({derived}) v ON t.id = v.id SET {set_clause}"
+
+def pending_changes(allowed_columns, changes, snapshot=None):
+    # Valida las columnas contra la lista blanca y descarta las que no cambian respecto
+    # a la foto previa de la fila. Devuelve (columnas ordenadas, cambios).
+    unknown = set(changes) - allowed_columns
+    if unknown:
+        raise ValueError(f"Columnas no actualizables: {', '.join(sorted(unknown))}")
+    if snapshot is not None:
+        changes = {column: value for column, value in changes.items()
+                   if column not in snapshot or snapshot[column] != value}
+    return tuple(sorted(changes)), changes
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+def replica_read(method):
+    # Marca un método de lectura de un modelo como apto para réplicas: sus consultas
+    # (también las de las cachés y precargas que haga) pueden ir a una réplica
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.db.replica_reads():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def _copy_rows(value):
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return [dict(row) if isinstance(row, dict) else row for row in value]
+    return value
 
 class BaseModel:
+    # Distribuidor de notificaciones (notifications.Broker); sin él no se publica nada
+    broker = None
+
     def __init__(self, db_manager):
         self.db = db_manager
 
+    def _bulk_insert(self, query, rows, chunk_size=None):
+        # Inserta por bloques y devuelve los ids generados en el orden de entrada.
+        # Una inserción multi-fila recibe ids consecutivos a partir de LAST_INSERT_ID()
+        # (innodb_autoinc_lock_mode 0/1, o 2 con inserciones simples).
+        chunk_size = chunk_size or BULK_CHUNK_SIZE
+        ids = []
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            if not self.db.execute_many(query, chunk):
+                models_logger.warning("Inserción masiva interrumpida: %d de %d filas confirmadas", len(ids), len(rows))
+                return None
+            first_id = self.db.get_last_insert_id()
+            ids.extend(range(first_id, first_id + len(chunk)))
+        return ids
+
+    def _cached(self, key, loader):
+        # Lectura a través de la caché: si no está, se consulta y se guarda.
+        # Se devuelven copias para que quien llama no altere lo almacenado.
+        cache = self.db.cache
+        if cache is None:
+            return loader()
+        value = cache.get(key)
+        if value is MISS:
+            value = loader()
+            if value is None:
+                return None
+            cache.set(key, value)
+        return _copy_rows(value)
+
+    def _cached_many(self, key_prefix, ids, loader, default):
+        # Versión por lotes de _cached: busca cada id en la caché y resuelve todos los
+        # que falten con una sola llamada a loader(ids) -> {id: valor}.
+        # default() da el valor de los ids sin filas.
+        ids = list(dict.fromkeys(ids))
+        cache = self.db.cache
+        result = {}
+        missing = ids
+        if cache is not None:
+            missing = []
+            for item_id in ids:
+                value = cache.get(f"{key_prefix}:{item_id}")
+                if value is MISS:
+                    missing.append(item_id)
+                else:
+                    result[item_id] = _copy_rows(value)
+        if missing:
+            loaded = loader(missing)
+            for item_id in missing:
+                value = loaded.get(item_id)
+                if value is None:
+                    value = default()
+                if cache is not None:
+                    cache.set(f"{key_prefix}:{item_id}", value)
+                result[item_id] = _copy_rows(value)
+        return result
+
+    def _notify(self, user_ids, event):
+        # Publica el evento a cada usuario cuando se confirme la transacción en curso,
+        # para que quien lo reciba ya pueda leer los datos nuevos
+        broker = self.broker
+        if broker is None:
+            return
+        def publish():
+            for user_id in dict.fromkeys(user_ids):
+                try:
+                    broker.publish(user_id, event)
+                except Exception as e:
+                    models_logger.exception("Error al publicar la notificación: %s", e)
+        self.db.after_commit(publish)
+
+    def _group_by(self, rows, key):
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(row[key], []).append(row)
+        return grouped
+
+    def _invalidate(self, *keys):
+        # Se borra ya y otra vez al confirmar, para descartar lo que otro hilo haya
+        # cacheado leyendo los datos previos mientras la transacción seguía abierta
+        cache = self.db.cache
+        if cache is None or not keys:
+            return
+        cache.delete(*keys)
+        if self.db.in_transaction():
+            self.db.after_commit(lambda: cache.delete(*keys))
+
+    def _update_row(self, table, allowed_columns, row_id, changes, snapshot=None):
+        # UPDATE de una fila con columnas en lista blanca; sin cambios no se consulta
+        columns, changes = pending_changes(allowed_columns, changes, snapshot)
+        if not columns:
+            return True
+        params = [changes[column] for column in columns]
+        params.append(row_id)
+        return self.db.execute_query(build_update_query(table, columns), params)
+
+    def _fetch_keyset(self, query, params, alias, limit=None, after=None):
+        # Ordena por (created_at, id) descendente. Sin limit devuelve la lista completa;
+        # con limit devuelve (filas, siguiente_cursor) leyendo solo el rango del índice
+        # posterior al cursor, así que el coste no crece con la profundidad de la página.
+        params = tuple(params)
+        order_by = f" ORDER BY {alias}.created_at DESC, {alias}.id DESC"
+        if limit is None:
+            return self.db.fetch_all(query + order_by, params)
+
+        if after:
+            created_at, last_id = decode_cursor(after)
+            query += (f" AND ({alias}.created_at < %s"
+                      f" OR ({alias}.created_at = %s AND {alias}.id < %s))")
+            params += (created_at, created_at, last_id)
+        # Se pide una fila extra para saber si existe una página siguiente
+        rows = self.db.fetch_all(query + order_by + " LIMIT %s", params + (limit + 1,))
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+        return rows, next_cursor
+
     def to_dict(self):
         # Convierte el objeto a un diccionario
         return {key: value for key, value in self.__dict__.items() 
                 if not key.startswith('_') and key != 'db'}
 
 class UserModel(BaseModel):
-    def __init__(self, db_manager):
+    # Columnas que update_user puede modificar
+    UPDATABLE_COLUMNS = frozenset({
+        'email', 'name', 'phone', 'user_type', 'location_lat', 'location_lng',
+        'address', 'bio', 'verified',
+    })
+
+    # Sustituye el hash solo si sigue siendo el que se verificó
+    REHASH_QUERY = "UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s"
+
+    def __init__(self, db_manager, password_hasher=None):
         super().__init__(db_manager)
+        # Servicio de hash (passwords.PasswordHasher); por defecto el compartido del proceso
+        self.password_hasher = password_hasher or default_hasher()
 
     def create_user(self, email, password, name, phone, user_type, 
                    location_lat=None, location_lng=None, address=None, bio=None):
-        # Generar hash de la contraseña
-        password_hash = self._hash_password(password)
+        # Generar hash de la contraseña (lanza HashingBusyError si el servicio está saturado)
+        password_hash = self.password_hasher.hash(password)
         
         query = """
         INSERT INTO users (email, password_hash, name, phone, user_type, 
@@ -100,31 +1148,47 @@ class UserModel(BaseModel):
 
     def get_user_by_id(self, user_id):
         query = "SELECT * FROM users WHERE id = %s"
-        return self.db.fetch_one(query, (user_id,))
+        return self._cached(f"user:{user_id}", lambda: self.db.fetch_one(query, (user_id,)))
+
+    def get_user_names_many(self, user_ids):
+        # {user_id: nombre} con caché por usuario; los que no existen quedan en None
+        def load(missing):
+            query = f"SELECT id, name FROM users WHERE id IN ({_placeholders(missing)})"
+            return {row['id']: row['name'] for row in self.db.fetch_all(query, tuple(missing))}
+        return self._cached_many('user_name', user_ids, load, lambda: None)
 
     def get_user_by_email(self, email):
         query = "SELECT * FROM users WHERE email = %s"
         return self.db.fetch_one(query, (email,))
 
-    def update_user(self, user_id, **kwargs):
-        # Construir la consulta dinámicamente basada en los campos proporcionados
-        set_clause = ", ".join([f"{key} = %s" for key in kwargs.keys()])
-        query = f"UPDATE users SET {set_clause} WHERE id = %s"
-        
-        # Añadir el user_id al final de los parámetros
-        params = list(kwargs.values())
-        params.append(user_id)
-        
-        return self.db.execute_query(query, params)
+    def update_user(self, user_id, snapshot=None, **kwargs):
+        # snapshot: fila leída previamente; los campos que no cambian no se envían
+        if self._update_row('users', self.UPDATABLE_COLUMNS, user_id, kwargs, snapshot):
+            # Los productos cacheados con el nombre/teléfono del vendedor caducan por TTL
+            self._invalidate(f"user:{user_id}", f"user_name:{user_id}")
+            return True
+        return False
 
     def verify_password(self, stored_hash, provided_password):
         # Verificar si la contraseña proporcionada coincide con el hash almacenado
-        provided_hash = self._hash_password(provided_password)
-        return stored_hash == provided_hash
+        return self.password_hasher.verify(stored_hash, provided_password)
 
-    def _hash_password(self, password):
-        # Método simple para hashear contraseñas (en producción usar bcrypt)
-        return hashlib.sha256(password.encode()).hexdigest()
+    def authenticate(self, email, password):
+        # Devuelve el usuario si la contraseña es correcta. Los hashes antiguos (SHA-256)
+        # o con otros parámetros de coste se sustituyen por uno actual.
+        user = self.get_user_by_email(email)
+        if user is None or not self.password_hasher.verify(user['password_hash'], password):
+            return None
+        if self.password_hasher.needs_rehash(user['password_hash']):
+            try:
+                new_hash = self.password_hasher.hash(password)
+            except HashingBusyError:
+                # El inicio de sesión ya es válido: se reintenta en el siguiente
+                return user
+            if self.db.execute_query(self.REHASH_QUERY, (new_hash, user['id'], user['password_hash'])):
+                user['password_hash'] = new_hash
+                self._invalidate(f"user:{user['id']}")
+        return user
 
     def get_all_farmers(self):
         query = "SELECT * FROM users WHERE user_type = 'agricultor'"
@@ -134,24 +1198,74 @@ class UserModel(BaseModel):
         query = "SELECT * FROM users WHERE user_type = 'consumidor'"
         return self.db.fetch_all(query)
 
+    def iter_all_farmers(self, batch_size=None):
+        query = "SELECT * FROM users WHERE user_type = 'agricultor'"
+        return self.db.iter_query(query, batch_size=batch_size)
+
+    def iter_all_consumers(self, batch_size=None):
+        query = "SELECT * FROM users WHERE user_type = 'consumidor'"
+        return self.db.iter_query(query, batch_size=batch_size)
+
 class ProductModel(BaseModel):
-    def __init__(self, db_manager):
+    # Filtros admitidos por search(): nombre -> (condición SQL, comprobación sobre la fila)
+    SEARCH_FILTERS = {
+        'category': ("p.category = %s", lambda row, v: row['category'] == v),
+        'min_price': ("p.price >= %s", lambda row, v: row['price'] >= v),
+        'max_price': ("p.price <= %s", lambda row, v: row['price'] <= v),
+        'is_organic': ("p.is_organic = %s", lambda row, v: bool(row['is_organic']) == bool(v)),
+        'status': ("p.status = %s", lambda row, v: row['status'] == v),
+    }
+
+    # Columnas que update_product y update_products_bulk pueden modificar
+    UPDATABLE_COLUMNS = frozenset({
+        'name', 'description', 'price', 'quantity', 'unit', 'category', 'harvest_date',
+        'is_organic', 'location_lat', 'location_lng', 'status',
+    })
+
+    def __init__(self, db_manager, geo_index=None, search_index=None):
         super().__init__(db_manager)
+        # Índice en memoria opcional para búsquedas por cercanía en regiones muy consultadas
+        self.geo_index = geo_index
+        # Índice invertido opcional que sustituye al FULLTEXT de MySQL (pruebas, desarrollo)
+        self.search_index = search_index
 
-    def create_product(self, user_id, name, description, price, quantity, unit, 
-                      category=None, harvest_date=None, is_organic=False):
-        query = """
+    INSERT_PRODUCT_QUERY = """
         INSERT INTO products (user_id, name, description, price, quantity, unit, 
-                            category, harvest_date, is_organic)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                            category, harvest_date, is_organic, location_lat, location_lng)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         """
+
+    INSERT_IMAGE_QUERY = """
+        INSERT INTO product_images (product_id, image_url, is_primary)
+        VALUES (%s, %s, %s)
+        """
+
+    def create_product(self, user_id, name, description, price, quantity, unit, 
+                      category=None, harvest_date=None, is_organic=False,
+                      location_lat=None, location_lng=None):
         params = (user_id, name, description, price, quantity, unit, 
-                 category, harvest_date, is_organic)
+                 category, harvest_date, is_organic, location_lat, location_lng)
         
-        if self.db.execute_query(query, params):
-            return self.db.get_last_insert_id()
+        if self.db.execute_query(self.INSERT_PRODUCT_QUERY, params):
+            product_id = self.db.get_last_insert_id()
+            self._refresh_indexes([product_id])
+            return product_id
         return None
 
+    def create_products_bulk(self, products, chunk_size=None):
+        # products: lista de diccionarios con los mismos campos que create_product
+        rows = [
+            (p['user_id'], p['name'], p.get('description'), p['price'], p['quantity'], p['unit'],
+             p.get('category'), p.get('harvest_date'), p.get('is_organic', False),
+             p.get('location_lat'), p.get('location_lng'))
+            for p in products
+        ]
+        ids = self._bulk_insert(self.INSERT_PRODUCT_QUERY, rows, chunk_size)
+        if ids:
+            self._refresh_indexes(ids)
+        return ids
+
+    @replica_read
     def get_product_by_id(self, product_id):
         query = """
         SELECT p.*, u.name as seller_name, u.phone as seller_phone 
@@ -159,13 +1273,24 @@ class ProductModel(BaseModel):
         JOIN users u ON p.user_id = u.id
         WHERE p.id = %s
         """
-        return self.db.fetch_one(query, (product_id,))
+        return self._cached(f"product:{product_id}", lambda: self.db.fetch_one(query, (product_id,)))
 
     def get_products_by_user(self, user_id):
         query = "SELECT * FROM products WHERE user_id = %s"
         return self.db.fetch_all(query, (user_id,))
 
-    def get_available_products(self):
+    @replica_read
+    def get_available_products(self, limit=None, after=None, include=()):
+        query = """
+        SELECT p.*, u.name as seller_name 
+        FROM products p
+        JOIN users u ON p.user_id = u.id
+        WHERE p.status = 'available'
+        """
+        return self._with_includes(self._fetch_keyset(query, (), 'p', limit, after), include)
+
+    @replica_read
+    def iter_available_products(self, batch_size=None):
         query = """
         SELECT p.*, u.name as seller_name 
         FROM products p
@@ -173,9 +1298,10 @@ class ProductModel(BaseModel):
         WHERE p.status = 'available'
         ORDER BY p.created_at DESC
         """
-        return self.db.fetch_all(query)
+        return self.db.iter_query(query, batch_size=batch_size)
 
-    def get_products_by_category(self, category):
+    @replica_read
+    def iter_products_by_category(self, category, batch_size=None):
         query = """
         SELECT p.*, u.name as seller_name 
         FROM products p
@@ -183,59 +1309,407 @@ class ProductModel(BaseModel):
         WHERE p.category = %s AND p.status = 'available'
         ORDER BY p.created_at DESC
         """
-        return self.db.fetch_all(query, (category,))
+        return self.db.iter_query(query, (category,), batch_size=batch_size)
 
-    def update_product(self, product_id, **kwargs):
-        # Construir la consulta dinámicamente basada en los campos proporcionados
-        set_clause = ", ".join([f"{key} = %s" for key in kwargs.keys()])
-        query = f"UPDATE products SET {set_clause} WHERE id = %s"
-        
-        # Añadir el product_id al final de los parámetros
-        params = list(kwargs.values())
-        params.append(product_id)
-        
-        return self.db.execute_query(query, params)
+    @replica_read
+    def get_products_by_category(self, category, limit=None, after=None, include=()):
+        query = """
+        SELECT p.*, u.name as seller_name 
+        FROM products p
+        JOIN users u ON p.user_id = u.id
+        WHERE p.category = %s AND p.status = 'available'
+        """
+        return self._with_includes(self._fetch_keyset(query, (category,), 'p', limit, after), include)
+
+    def _with_includes(self, result, include):
+        # Precarga datos relacionados con una consulta por relación, no una por producto:
+        # 'images' -> row['images'], 'rating' -> row['average_rating']
+        unknown = set(include) - {'images', 'rating'}
+        if unknown:
+            raise ValueError(f"Relaciones no soportadas en include: {', '.join(sorted(unknown))}")
+        rows = result[0] if isinstance(result, tuple) else result
+        if not include or not rows:
+            return result
+        ids = [row['id'] for row in rows]
+        if 'images' in include:
+            images = self.get_product_images_many(ids)
+            for row in rows:
+                row['images'] = images[row['id']]
+        if 'rating' in include:
+            ratings = ReviewModel(self.db).get_average_ratings_many(ids)
+            for row in rows:
+                row['average_rating'] = ratings[row['id']]
+        return result
+
+    def update_product(self, product_id, snapshot=None, **kwargs):
+        # snapshot: fila leída previamente; los campos que no cambian no se envían
+        columns, changes = pending_changes(self.UPDATABLE_COLUMNS, kwargs, snapshot)
+        if not columns:
+            return True
+        if self._update_row('products', self.UPDATABLE_COLUMNS, product_id, changes):
+            self._invalidate(f"product:{product_id}")
+            self._refresh_indexes([product_id])
+            return True
+        return False
+
+    def update_products_bulk(self, updates, snapshots=None, chunk_size=None):
+        # updates: [(product_id, {columna: valor}), ...]; snapshots: {product_id: fila previa}.
+        # Las filas se agrupan por conjunto de columnas y cada bloque es una sola sentencia;
+        # todo se confirma en una transacción.
+        chunk_size = chunk_size or BULK_CHUNK_SIZE
+        snapshots = snapshots or {}
+        groups = {}
+        for product_id, changes in updates:
+            columns, changes = pending_changes(self.UPDATABLE_COLUMNS, changes, snapshots.get(product_id))
+            if columns:
+                groups.setdefault(columns, []).append((product_id, changes))
+        if not groups:
+            return True
+
+        try:
+            with self.db.transaction():
+                for columns, rows in groups.items():
+                    for start in range(0, len(rows), chunk_size):
+                        chunk = rows[start:start + chunk_size]
+                        params = []
+                        for product_id, changes in chunk:
+                            params.append(product_id)
+                            params.extend(changes[column] for column in columns)
+                        self.db.execute_query(build_bulk_update_query('products', columns, len(chunk)), params)
+        except Error:
+            if self.db.in_transaction():
+                raise
+            return False
+
+        product_ids = [product_id for rows in groups.values() for product_id, _ in rows]
+        self._invalidate(*[f"product:{product_id}" for product_id in product_ids])
+        self._refresh_indexes(product_ids)
+        return True
 
     def delete_product(self, product_id):
         query = "DELETE FROM products WHERE id = %s"
-        return self.db.execute_query(query, (product_id,))
+        if self.db.execute_query(query, (product_id,)):
+            self._invalidate(f"product:{product_id}", f"product_images:{product_id}")
+            self.db.after_commit(lambda: self._discard_from_indexes(product_id))
+            return True
+        return False
 
-    def add_product_image(self, product_id, image_url, is_primary=False):
+    # Solo afecta la fila si queda cantidad suficiente (rowcount 0 = sin existencias)
+    RESERVE_STOCK_QUERY = """
+        UPDATE products
+        SET quantity = quantity - %s,
+            status = IF(quantity = 0, 'reserved', status)
+        WHERE id = %s AND status = 'available' AND quantity >= %s
+        """
+
+    # Siempre devuelve la cantidad: aunque otro pedido completado haya marcado el
+    # producto como 'sold', con existencias vuelve a 'available'
+    RELEASE_STOCK_QUERY = """
+        UPDATE products
+        SET quantity = quantity + %s,
+            status = IF(quantity > 0 AND status IN ('reserved', 'sold'), 'available', status)
+        WHERE id = %s
+        """
+
+    def reserve_stock(self, items):
+        # items: [{'product_id': ..., 'quantity': ...}]. Descuenta el inventario de forma
+        # atómica: cada UPDATE solo afecta la fila si queda cantidad suficiente, y las filas
+        # se bloquean en orden de id para que dos compras concurrentes no se interbloqueen.
+        # Un producto que se queda sin existencias pasa a 'reserved'.
+        # Lanza InsufficientStockError y revierte todo si algún producto no alcanza.
+        requested = self._stock_by_product(items)
+        with self.db.transaction():
+            for product_id, quantity in requested:
+                self.db.execute_query(self.RESERVE_STOCK_QUERY, (quantity, product_id, quantity))
+                if self.db.get_last_row_count() != 1:
+                    raise InsufficientStockError(product_id, quantity)
+        self._after_stock_change([product_id for product_id, _ in requested])
+        return True
+
+    def release_stock(self, items):
+        # Devuelve al inventario lo reservado (pedido cancelado); lo agotado vuelve a 'available'
+        requested = self._stock_by_product(items)
+        with self.db.transaction():
+            for product_id, quantity in requested:
+                self.db.execute_query(self.RELEASE_STOCK_QUERY, (quantity, product_id))
+        self._after_stock_change([product_id for product_id, _ in requested])
+        return True
+
+    # Los productos agotados cuya venta se completó pasan de 'reserved' a 'sold', salvo
+    # que otro pedido abierto aún tenga unidades reservadas (si se cancela, vuelven).
+    # {placeholders} se sustituye por un %s por producto.
+    MARK_SOLD_OUT_QUERY = """
+        UPDATE products SET status = 'sold'
+        WHERE id IN ({placeholders}) AND status = 'reserved' AND quantity = 0
+          AND NOT EXISTS (
+              SELECT 1 FROM order_details od
+              JOIN orders o ON o.id = od.order_id
+              WHERE od.product_id = products.id AND o.stock_reserved
+                AND o.status NOT IN ('cancelled', 'delivered'))
+        """
+
+    def mark_sold_out(self, product_ids):
+        product_ids = sorted(set(product_ids))
+        if not product_ids:
+            return True
+        query = self.MARK_SOLD_OUT_QUERY.format(placeholders=_placeholders(product_ids))
+        if self.db.execute_query(query, tuple(product_ids)):
+            self._after_stock_change(product_ids)
+            return True
+        return False
+
+    @staticmethod
+    def _stock_by_product(items):
+        # Cantidades agregadas por producto y ordenadas por id (orden fijo de bloqueo)
+        totals = {}
+        for item in items:
+            quantity = Decimal(str(item['quantity']))
+            if quantity <= 0:
+                raise ValueError(f"Cantidad inválida para el producto {item['product_id']}: {quantity}")
+            totals[item['product_id']] = totals.get(item['product_id'], Decimal(0)) + quantity
+        return sorted(totals.items())
+
+    def _after_stock_change(self, product_ids):
+        self._invalidate(*[f"product:{product_id}" for product_id in product_ids])
+        self._refresh_indexes(product_ids)
+
+    @replica_read
+    def find_nearby(self, lat, lng, radius_km, limit=20, category=None):
+        # Productos disponibles a menos de radius_km, del más cercano al más lejano,
+        # con la distancia real (haversine) en 'distance_km'
+        if self.geo_index is not None and self.geo_index.covers(lat, lng, radius_km):
+            def matches(row):
+                return row['status'] == 'available' and (category is None or row['category'] == category)
+            return [dict(row, distance_km=distance)
+                    for distance, _, row in self.geo_index.nearby(lat, lng, radius_km, limit, matches)]
+
+        # El rectángulo envolvente filtra por rango sobre idx_products_location y
+        # la distancia exacta solo se calcula para esas filas
+        min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
         query = """
-        INSERT INTO product_images (product_id, image_url, is_primary)
-        VALUES (%s, %s, %s)
+        SELECT p.*, u.name as seller_name,
+               2 * 6371.0088 * ASIN(SQRT(
+                   POW(SIN(RADIANS(p.location_lat - %s) / 2), 2) +
+                   COS(RADIANS(%s)) * COS(RADIANS(p.location_lat)) *
+                   POW(SIN(RADIANS(p.location_lng - %s) / 2), 2)
+               )) as distance_km
+        FROM products p
+        JOIN users u ON p.user_id = u.id
+        WHERE p.location_lat BETWEEN %s AND %s
+          AND p.location_lng BETWEEN %s AND %s
+          AND p.status = 'available'
+        """
+        params = [lat, lat, lng, min_lat, max_lat, min_lng, max_lng]
+        if category is not None:
+            query += " AND p.category = %s"
+            params.append(category)
+        query += " HAVING distance_km <= %s ORDER BY distance_km ASC, p.id ASC LIMIT %s"
+        params.extend([radius_km, limit])
+        return self.db.fetch_all(query, params)
+
+    def build_geo_index(self, lat=None, lng=None, radius_km=None, cell_km=1.0):
+        # Carga en memoria los productos disponibles con ubicación, de toda la tabla o
+        # solo de la región alrededor de (lat, lng), y lo usa en find_nearby
+        query = """
+        SELECT p.*, u.name as seller_name
+        FROM products p
+        JOIN users u ON p.user_id = u.id
+        WHERE p.status = 'available'
+          AND p.location_lat IS NOT NULL AND p.location_lng IS NOT NULL
+        """
+        params = ()
+        bounds = None
+        if radius_km is not None:
+            bounds = bounding_box(lat, lng, radius_km)
+            query += " AND p.location_lat BETWEEN %s AND %s AND p.location_lng BETWEEN %s AND %s"
+            params = bounds
+
+        index = GridIndex(cell_km=cell_km, bounds=bounds)
+        for row in self.db.iter_query(query, params):
+            index.insert(row['id'], row['location_lat'], row['location_lng'], row)
+        self.geo_index = index
+        return index
+
+    @replica_read
+    def search(self, text, filters=None, limit=20):
+        # Búsqueda por texto en nombre, descripción y categoría, ordenada por relevancia
+        # ('relevance'). Por defecto solo devuelve productos disponibles.
+        filters = dict({'status': 'available'}, **(filters or {}))
+        unknown = set(filters) - set(self.SEARCH_FILTERS)
+        if unknown:
+            raise ValueError(f"Filtros de búsqueda no soportados: {', '.join(sorted(unknown))}")
+        filters = {key: value for key, value in filters.items() if value is not None}
+
+        if self.search_index is not None:
+            def matches(row):
+                return all(self.SEARCH_FILTERS[key][1](row, value) for key, value in filters.items())
+            return [dict(row, relevance=score)
+                    for score, _, row in self.search_index.search(text, limit, matches)]
+
+        boolean_query = build_boolean_query(text)
+        if not boolean_query:
+            return []
+        query = """
+        SELECT p.*, u.name as seller_name,
+               MATCH(p.name, p.description, p.category) AGAINST (%s IN BOOLEAN MODE) as relevance
+        FROM products p
+        JOIN users u ON p.user_id = u.id
+        WHERE MATCH(p.name, p.description, p.category) AGAINST (%s IN BOOLEAN MODE)
+        """
+        params = [boolean_query, boolean_query]
+        for key, value in filters.items():
+            query += f" AND {self.SEARCH_FILTERS[key][0]}"
+            params.append(value)
+        query += " ORDER BY relevance DESC, p.id DESC LIMIT %s"
+        params.append(limit)
+        return self.db.fetch_all(query, params)
+
+    def build_search_index(self):
+        # Carga todos los productos en un índice invertido en memoria y lo usa en search()
+        query = """
+        SELECT p.*, u.name as seller_name
+        FROM products p
+        JOIN users u ON p.user_id = u.id
+        """
+        index = InvertedIndex()
+        for row in self.db.iter_query(query):
+            index.add(row['id'], self._search_text(row), row)
+        self.search_index = index
+        return index
+
+    def _discard_from_indexes(self, product_id):
+        if self.geo_index is not None:
+            self.geo_index.discard(product_id)
+        if self.search_index is not None:
+            self.search_index.remove(product_id)
+
+    @staticmethod
+    def _search_text(row):
+        return ' '.join(row.get(field) or '' for field in ('name', 'description', 'category'))
+
+    def _refresh_indexes(self, product_ids):
+        # Mantiene los índices en memoria alineados con las escrituras. Dentro de una
+        # transacción espera al commit: si se revierte, los índices no cambian.
+        if (self.geo_index is None and self.search_index is None) or not product_ids:
+            return
+        product_ids = list(product_ids)
+        self.db.after_commit(lambda: self._reindex(product_ids))
+
+    def _reindex(self, product_ids):
+        placeholders = ", ".join(["%s"] * len(product_ids))
+        query = f"""
+        SELECT p.*, u.name as seller_name
+        FROM products p
+        JOIN users u ON p.user_id = u.id
+        WHERE p.id IN ({placeholders})
         """
-        return self.db.execute_query(query, (product_id, image_url, is_primary))
+        rows = {row['id']: row for row in self.db.fetch_all(query, tuple(product_ids))}
+        for product_id in product_ids:
+            row = rows.get(product_id)
+            if self.search_index is not None:
+                if row:
+                    self.search_index.add(product_id, self._search_text(row), row)
+                else:
+                    self.search_index.remove(product_id)
+            if self.geo_index is None:
+                continue
+            if (row and row['status'] == 'available'
+                    and row['location_lat'] is not None and row['location_lng'] is not None
+                    and self.geo_index.contains_point(row['location_lat'], row['location_lng'])):
+                self.geo_index.insert(product_id, row['location_lat'], row['location_lng'], row)
+            else:
+                self.geo_index.discard(product_id)
+
+    def add_product_image(self, product_id, image_url, is_primary=False):
+        if self.db.execute_query(self.INSERT_IMAGE_QUERY, (product_id, image_url, is_primary)):
+            self._invalidate(f"product_images:{product_id}")
+            return True
+        return False
+
+    def add_product_images_bulk(self, images, chunk_size=None):
+        # images: lista de diccionarios con product_id, image_url y opcionalmente is_primary
+        rows = [(i['product_id'], i['image_url'], i.get('is_primary', False)) for i in images]
+        ids = self._bulk_insert(self.INSERT_IMAGE_QUERY, rows, chunk_size)
+        self._invalidate(*{f"product_images:{row[0]}" for row in rows})
+        return ids
 
+    @replica_read
     def get_product_images(self, product_id):
         query = "SELECT * FROM product_images WHERE product_id = %s"
-        return self.db.fetch_all(query, (product_id,))
+        return self._cached(f"product_images:{product_id}", lambda: self.db.fetch_all(query, (product_id,)))
+
+    @replica_read
+    def get_product_images_many(self, product_ids):
+        # {product_id: [imágenes]} para todos los ids con una sola consulta
+        def load(ids):
+            query = f"SELECT * FROM product_images WHERE product_id IN ({_placeholders(ids)})"
+            return self._group_by(self.db.fetch_all(query, tuple(ids)), 'product_id')
+        return self._cached_many("product_images", product_ids, load, list)
 
 class OrderModel(BaseModel):
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, product_model=None, broker=None):
         super().__init__(db_manager)
+        # Modelo de productos para reservar inventario (el de la app, con sus índices)
+        self.product_model = product_model or ProductModel(db_manager)
+        self.broker = broker
 
-    def create_order(self, buyer_id, seller_id, total_amount, delivery_address, 
-                    delivery_date, payment_method='cash', notes=None):
-        query = """
+    INSERT_ORDER_QUERY = """
         INSERT INTO orders (buyer_id, seller_id, total_amount, delivery_address, 
-                          delivery_date, payment_method, notes)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
+                          delivery_date, payment_method, notes, stock_reserved)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
         """
+
+    def create_order(self, buyer_id, seller_id, total_amount, delivery_address, 
+                    delivery_date, payment_method='cash', notes=None, stock_reserved=False):
+        # stock_reserved: el inventario del pedido ya se descontó (place_order); solo
+        # entonces la cancelación lo devuelve
         params = (buyer_id, seller_id, total_amount, delivery_address, 
-                 delivery_date, payment_method, notes)
+                 delivery_date, payment_method, notes, stock_reserved)
         
-        if self.db.execute_query(query, params):
+        if self.db.execute_query(self.INSERT_ORDER_QUERY, params):
             return self.db.get_last_insert_id()
         return None
 
-    def add_order_detail(self, order_id, product_id, quantity, unit_price):
-        subtotal = Decimal(quantity) * Decimal(unit_price)
-        query = """
+    def place_order(self, buyer_id, seller_id, items, delivery_address, delivery_date,
+                    payment_method='cash', notes=None):
+        # items: lista de diccionarios con product_id, quantity y unit_price.
+        # Reserva el inventario e inserta el pedido y todos sus detalles en una sola
+        # transacción (un INSERT del pedido, un INSERT multi-fila de detalles y un commit).
+        # Lanza InsufficientStockError si algún producto no tiene existencias suficientes.
+        if not items:
+            raise ValueError("El pedido debe incluir al menos un producto")
+        total_amount = sum(self._subtotal(i['quantity'], i['unit_price']) for i in items)
+
+        with self.db.transaction():
+            self.product_model.reserve_stock(items)
+            order_id = self.create_order(buyer_id, seller_id, total_amount, delivery_address,
+                                         delivery_date, payment_method, notes, stock_reserved=True)
+            details = [dict(item, order_id=order_id) for item in items]
+            self.add_order_details_bulk(details, chunk_size=len(details))
+        return order_id
+
+    INSERT_DETAIL_QUERY = """
         INSERT INTO order_details (order_id, product_id, quantity, unit_price, subtotal)
         VALUES (%s, %s, %s, %s, %s)
         """
-        return self.db.execute_query(query, (order_id, product_id, quantity, unit_price, subtotal))
+
+    @staticmethod
+    def _subtotal(quantity, unit_price):
+        return Decimal(str(quantity)) * Decimal(str(unit_price))
+
+    def add_order_detail(self, order_id, product_id, quantity, unit_price):
+        subtotal = self._subtotal(quantity, unit_price)
+        return self.db.execute_query(self.INSERT_DETAIL_QUERY,
+                                     (order_id, product_id, quantity, unit_price, subtotal))
+
+    def add_order_details_bulk(self, details, chunk_size=None):
+        # details: lista de diccionarios con order_id, product_id, quantity y unit_price
+        rows = [
+            (d['order_id'], d['product_id'], d['quantity'], d['unit_price'],
+             self._subtotal(d['quantity'], d['unit_price']))
+            for d in details
+        ]
+        return self._bulk_insert(self.INSERT_DETAIL_QUERY, rows, chunk_size)
 
     def get_order_by_id(self, order_id):
         query = """
@@ -258,29 +1732,104 @@ class OrderModel(BaseModel):
         """
         return self.db.fetch_all(query, (order_id,))
 
-    def get_orders_by_buyer(self, buyer_id):
+    def get_order_details_many(self, order_ids):
+        # {order_id: [detalles]} para todos los pedidos con una sola consulta
+        order_ids = list(dict.fromkeys(order_ids))
+        if not order_ids:
+            return {}
+        query = f"""
+        SELECT od.*, p.name as product_name, p.unit
+        FROM order_details od
+        JOIN products p ON od.product_id = p.id
+        WHERE od.order_id IN ({_placeholders(order_ids)})
+        """
+        details = self._group_by(self.db.fetch_all(query, tuple(order_ids)), 'order_id')
+        return {order_id: details.get(order_id, []) for order_id in order_ids}
+
+    def _with_includes(self, result, include):
+        # 'details' -> row['details'] con una única consulta para toda la página
+        unknown = set(include) - {'details'}
+        if unknown:
+            raise ValueError(f"Relaciones no soportadas en include: {', '.join(sorted(unknown))}")
+        rows = result[0] if isinstance(result, tuple) else result
+        if 'details' in include and rows:
+            details = self.get_order_details_many([row['id'] for row in rows])
+            for row in rows:
+                row['details'] = details[row['id']]
+        return result
+
+    def get_orders_by_buyer(self, buyer_id, limit=None, after=None, include=()):
         query = """
         SELECT o.*, u.name as seller_name
         FROM orders o
         JOIN users u ON o.seller_id = u.id
         WHERE o.buyer_id = %s
-        ORDER BY o.created_at DESC
         """
-        return self.db.fetch_all(query, (buyer_id,))
+        return self._with_includes(self._fetch_keyset(query, (buyer_id,), 'o', limit, after), include)
 
-    def get_orders_by_seller(self, seller_id):
+    def get_orders_by_seller(self, seller_id, limit=None, after=None, include=()):
         query = """
         SELECT o.*, u.name as buyer_name
         FROM orders o
         JOIN users u ON o.buyer_id = u.id
         WHERE o.seller_id = %s
-        ORDER BY o.created_at DESC
         """
-        return self.db.fetch_all(query, (seller_id,))
+        return self._with_includes(self._fetch_keyset(query, (seller_id,), 'o', limit, after), include)
 
     def update_order_status(self, order_id, status):
         query = "UPDATE orders SET status = %s WHERE id = %s"
-        return self.db.execute_query(query, (status, order_id))
+        if not self.db.execute_query(query, (status, order_id)):
+            return False
+        self._notify_status(order_id, status)
+        return True
+
+    def _notify_status(self, order_id, status):
+        # Comprador y vendedor reciben el cambio de estado
+        if self.broker is None:
+            return
+        order = self.db.fetch_one("SELECT buyer_id, seller_id FROM orders WHERE id = %s", (order_id,))
+        if order:
+            self._notify([order['buyer_id'], order['seller_id']],
+                         {'type': 'order_status', 'order_id': order_id, 'status': status})
+
+    CANCEL_ORDER_QUERY = """
+        UPDATE orders SET status = 'cancelled'
+        WHERE id = %s AND status NOT IN ('cancelled', 'delivered')
+        """
+
+    COMPLETE_ORDER_QUERY = """
+        UPDATE orders SET status = 'delivered'
+        WHERE id = %s AND status NOT IN ('cancelled', 'delivered')
+        """
+
+    STOCK_RESERVED_QUERY = "SELECT stock_reserved FROM orders WHERE id = %s"
+
+    def cancel_order(self, order_id):
+        # Cancela el pedido y devuelve su inventario; solo la primera cancelación libera
+        # stock, y solo si el pedido lo había reservado (los creados con create_order y
+        # add_order_detail no descuentan inventario)
+        with self.db.transaction():
+            self.db.execute_query(self.CANCEL_ORDER_QUERY, (order_id,))
+            if self.db.get_last_row_count() != 1:
+                return False
+            self._notify_status(order_id, 'cancelled')
+            order = self.db.fetch_one(self.STOCK_RESERVED_QUERY, (order_id,))
+            details = self.get_order_details(order_id) if order and order['stock_reserved'] else None
+            if details:
+                self.product_model.release_stock(details)
+        return True
+
+    def complete_order(self, order_id):
+        # Marca el pedido como entregado y los productos que agotó como vendidos. Un
+        # pedido cancelado (inventario ya devuelto) o ya entregado no cambia.
+        with self.db.transaction():
+            self.db.execute_query(self.COMPLETE_ORDER_QUERY, (order_id,))
+            if self.db.get_last_row_count() != 1:
+                return False
+            self._notify_status(order_id, 'delivered')
+            details = self.get_order_details(order_id)
+            self.product_model.mark_sold_out([detail['product_id'] for detail in details])
+        return True
 
     def update_payment_status(self, order_id, payment_status):
         query = "UPDATE orders SET payment_status = %s WHERE id = %s"
@@ -290,26 +1839,132 @@ class ReviewModel(BaseModel):
     def __init__(self, db_manager):
         super().__init__(db_manager)
 
+    # Suma una reseña a los agregados del producto y del usuario calificado
+    UPSERT_SUMMARY_QUERY = """
+        INSERT INTO rating_summaries (subject_type, subject_id, review_count, rating_sum,
+                                      rating_1, rating_2, rating_3, rating_4, rating_5)
+        VALUES (%s, %s, 1, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            review_count = review_count + 1,
+            rating_sum = rating_sum + VALUES(rating_sum),
+            rating_1 = rating_1 + VALUES(rating_1),
+            rating_2 = rating_2 + VALUES(rating_2),
+            rating_3 = rating_3 + VALUES(rating_3),
+            rating_4 = rating_4 + VALUES(rating_4),
+            rating_5 = rating_5 + VALUES(rating_5)
+        """
+
     def create_review(self, reviewer_id, reviewed_id, rating, comment, order_id=None, product_id=None):
+        if rating not in (1, 2, 3, 4, 5):
+            raise ValueError(f"La calificación debe ser un entero entre 1 y 5: {rating!r}")
         query = """
         INSERT INTO reviews (reviewer_id, reviewed_id, rating, comment, order_id, product_id)
         VALUES (%s, %s, %s, %s, %s, %s)
         """
         params = (reviewer_id, reviewed_id, rating, comment, order_id, product_id)
-        
-        if self.db.execute_query(query, params):
-            return self.db.get_last_insert_id()
-        return None
 
-    def get_reviews_by_product(self, product_id):
+        histogram = tuple(int(rating == score) for score in range(1, 6))
+        summaries = [('user', reviewed_id, rating) + histogram]
+        if product_id is not None:
+            summaries.append(('product', product_id, rating) + histogram)
+
+        # La reseña y sus agregados se confirman juntos
+        try:
+            with self.db.transaction():
+                self.db.execute_query(query, params)
+                review_id = self.db.get_last_insert_id()
+                self.db.execute_many(self.UPSERT_SUMMARY_QUERY, summaries)
+        except Error:
+            if self.db.in_transaction():
+                raise
+            return None
+        self._invalidate(*[f"rating:{subject}:{subject_id}" for subject, subject_id, *_ in summaries])
+        return review_id
+
+    @replica_read
+    def get_rating_summary_by_product(self, product_id):
+        return self._get_rating_summary('product', product_id)
+
+    def get_rating_summary_by_user(self, user_id):
+        return self._get_rating_summary('user', user_id)
+
+    def _get_rating_summary(self, subject_type, subject_id):
+        # Promedio, total y distribución 1-5 leídos de una sola fila por clave primaria
+        query = """
+        SELECT review_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5
+        FROM rating_summaries
+        WHERE subject_type = %s AND subject_id = %s
+        """
+        def load():
+            row = self.db.fetch_one(query, (subject_type, subject_id))
+            return self._summary_from_row(row)
+        return self._cached(f"rating:{subject_type}:{subject_id}", load)
+
+    @replica_read
+    def get_rating_summaries_many(self, product_ids):
+        # {product_id: resumen} para varios productos con una sola consulta
+        def load(ids):
+            query = f"""
+            SELECT subject_id, review_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5
+            FROM rating_summaries
+            WHERE subject_type = 'product' AND subject_id IN ({_placeholders(ids)})
+            """
+            rows = self.db.fetch_all(query, tuple(ids))
+            return {row['subject_id']: self._summary_from_row(row) for row in rows}
+        return self._cached_many("rating:product", product_ids, load,
+                                 lambda: self._summary_from_row(None))
+
+    def get_average_ratings_many(self, product_ids):
+        summaries = self.get_rating_summaries_many(product_ids)
+        return {product_id: summary['average'] or 0 for product_id, summary in summaries.items()}
+
+    @staticmethod
+    def _summary_from_row(row):
+        count = row['review_count'] if row else 0
+        average = None
+        if count:
+            average = (Decimal(row['rating_sum']) / Decimal(count)).quantize(Decimal('0.0001'))
+        return {
+            'average': average,
+            'count': count,
+            'distribution': {score: (row[f'rating_{score}'] if row else 0) for score in range(1, 6)},
+        }
+
+    def rebuild_rating_summaries(self):
+        # Recalcula todos los agregados desde la tabla reviews (carga inicial o reparación)
+        aggregate = """
+            COUNT(*), SUM(rating),
+            SUM(rating = 1), SUM(rating = 2), SUM(rating = 3), SUM(rating = 4), SUM(rating = 5)
+        """
+        insert = """
+        INSERT INTO rating_summaries (subject_type, subject_id, review_count, rating_sum,
+                                      rating_1, rating_2, rating_3, rating_4, rating_5)
+        """
+        with self.db.transaction():
+            self.db.execute_query("DELETE FROM rating_summaries")
+            self.db.execute_query(insert + f"""
+            SELECT 'product', product_id, {aggregate}
+            FROM reviews WHERE product_id IS NOT NULL GROUP BY product_id
+            """)
+            self.db.execute_query(insert + f"""
+            SELECT 'user', reviewed_id, {aggregate}
+            FROM reviews GROUP BY reviewed_id
+            """)
+        # Las claves afectadas no se pueden enumerar sin recorrer la tabla
+        if self.db.cache is not None:
+            self.db.cache.clear()
+        models_logger.info("Agregados de calificaciones reconstruidos")
+        return True
+
+    @replica_read
+    def get_reviews_by_product(self, product_id, limit=None, after=None):
         query = """
         SELECT r.*, u.name as reviewer_name
         FROM reviews r
         JOIN users u ON r.reviewer_id = u.id
         WHERE r.product_id = %s
-        ORDER BY r.created_at DESC
         """
-        return self.db.fetch_all(query, (product_id,))
+        return self._fetch_keyset(query, (product_id,), 'r', limit, after)
 
     def get_reviews_by_user(self, user_id):
         query = """
@@ -322,77 +1977,383 @@ class ReviewModel(BaseModel):
         return self.db.fetch_all(query, (user_id,))
 
     def get_average_rating_by_product(self, product_id):
+        return self.get_rating_summary_by_product(product_id)['average'] or 0
+
+    def get_average_rating_by_user(self, user_id):
+        return self.get_rating_summary_by_user(user_id)['average'] or 0
+
+class RollupModel(BaseModel):
+    # Agregados diarios de ventas materializados en seller_daily_sales y
+    # product_daily_sales. refresh_daily_rollups recalcula solo los días con pedidos
+    # creados o modificados desde la última marca guardada en rollup_watermarks.
+    WATERMARK_NAME = 'daily_sales'
+
+    # Margen con el que se relee antes de la marca: un pedido confirmado tarde puede
+    # llevar un updated_at anterior al de la última recarga
+    REFRESH_OVERLAP = datetime.timedelta(minutes=5)
+
+    PRODUCT_DAY_QUERY = """
+        SELECT od.product_id, o.seller_id, COUNT(DISTINCT o.id) AS orders,
+               SUM(od.quantity) AS units, SUM(od.subtotal) AS revenue
+        FROM orders o
+        JOIN order_details od ON od.order_id = o.id
+        WHERE o.created_at >= %s AND o.created_at < %s AND o.status <> 'cancelled'
+        GROUP BY od.product_id, o.seller_id
+        """
+
+    SELLER_DAY_QUERY = """
+        SELECT o.seller_id, COUNT(*) AS orders, SUM(o.total_amount) AS revenue,
+               COALESCE(MAX(u.units), 0) AS units
+        FROM orders o
+        LEFT JOIN (
+            SELECT o2.seller_id, SUM(od.quantity) AS units
+            FROM orders o2
+            JOIN order_details od ON od.order_id = o2.id
+            WHERE o2.created_at >= %s AND o2.created_at < %s AND o2.status <> 'cancelled'
+            GROUP BY o2.seller_id
+        ) u ON u.seller_id = o.seller_id
+        WHERE o.created_at >= %s AND o.created_at < %s AND o.status <> 'cancelled'
+        GROUP BY o.seller_id
+        """
+
+    @staticmethod
+    def _day_bounds(day):
+        start = datetime.datetime.combine(day, datetime.time.min)
+        return start, start + datetime.timedelta(days=1)
+
+    def _get_watermark(self):
+        row = self.db.fetch_one("SELECT watermark FROM rollup_watermarks WHERE name = %s",
+                                (self.WATERMARK_NAME,))
+        return row['watermark'] if row else None
+
+    def _touched_days(self, since):
+        if since is None:
+            rows = self.db.fetch_all("SELECT DISTINCT DATE(created_at) AS day FROM orders")
+        else:
+            rows = self.db.fetch_all("""
+            SELECT DISTINCT DATE(created_at) AS day FROM orders WHERE updated_at >= %s
+            """, (since - self.REFRESH_OVERLAP,))
+        return sorted(row['day'] for row in rows)
+
+    def refresh_day(self, day):
+        # Sustituye los agregados de un día por los calculados desde pedidos y detalles
+        start, end = self._day_bounds(day)
+        with self.db.transaction():
+            self.db.execute_query("DELETE FROM product_daily_sales WHERE day = %s", (day,))
+            self.db.execute_query(f"""
+            INSERT INTO product_daily_sales (day, product_id, seller_id, orders, units, revenue)
+            SELECT %s, t.* FROM ({self.PRODUCT_DAY_QUERY}) t
+            """, (day, start, end))
+            self.db.execute_query("DELETE FROM seller_daily_sales WHERE day = %s", (day,))
+            self.db.execute_query(f"""
+            INSERT INTO seller_daily_sales (day, seller_id, orders, revenue, units)
+            SELECT %s, t.* FROM ({self.SELLER_DAY_QUERY}) t
+            """, (day, start, end, start, end))
+
+    def refresh_daily_rollups(self, full=False):
+        # La nueva marca se toma antes de leer los días tocados: lo que cambie durante
+        # la recarga entra en la siguiente. Cada día se recalcula en su propia
+        # transacción y la marca se guarda al final, así una recarga interrumpida se
+        # repite entera sin dejar días a medias.
+        row = self.db.fetch_one("SELECT MAX(updated_at) AS watermark FROM orders")
+        new_watermark = row['watermark'] if row else None
+        if new_watermark is None:
+            models_logger.info("Sin pedidos: no hay agregados que recalcular")
+            return []
+        days = self._touched_days(None if full else self._get_watermark())
+        for day in days:
+            self.refresh_day(day)
+        self.db.execute_query("""
+        INSERT INTO rollup_watermarks (name, watermark) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE watermark = VALUES(watermark)
+        """, (self.WATERMARK_NAME, new_watermark))
+        models_logger.info("Agregados diarios recalculados: %d días (marca %s)", len(days), new_watermark)
+        return days
+
+    def check_daily_rollups(self, sample_days=7):
+        # Compara los agregados guardados con los recalculados desde las tablas de
+        # origen en una muestra aleatoria de días. Devuelve las diferencias encontradas.
+        rows = self.db.fetch_all("""
+        SELECT day FROM (
+            SELECT DISTINCT day FROM seller_daily_sales
+            UNION
+            SELECT DISTINCT DATE(created_at) FROM orders WHERE status <> 'cancelled'
+        ) days
+        ORDER BY RAND() LIMIT %s
+        """, (sample_days,))
+        mismatches = []
+        for day in sorted(row['day'] for row in rows):
+            start, end = self._day_bounds(day)
+            expected = {row['seller_id']: row
+                        for row in self.db.fetch_all(self.SELLER_DAY_QUERY, (start, end, start, end))}
+            stored = {row['seller_id']: row
+                      for row in self.db.fetch_all("SELECT * FROM seller_daily_sales WHERE day = %s", (day,))}
+            for seller_id in sorted(set(expected) | set(stored)):
+                raw, rollup = expected.get(seller_id), stored.get(seller_id)
+                for field in ('orders', 'revenue', 'units'):
+                    raw_value = raw[field] if raw else 0
+                    rollup_value = rollup[field] if rollup else 0
+                    if raw_value != rollup_value:
+                        mismatches.append({'day': day, 'seller_id': seller_id, 'field': field,
+                                           'raw': raw_value, 'rollup': rollup_value})
+        models_logger.info("Días revisados: %d; diferencias: %d", len(rows), len(mismatches))
+        return mismatches
+
+    def get_seller_daily_sales(self, seller_id, start_day, end_day):
         query = """
-        SELECT AVG(rating) as average_rating
-        FROM reviews
-        WHERE product_id = %s
+        SELECT day, orders, revenue, units
+        FROM seller_daily_sales
+        WHERE seller_id = %s AND day BETWEEN %s AND %s
+        ORDER BY day
         """
-        result = self.db.fetch_one(query, (product_id,))
-        return result['average_rating'] if result and result['average_rating'] else 0
+        return self.db.fetch_all(query, (seller_id, start_day, end_day))
 
-    def get_average_rating_by_user(self, user_id):
+    def get_seller_monthly_sales(self, seller_id, start_day, end_day):
+        # Resumen mensual leído de los agregados diarios, no de los pedidos
         query = """
-        SELECT AVG(rating) as average_rating
-        FROM reviews
-        WHERE reviewed_id = %s
+        SELECT YEAR(day) AS year, MONTH(day) AS month, SUM(orders) AS total_sales,
+               SUM(revenue) AS total_revenue, SUM(units) AS total_units
+        FROM seller_daily_sales
+        WHERE seller_id = %s AND day BETWEEN %s AND %s
+        GROUP BY YEAR(day), MONTH(day)
+        ORDER BY year DESC, month DESC
         """
-        result = self.db.fetch_one(query, (user_id,))
-        return result['average_rating'] if result and result['average_rating'] else 0
+        return self.db.fetch_all(query, (seller_id, start_day, end_day))
+
+    def get_product_daily_sales(self, product_id, start_day, end_day):
+        query = """
+        SELECT day, orders, units, revenue
+        FROM product_daily_sales
+        WHERE product_id = %s AND day BETWEEN %s AND %s
+        ORDER BY day
+        """
+        return self.db.fetch_all(query, (product_id, start_day, end_day))
 
 class MessageModel(BaseModel):
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, user_model=None, broker=None):
         super().__init__(db_manager)
+        # Modelo de usuarios para resolver nombres desde su caché
+        self.user_model = user_model or UserModel(db_manager)
+        self.broker = broker
 
-    def send_message(self, sender_id, receiver_id, message):
-        query = """
+    # Caracteres del último mensaje que se guardan como vista previa en la bandeja
+    PREVIEW_LENGTH = 100
+
+    INSERT_MESSAGE_QUERY = """
         INSERT INTO messages (sender_id, receiver_id, message)
         VALUES (%s, %s, %s)
         """
-        params = (sender_id, receiver_id, message)
-        
-        if self.db.execute_query(query, params):
-            return self.db.get_last_insert_id()
-        return None
 
-    def get_conversation(self, user1_id, user2_id):
-        query = """
-        SELECT m.*, 
-               s.name as sender_name,
-               r.name as receiver_name
+    # Estado desnormalizado de cada conversación, una fila por participante: último
+    # mensaje y no leídos de ese participante. Las asignaciones se evalúan en orden, por
+    # eso last_message_id va al final (las anteriores comparan con el valor previo) y
+    # un envío que confirma después con un id menor no retrocede el último mensaje.
+    UPSERT_CONVERSATION_QUERY = """
+        INSERT INTO user_conversations (user_id, other_user_id, last_message_id, last_sender_id,
+                                        last_message_preview, last_message_at, unread_count)
+        VALUES (%s, %s, %s, %s, %s, NOW(), %s), (%s, %s, %s, %s, %s, NOW(), %s)
+        ON DUPLICATE KEY UPDATE
+            last_sender_id = IF(VALUES(last_message_id) > last_message_id, VALUES(last_sender_id), last_sender_id),
+            last_message_preview = IF(VALUES(last_message_id) > last_message_id,
+                                      VALUES(last_message_preview), last_message_preview),
+            last_message_at = IF(VALUES(last_message_id) > last_message_id, VALUES(last_message_at), last_message_at),
+            unread_count = unread_count + VALUES(unread_count),
+            last_message_id = GREATEST(last_message_id, VALUES(last_message_id))
+        """
+
+    MARK_READ_QUERY = "UPDATE messages SET is_read = TRUE WHERE id = %s AND is_read = FALSE"
+
+    MARK_CONVERSATION_READ_QUERY = """
+        UPDATE messages SET is_read = TRUE
+        WHERE receiver_id = %s AND sender_id = %s AND is_read = FALSE
+        """
+
+    DECREMENT_UNREAD_QUERY = """
+        UPDATE user_conversations
+        SET unread_count = GREATEST(unread_count - %s, 0)
+        WHERE user_id = %s AND other_user_id = %s
+        """
+
+    DECREMENT_MESSAGE_UNREAD_QUERY = """
+        UPDATE user_conversations uc
+        JOIN messages m ON uc.user_id = m.receiver_id AND uc.other_user_id = m.sender_id
+        SET uc.unread_count = GREATEST(uc.unread_count - 1, 0)
+        WHERE m.id = %s
+        """
+
+    CONVERSATION_QUERY = """
+        SELECT m.*
         FROM messages m
-        JOIN users s ON m.sender_id = s.id
-        JOIN users r ON m.receiver_id = r.id
-        WHERE (m.sender_id = %s AND m.receiver_id = %s)
-           OR (m.sender_id = %s AND m.receiver_id = %s)
-        ORDER BY m.created_at ASC
+        WHERE m.user_low = %s AND m.user_high = %s
         """
-        params = (user1_id, user2_id, user2_id, user1_id)
-        return self.db.fetch_all(query, params)
+
+    INBOX_QUERY = """
+        SELECT uc.other_user_id, u.name AS other_user_name, uc.last_message_id, uc.last_sender_id,
+               uc.last_message_preview, uc.last_message_at, uc.unread_count
+        FROM user_conversations uc
+        JOIN users u ON u.id = uc.other_user_id
+        WHERE uc.user_id = %s
+        """
+
+    @classmethod
+    def _conversation_params(cls, sender_id, receiver_id, message_id, message):
+        # Filas de remitente (sin no leídos) y destinatario (+1), ordenadas por usuario
+        # para que dos envíos cruzados bloqueen en el mismo orden
+        preview = message[:cls.PREVIEW_LENGTH]
+        rows = sorted([(sender_id, receiver_id, message_id, sender_id, preview, 0),
+                       (receiver_id, sender_id, message_id, sender_id, preview, 1)])
+        return rows[0] + rows[1]
+
+    def send_message(self, sender_id, receiver_id, message):
+        # Inserta el mensaje y actualiza la bandeja de ambos participantes en una transacción
+        try:
+            with self.db.transaction():
+                self.db.execute_query(self.INSERT_MESSAGE_QUERY, (sender_id, receiver_id, message))
+                message_id = self.db.get_last_insert_id()
+                self.db.execute_query(self.UPSERT_CONVERSATION_QUERY,
+                                      self._conversation_params(sender_id, receiver_id, message_id, message))
+                # Al destinatario y a las otras sesiones del remitente
+                self._notify([receiver_id, sender_id], {
+                    'type': 'message', 'message_id': message_id, 'sender_id': sender_id,
+                    'receiver_id': receiver_id, 'preview': message[:self.PREVIEW_LENGTH],
+                })
+        except Error:
+            if self.db.in_transaction():
+                raise
+            return None
+        return message_id
+
+    @classmethod
+    def _conversation_query(cls, user1_id, user2_id, before, since_id, limit):
+        # Consulta sobre la clave canónica (user_low, user_high, id): los dos sentidos de
+        # la conversación son un único rango del índice, sin OR
+        if before is not None and since_id is not None:
+            raise ValueError("before y since_id no se pueden combinar")
+        query = cls.CONVERSATION_QUERY
+        params = tuple(sorted((user1_id, user2_id)))
+        if since_id is not None:
+            return query + " AND m.id > %s ORDER BY m.id ASC LIMIT %s", params + (since_id, limit), False
+        if before is not None:
+            query += " AND m.id < %s"
+            params += (before,)
+        return query + " ORDER BY m.id DESC LIMIT %s", params + (limit,), True
+
+    @staticmethod
+    def _with_names(rows, names):
+        for row in rows:
+            row['sender_name'] = names.get(row['sender_id'])
+            row['receiver_name'] = names.get(row['receiver_id'])
+        return rows
+
+    def get_conversation(self, user1_id, user2_id, before=None, since_id=None, limit=50):
+        # Mensajes entre dos usuarios en orden cronológico, de a limit:
+        # - sin argumentos, los últimos limit (la cola de la conversación)
+        # - before=id, los limit anteriores a ese mensaje (páginas hacia atrás)
+        # - since_id=id, los posteriores a ese mensaje (sondeo de lo nuevo)
+        query, params, newest_first = self._conversation_query(user1_id, user2_id, before, since_id, limit)
+        rows = self.db.fetch_all(query, params)
+        if newest_first:
+            rows.reverse()
+        return self._with_names(rows, self.user_model.get_user_names_many([user1_id, user2_id]))
 
     def mark_as_read(self, message_id):
-        query = "UPDATE messages SET is_read = TRUE WHERE id = %s"
-        return self.db.execute_query(query, (message_id,))
+        # Solo descuenta el no leído si este llamado fue el que marcó el mensaje
+        try:
+            with self.db.transaction():
+                self.db.execute_query(self.MARK_READ_QUERY, (message_id,))
+                if self.db.get_last_row_count() == 1:
+                    self.db.execute_query(self.DECREMENT_MESSAGE_UNREAD_QUERY, (message_id,))
+        except Error:
+            if self.db.in_transaction():
+                raise
+            return False
+        return True
+
+    def mark_conversation_read(self, user_id, other_user_id):
+        # Marca como leídos todos los mensajes de other_user_id a user_id. Se descuentan
+        # las filas realmente marcadas: un mensaje confirmado en paralelo que no alcanzó
+        # a marcarse sigue contando como no leído.
+        try:
+            with self.db.transaction():
+                self.db.execute_query(self.MARK_CONVERSATION_READ_QUERY, (user_id, other_user_id))
+                marked = self.db.get_last_row_count() or 0
+                if marked:
+                    self.db.execute_query(self.DECREMENT_UNREAD_QUERY, (marked, user_id, other_user_id))
+        except Error:
+            if self.db.in_transaction():
+                raise
+            return None
+        return marked
 
     def get_unread_messages_count(self, user_id):
         query = """
-        SELECT COUNT(*) as unread_count
-        FROM messages
-        WHERE receiver_id = %s AND is_read = FALSE
+        SELECT COALESCE(SUM(unread_count), 0) as unread_count
+        FROM user_conversations
+        WHERE user_id = %s
         """
         result = self.db.fetch_one(query, (user_id,))
-        return result['unread_count'] if result else 0
+        return int(result['unread_count']) if result else 0
+
+    def get_inbox(self, user_id, limit=20, after=None):
+        # Conversaciones del usuario, la más reciente primero, con el último mensaje y
+        # sus no leídos: un recorrido de rango de (user_id, last_message_id) sin tocar
+        # messages. Devuelve (filas, siguiente_cursor).
+        query = self.INBOX_QUERY
+        params = (user_id,)
+        if after:
+            _, last_message_id = decode_cursor(after)
+            query += " AND uc.last_message_id < %s"
+            params += (last_message_id,)
+        rows = self.db.fetch_all(query + " ORDER BY uc.last_message_id DESC LIMIT %s", params + (limit + 1,))
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['last_message_at'], rows[-1]['last_message_id'])
+        return rows, next_cursor
+
+    def rebuild_conversation_state(self):
+        # Recalcula la bandeja de todos los usuarios desde la tabla messages (carga
+        # inicial o reparación)
+        with self.db.transaction():
+            self.db.execute_query("DELETE FROM user_conversations")
+            self.db.execute_query("""
+            INSERT INTO user_conversations (user_id, other_user_id, last_message_id, unread_count)
+            SELECT user_id, other_user_id, MAX(id), SUM(unread)
+            FROM (
+                SELECT sender_id AS user_id, receiver_id AS other_user_id, id, 0 AS unread FROM messages
+                UNION ALL
+                SELECT receiver_id, sender_id, id, is_read = FALSE FROM messages
+            ) t
+            GROUP BY user_id, other_user_id
+            """)
+            self.db.execute_query(f"""
+            UPDATE user_conversations uc
+            JOIN messages m ON m.id = uc.last_message_id
+            SET uc.last_sender_id = m.sender_id,
+                uc.last_message_preview = LEFT(m.message, {self.PREVIEW_LENGTH}),
+                uc.last_message_at = m.created_at
+            """)
+        models_logger.info("Bandejas de conversaciones reconstruidas")
+        return True
 
 class CampoDigitalApp:
-    def __init__(self):
-        self.db_manager = DatabaseManager()
+    def __init__(self, pool_config=None, cache=None, statement_cache_size=STATEMENT_CACHE_SIZE,
+                 broker=None, instrumentation=None, replicas=None, replica_config=None,
+                 password_hasher=None):
+        self.db_manager = DatabaseManager(pool_config=pool_config, cache=cache,
+                                          statement_cache_size=statement_cache_size,
+                                          instrumentation=instrumentation,
+                                          replicas=replicas, replica_config=replica_config)
         self.db_manager.connect()
+        self.broker = broker
         
         # Inicializar modelos
-        self.user_model = UserModel(self.db_manager)
+        self.user_model = UserModel(self.db_manager, password_hasher)
         self.product_model = ProductModel(self.db_manager)
-        self.order_model = OrderModel(self.db_manager)
+        self.order_model = OrderModel(self.db_manager, self.product_model, broker)
         self.review_model = ReviewModel(self.db_manager)
-        self.message_model = MessageModel(self.db_manager)
+        self.message_model = MessageModel(self.db_manager, self.user_model, broker)
+        self.rollup_model = RollupModel(self.db_manager)
 
     def close(self):
         self.db_manager.disconnect()
@@ -467,38 +2428,25 @@ class CampoDigitalApp:
         
         print(f"Productos creados: Yuca (ID: {yuca_id}), Plátano (ID: {platano_id})")
         
-        # 4. Consumidor realiza un pedido
-        order_id = self.order_model.create_order(
-            buyer_id=consumer_id,
-            seller_id=farmer_id,
-            total_amount=22500.00,  # 5kg de yuca + 5kg de plátano
-            delivery_address="Calle 93 #11-30, Bogotá",
-            delivery_date=datetime.date.today() + datetime.timedelta(days=2),
-            payment_method="transfer",
-            notes="Por favor entregar en la mañana"
-        )
-        
-        # 5. Añadir detalles del pedido
-        self.order_model.add_order_detail(
-            order_id=order_id,
-            product_id=yuca_id,
-            quantity=5.00,
-            unit_price=2500.00
-        )
-        
-        self.order_model.add_order_detail(
-            order_id=order_id,
-            product_id=platano_id,
-            quantity=5.00,
-            unit_price=3000.00
-        )
+        # 4 a 6. Consumidor realiza el pedido con sus detalles, se confirma y se paga
+        # en una única transacción: o queda el pedido completo o no queda nada
+        with self.db_manager.transaction():
+            order_id = self.order_model.place_order(
+                buyer_id=consumer_id,
+                seller_id=farmer_id,
+                items=[
+                    {'product_id': yuca_id, 'quantity': 5.00, 'unit_price': 2500.00},
+                    {'product_id': platano_id, 'quantity': 5.00, 'unit_price': 3000.00},
+                ],
+                delivery_address="Calle 93 #11-30, Bogotá",
+                delivery_date=datetime.date.today() + datetime.timedelta(days=2),
+                payment_method="transfer",
+                notes="Por favor entregar en la mañana"
+            )
+            self.order_model.update_order_status(order_id, "confirmed")
+            self.order_model.update_payment_status(order_id, "completed")
         
         print(f"Pedido creado con ID: {order_id}")
-        
-        # 6. Actualizar estado del pedido
-        self.order_model.update_order_status(order_id, "confirmed")
-        self.order_model.update_payment_status(order_id, "completed")
-        
         print("Estado del pedido actualizado a 'confirmado' y pago 'completado'")
         
         # 7. Consumidor deja reseñas
@@ -556,9 +2504,45 @@ class CampoDigitalApp:
             print(f"- {detail['product_name']}: {detail['quantity']} {detail['unit']} x ${detail['unit_price']} = ${detail['subtotal']}")
 
 # Función principal para ejecutar la aplicación
-def main():
-    app = CampoDigitalApp()
+def parse_replica(spec):
+    # "host:puerto" o "host" -> configuración parcial de réplica (ver DatabaseManager)
+    host, _, port = spec.rpartition(':') if ':' in spec else (spec, '', '')
+    return {'host': host, 'port': int(port)} if port else {'host': host}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CampoDigital")
+    parser.add_argument('--replica', type=parse_replica, action='append', metavar='HOST[:PUERTO]',
+                        help="Réplica de lectura (repetible), p. ej. --replica localhost:3307")
+    parser.add_argument('--balance', choices=('round_robin', 'least_latency'), default='round_robin')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('demo', help="Ejecuta el flujo de compra de ejemplo (por defecto)")
+    commands.add_parser('rebuild-ratings', help="Recalcula los agregados de calificaciones")
+    commands.add_parser('rebuild-inbox', help="Recalcula las bandejas de conversaciones")
+    command = commands.add_parser('refresh-rollups', help="Recalcula los agregados diarios de ventas")
+    command.add_argument('--full', action='store_true', help="Recalcula todos los días, no solo los modificados")
+    command = commands.add_parser('check-rollups', help="Compara los agregados diarios con los pedidos")
+    command.add_argument('--sample-days', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    configure_logging(json_format=False)
+    app = CampoDigitalApp(replicas=args.replica, replica_config={'balance': args.balance})
     try:
+        if args.command == 'rebuild-ratings':
+            app.review_model.rebuild_rating_summaries()
+            return
+        if args.command == 'rebuild-inbox':
+            app.message_model.rebuild_conversation_state()
+            return
+        if args.command == 'refresh-rollups':
+            app.rollup_model.refresh_daily_rollups(full=args.full)
+            return
+        if args.command == 'check-rollups':
+            mismatches = app.rollup_model.check_daily_rollups(args.sample_days)
+            for mismatch in mismatches:
+                print(f"- {mismatch['day']} vendedor {mismatch['seller_id']} {mismatch['field']}: "
+                      f"pedidos={mismatch['raw']} agregado={mismatch['rollup']}")
+            return 1 if mismatches else 0
+
         # Ejecutar el ejemplo de flujo de compra
         app.purchase_flow_example()
         
@@ -567,9 +2551,13 @@ def main():
         available_products = app.product_model.get_available_products()
         for product in available_products:
             print(f"- {product['name']}: ${product['price']} por {product['unit']} (Vendedor: {product['seller_name']})")
+
+        replica_stats = app.db_manager.replica_stats()
+        if replica_stats:
+            print(f"\n--- Lecturas enrutadas ---\n{replica_stats}")
         
     finally:
         app.close()
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
@@ -0,0 +1,847 @@
+# CampoDigital - Capa de acceso a datos asíncrona (asyncio)
+# Mismos modelos y nombres de método que app.py, sobre un pool de conexiones aiomysql.
+# Con cache (cache.LRUCache; RedisCache bloquearía el bucle de eventos) las lecturas por
+# lotes (*_many y las precargas de include=) comparten claves con la capa síncrona; las
+# lecturas de una sola fila no se cachean.
+import asyncio
+import contextvars
+import logging
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+try:
+    import aiomysql
+    from pymysql.err import MySQLError
+except ImportError:
+    aiomysql = None
+
+    class MySQLError(Exception):
+        pass
+
+from app import (DB_CONFIG, POOL_CONFIG, BULK_CHUNK_SIZE, UserModel, ProductModel, OrderModel,
+                 ReviewModel, MessageModel, InsufficientStockError, build_update_query,
+                 decode_cursor, encode_cursor, pending_changes, _copy_rows, _placeholders)
+from cache import MISS
+from passwords import HashingBusyError, default_hasher
+
+logger = logging.getLogger('campodigital.db.async')
+
+
+class AsyncDatabaseManager:
+    def __init__(self, config=DB_CONFIG, pool_config=None, cache=None):
+        self.config = config
+        self.pool_config = dict(POOL_CONFIG, **(pool_config or {}))
+        self.pool = None
+        # Caché de lectura de las consultas por lotes (ver cabecera); None no cachea
+        self.cache = cache
+        # Sesión (conexión, cursor) y transacción de cada tarea
+        self._session = contextvars.ContextVar(f"session_{id(self)}", default=None)
+        self._transaction_depth = contextvars.ContextVar(f"transaction_{id(self)}", default=0)
+        self._last_insert_id = contextvars.ContextVar(f"last_insert_id_{id(self)}", default=None)
+        self._last_row_count = contextvars.ContextVar(f"last_row_count_{id(self)}", default=None)
+        self._after_commit = contextvars.ContextVar(f"after_commit_{id(self)}", default=None)
+        self._stats = {'checkouts': 0, 'timeouts': 0, 'wait_time_total': 0.0, 'wait_time_max': 0.0,
+                       'health_checks': 0}
+        # Momento en que cada conexión volvió al pool (ver health_check_after)
+        self._released_at = weakref.WeakKeyDictionary()
+
+    async def connect(self):
+        if aiomysql is None:
+            raise ImportError("AsyncDatabaseManager requiere el paquete 'aiomysql' (pip install aiomysql)")
+        config = dict(self.config)
+        # aiomysql usa 'db' donde mysql.connector usa 'database'
+        config['db'] = config.pop('database', None)
+        try:
+            self.pool = await aiomysql.create_pool(
+                minsize=self.pool_config['min_size'],
+                maxsize=self.pool_config['max_size'],
+                pool_recycle=self.pool_config['idle_timeout'] or -1,
+                autocommit=False,
+                **config
+            )
+            logger.info("Pool asíncrono de conexiones a MySQL inicializado")
+            return True
+        except MySQLError as e:
+            logger.error("Error al conectar a MySQL: %s", e)
+            return False
+
+    async def disconnect(self):
+        if self.pool:
+            self.pool.close()
+            await self.pool.wait_closed()
+            logger.info("Pool asíncrono de conexiones a MySQL cerrado")
+
+    @asynccontextmanager
+    async def session(self):
+        # Cada tarea recibe su propia conexión; las llamadas anidadas reutilizan la activa
+        current = self._session.get()
+        if current is not None:
+            yield current
+            return
+
+        start = time.monotonic()
+        try:
+            connection = await asyncio.wait_for(self.pool.acquire(),
+                                                self.pool_config['checkout_timeout'])
+        except asyncio.TimeoutError:
+            self._stats['timeouts'] += 1
+            raise MySQLError("Tiempo de espera agotado al obtener una conexión del pool")
+        try:
+            # Como en ConnectionPool: solo se comprueba la conexión si lleva un rato ociosa
+            released_at = self._released_at.get(connection)
+            if self.pool_config['health_check'] and (
+                    released_at is None
+                    or time.monotonic() - released_at >= self.pool_config['health_check_after']):
+                self._stats['health_checks'] += 1
+                await connection.ping(reconnect=True)
+            elapsed = time.monotonic() - start
+            self._stats['checkouts'] += 1
+            self._stats['wait_time_total'] += elapsed
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], elapsed)
+
+            cursor = await connection.cursor(aiomysql.DictCursor)
+            token = self._session.set((connection, cursor))
+            try:
+                yield connection, cursor
+            finally:
+                self._session.reset(token)
+                await cursor.close()
+                if connection.get_transaction_status():
+                    await connection.rollback()
+        finally:
+            self._released_at[connection] = time.monotonic()
+            self.pool.release(connection)
+
+    @asynccontextmanager
+    async def transaction(self):
+        # Igual que DatabaseManager.transaction(): un único commit y rollback ante errores
+        depth = self._transaction_depth.get()
+        if depth:
+            token = self._transaction_depth.set(depth + 1)
+            try:
+                yield self._session.get()
+            finally:
+                self._transaction_depth.reset(token)
+            return
+
+        async with self.session() as (connection, cursor):
+            token = self._transaction_depth.set(1)
+            callbacks_token = self._after_commit.set([])
+            try:
+                await connection.begin()
+                yield connection, cursor
+                await connection.commit()
+            except BaseException:
+                await connection.rollback()
+                raise
+            finally:
+                callbacks = self._after_commit.get()
+                self._after_commit.reset(callbacks_token)
+                self._transaction_depth.reset(token)
+            # Solo se llega aquí si el commit tuvo éxito
+            for callback in callbacks:
+                callback()
+
+    def in_transaction(self):
+        return self._transaction_depth.get() > 0
+
+    def after_commit(self, callback):
+        # Ejecuta callback cuando se confirme la transacción en curso (o ya, si no hay)
+        if self.in_transaction():
+            self._after_commit.get().append(callback)
+        else:
+            callback()
+
+    def pool_stats(self):
+        if not self.pool:
+            return None
+        checkouts = self._stats['checkouts']
+        in_use = self.pool.size - self.pool.freesize
+        return dict(self._stats,
+                    size=self.pool.size,
+                    idle=self.pool.freesize,
+                    in_use=in_use,
+                    max_size=self.pool.maxsize,
+                    utilization=in_use / self.pool.maxsize,
+                    avg_wait_ms=(self._stats['wait_time_total'] / checkouts * 1000) if checkouts else 0.0,
+                    max_wait_ms=self._stats['wait_time_max'] * 1000)
+
+    async def execute_query(self, query, params=None):
+        try:
+            async with self.session() as (connection, cursor):
+                try:
+                    await cursor.execute(query, params or ())
+                    if not self.in_transaction():
+                        await connection.commit()
+                except MySQLError:
+                    if not self.in_transaction():
+                        await connection.rollback()
+                    raise
+                self._last_insert_id.set(cursor.lastrowid)
+                self._last_row_count.set(cursor.rowcount)
+                return True
+        except MySQLError as e:
+            logger.error("Error al ejecutar la consulta: %s", e)
+            if self.in_transaction():
+                raise
+            return False
+
+    async def execute_many(self, query, params_list):
+        try:
+            async with self.session() as (connection, cursor):
+                try:
+                    await cursor.executemany(query, params_list)
+                    if not self.in_transaction():
+                        await connection.commit()
+                except MySQLError:
+                    if not self.in_transaction():
+                        await connection.rollback()
+                    raise
+                self._last_insert_id.set(cursor.lastrowid)
+                return True
+        except MySQLError as e:
+            logger.error("Error al ejecutar la consulta masiva: %s", e)
+            if self.in_transaction():
+                raise
+            return False
+
+    async def fetch_all(self, query, params=None):
+        try:
+            async with self.session() as (connection, cursor):
+                await cursor.execute(query, params or ())
+                return list(await cursor.fetchall())
+        except MySQLError as e:
+            logger.error("Error al obtener datos: %s", e)
+            return []
+
+    async def fetch_one(self, query, params=None):
+        try:
+            async with self.session() as (connection, cursor):
+                await cursor.execute(query, params or ())
+                return await cursor.fetchone()
+        except MySQLError as e:
+            logger.error("Error al obtener datos: %s", e)
+            return None
+
+    def get_last_insert_id(self):
+        return self._last_insert_id.get()
+
+    def get_last_row_count(self):
+        return self._last_row_count.get()
+
+
+class AsyncBaseModel:
+    # Distribuidor de notificaciones (notifications.Broker); sin él no se publica nada
+    broker = None
+
+    def __init__(self, db_manager):
+        self.db = db_manager
+
+    def _notify(self, user_ids, event):
+        # Igual que BaseModel._notify: se publica al confirmar la transacción en curso
+        broker = self.broker
+        if broker is None:
+            return
+        def publish():
+            for user_id in dict.fromkeys(user_ids):
+                try:
+                    broker.publish(user_id, event)
+                except Exception as e:
+                    logger.exception("Error al publicar la notificación: %s", e)
+        self.db.after_commit(publish)
+
+    async def _cached_many(self, key_prefix, ids, loader, default):
+        # Igual que BaseModel._cached_many, con loader(ids) asíncrono
+        ids = list(dict.fromkeys(ids))
+        cache = self.db.cache
+        result = {}
+        missing = ids
+        if cache is not None:
+            missing = []
+            for item_id in ids:
+                value = cache.get(f"{key_prefix}:{item_id}")
+                if value is MISS:
+                    missing.append(item_id)
+                else:
+                    result[item_id] = _copy_rows(value)
+        if missing:
+            loaded = await loader(missing)
+            for item_id in missing:
+                value = loaded.get(item_id)
+                if value is None:
+                    value = default()
+                if cache is not None:
+                    cache.set(f"{key_prefix}:{item_id}", value)
+                result[item_id] = _copy_rows(value)
+        return result
+
+    def _invalidate(self, *keys):
+        # Igual que BaseModel._invalidate: ya y otra vez al confirmar la transacción
+        cache = self.db.cache
+        if cache is None or not keys:
+            return
+        cache.delete(*keys)
+        if self.db.in_transaction():
+            self.db.after_commit(lambda: cache.delete(*keys))
+
+    @staticmethod
+    def _group_by(rows, key):
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(row[key], []).append(row)
+        return grouped
+
+    async def _bulk_insert(self, query, rows, chunk_size=None):
+        chunk_size = chunk_size or BULK_CHUNK_SIZE
+        ids = []
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            if not await self.db.execute_many(query, chunk):
+                logger.warning("Inserción masiva interrumpida: %d de %d filas confirmadas", len(ids), len(rows))
+                return None
+            first_id = self.db.get_last_insert_id()
+            ids.extend(range(first_id, first_id + len(chunk)))
+        return ids
+
+    async def _fetch_keyset(self, query, params, alias, limit=None, after=None):
+        params = tuple(params)
+        order_by = f" ORDER BY {alias}.created_at DESC, {alias}.id DESC"
+        if limit is None:
+            return await self.db.fetch_all(query + order_by, params)
+
+        if after:
+            created_at, last_id = decode_cursor(after)
+            query += (f" AND ({alias}.created_at < %s"
+                      f" OR ({alias}.created_at = %s AND {alias}.id < %s))")
+            params += (created_at, created_at, last_id)
+        rows = await self.db.fetch_all(query + order_by + " LIMIT %s", params + (limit + 1,))
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+        return rows, next_cursor
+
+    async def _update_row(self, table, allowed_columns, row_id, changes, snapshot=None):
+        columns, changes = pending_changes(allowed_columns, changes, snapshot)
+        if not columns:
+            return True
+        params = [changes[column] for column in columns]
+        params.append(row_id)
+        return await self.db.execute_query(build_update_query(table, columns), params)
+
+
+class AsyncUserModel(AsyncBaseModel):
+    def __init__(self, db_manager, password_hasher=None):
+        super().__init__(db_manager)
+        self.password_hasher = password_hasher or default_hasher()
+
+    async def create_user(self, email, password, name, phone, user_type,
+                          location_lat=None, location_lng=None, address=None, bio=None):
+        password_hash = await self.password_hasher.hash_async(password)
+        query = """
+        INSERT INTO users (email, password_hash, name, phone, user_type,
+                         location_lat, location_lng, address, bio)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """
+        params = (email, password_hash, name, phone, user_type,
+                  location_lat, location_lng, address, bio)
+        if await self.db.execute_query(query, params):
+            return self.db.get_last_insert_id()
+        return None
+
+    async def get_user_by_id(self, user_id):
+        return await self.db.fetch_one("SELECT * FROM users WHERE id = %s", (user_id,))
+
+    async def get_user_names_many(self, user_ids):
+        async def load(missing):
+            query = f"SELECT id, name FROM users WHERE id IN ({_placeholders(missing)})"
+            return {row['id']: row['name'] for row in await self.db.fetch_all(query, tuple(missing))}
+        return await self._cached_many('user_name', user_ids, load, lambda: None)
+
+    async def get_user_by_email(self, email):
+        return await self.db.fetch_one("SELECT * FROM users WHERE email = %s", (email,))
+
+    async def update_user(self, user_id, snapshot=None, **kwargs):
+        if await self._update_row('users', UserModel.UPDATABLE_COLUMNS, user_id, kwargs, snapshot):
+            self._invalidate(f"user:{user_id}", f"user_name:{user_id}")
+            return True
+        return False
+
+    async def verify_password(self, stored_hash, provided_password):
+        return await self.password_hasher.verify_async(stored_hash, provided_password)
+
+    async def authenticate(self, email, password):
+        user = await self.get_user_by_email(email)
+        if user is None or not await self.password_hasher.verify_async(user['password_hash'], password):
+            return None
+        if self.password_hasher.needs_rehash(user['password_hash']):
+            try:
+                new_hash = await self.password_hasher.hash_async(password)
+            except HashingBusyError:
+                return user
+            if await self.db.execute_query(UserModel.REHASH_QUERY, (new_hash, user['id'], user['password_hash'])):
+                user['password_hash'] = new_hash
+        return user
+
+    async def get_all_farmers(self):
+        return await self.db.fetch_all("SELECT * FROM users WHERE user_type = 'agricultor'")
+
+    async def get_all_consumers(self):
+        return await self.db.fetch_all("SELECT * FROM users WHERE user_type = 'consumidor'")
+
+
+class AsyncProductModel(AsyncBaseModel):
+    async def create_product(self, user_id, name, description, price, quantity, unit,
+                             category=None, harvest_date=None, is_organic=False,
+                             location_lat=None, location_lng=None):
+        params = (user_id, name, description, price, quantity, unit,
+                  category, harvest_date, is_organic, location_lat, location_lng)
+        if await self.db.execute_query(ProductModel.INSERT_PRODUCT_QUERY, params):
+            return self.db.get_last_insert_id()
+        return None
+
+    async def create_products_bulk(self, products, chunk_size=None):
+        rows = [
+            (p['user_id'], p['name'], p.get('description'), p['price'], p['quantity'], p['unit'],
+             p.get('category'), p.get('harvest_date'), p.get('is_organic', False),
+             p.get('location_lat'), p.get('location_lng'))
+            for p in products
+        ]
+        return await self._bulk_insert(ProductModel.INSERT_PRODUCT_QUERY, rows, chunk_size)
+
+    async def get_product_by_id(self, product_id):
+        query = """
+        SELECT p.*, u.name as seller_name, u.phone as seller_phone
+        FROM products p
+        JOIN users u ON p.user_id = u.id
+        WHERE p.id = %s
+        """
+        return await self.db.fetch_one(query, (product_id,))
+
+    async def get_products_by_user(self, user_id):
+        return await self.db.fetch_all("SELECT * FROM products WHERE user_id = %s", (user_id,))
+
+    async def get_available_products(self, limit=None, after=None, include=()):
+        query = """
+        SELECT p.*, u.name as seller_name
+        FROM products p
+        JOIN users u ON p.user_id = u.id
+        WHERE p.status = 'available'
+        """
+        return await self._with_includes(await self._fetch_keyset(query, (), 'p', limit, after), include)
+
+    async def get_products_by_category(self, category, limit=None, after=None, include=()):
+        query = """
+        SELECT p.*, u.name as seller_name
+        FROM products p
+        JOIN users u ON p.user_id = u.id
+        WHERE p.category = %s AND p.status = 'available'
+        """
+        return await self._with_includes(await self._fetch_keyset(query, (category,), 'p', limit, after),
+                                         include)
+
+    async def _with_includes(self, result, include):
+        # Igual que ProductModel._with_includes: 'images' y 'rating', una consulta por relación
+        unknown = set(include) - {'images', 'rating'}
+        if unknown:
+            raise ValueError(f"Relaciones no soportadas en include: {', '.join(sorted(unknown))}")
+        rows = result[0] if isinstance(result, tuple) else result
+        if not include or not rows:
+            return result
+        ids = [row['id'] for row in rows]
+        if 'images' in include:
+            images = await self.get_product_images_many(ids)
+            for row in rows:
+                row['images'] = images[row['id']]
+        if 'rating' in include:
+            ratings = await AsyncReviewModel(self.db).get_average_ratings_many(ids)
+            for row in rows:
+                row['average_rating'] = ratings[row['id']]
+        return result
+
+    async def update_product(self, product_id, snapshot=None, **kwargs):
+        return await self._update_row('products', ProductModel.UPDATABLE_COLUMNS, product_id, kwargs, snapshot)
+
+    async def delete_product(self, product_id):
+        if await self.db.execute_query("DELETE FROM products WHERE id = %s", (product_id,)):
+            self._invalidate(f"product:{product_id}", f"product_images:{product_id}")
+            return True
+        return False
+
+    async def add_product_image(self, product_id, image_url, is_primary=False):
+        if await self.db.execute_query(ProductModel.INSERT_IMAGE_QUERY, (product_id, image_url, is_primary)):
+            self._invalidate(f"product_images:{product_id}")
+            return True
+        return False
+
+    async def add_product_images_bulk(self, images, chunk_size=None):
+        rows = [(i['product_id'], i['image_url'], i.get('is_primary', False)) for i in images]
+        ids = await self._bulk_insert(ProductModel.INSERT_IMAGE_QUERY, rows, chunk_size)
+        self._invalidate(*{f"product_images:{row[0]}" for row in rows})
+        return ids
+
+    async def get_product_images(self, product_id):
+        return await self.db.fetch_all("SELECT * FROM product_images WHERE product_id = %s", (product_id,))
+
+    async def get_product_images_many(self, product_ids):
+        async def load(ids):
+            query = f"SELECT * FROM product_images WHERE product_id IN ({_placeholders(ids)})"
+            return self._group_by(await self.db.fetch_all(query, tuple(ids)), 'product_id')
+        return await self._cached_many("product_images", product_ids, load, list)
+
+    async def reserve_stock(self, items):
+        # Igual que ProductModel.reserve_stock: UPDATE condicional por producto en orden
+        # de id; lanza InsufficientStockError y revierte si alguno no alcanza
+        requested = ProductModel._stock_by_product(items)
+        async with self.db.transaction():
+            for product_id, quantity in requested:
+                await self.db.execute_query(ProductModel.RESERVE_STOCK_QUERY, (quantity, product_id, quantity))
+                if self.db.get_last_row_count() != 1:
+                    raise InsufficientStockError(product_id, quantity)
+        return True
+
+    async def release_stock(self, items):
+        requested = ProductModel._stock_by_product(items)
+        async with self.db.transaction():
+            for product_id, quantity in requested:
+                await self.db.execute_query(ProductModel.RELEASE_STOCK_QUERY, (quantity, product_id))
+        return True
+
+    async def mark_sold_out(self, product_ids):
+        # Igual que ProductModel.mark_sold_out: 'reserved' -> 'sold' si ningún pedido abierto
+        # retiene aún unidades
+        product_ids = sorted(set(product_ids))
+        if not product_ids:
+            return True
+        query = ProductModel.MARK_SOLD_OUT_QUERY.format(placeholders=", ".join(["%s"] * len(product_ids)))
+        return await self.db.execute_query(query, tuple(product_ids))
+
+
+class AsyncOrderModel(AsyncBaseModel):
+    def __init__(self, db_manager, product_model=None, broker=None):
+        super().__init__(db_manager)
+        self.product_model = product_model or AsyncProductModel(db_manager)
+        self.broker = broker
+
+    async def create_order(self, buyer_id, seller_id, total_amount, delivery_address,
+                           delivery_date, payment_method='cash', notes=None, stock_reserved=False):
+        params = (buyer_id, seller_id, total_amount, delivery_address,
+                  delivery_date, payment_method, notes, stock_reserved)
+        if await self.db.execute_query(OrderModel.INSERT_ORDER_QUERY, params):
+            return self.db.get_last_insert_id()
+        return None
+
+    async def place_order(self, buyer_id, seller_id, items, delivery_address, delivery_date,
+                          payment_method='cash', notes=None):
+        if not items:
+            raise ValueError("El pedido debe incluir al menos un producto")
+        total_amount = sum(OrderModel._subtotal(i['quantity'], i['unit_price']) for i in items)
+        async with self.db.transaction():
+            await self.product_model.reserve_stock(items)
+            order_id = await self.create_order(buyer_id, seller_id, total_amount, delivery_address,
+                                               delivery_date, payment_method, notes, stock_reserved=True)
+            details = [dict(item, order_id=order_id) for item in items]
+            await self.add_order_details_bulk(details, chunk_size=len(details))
+        return order_id
+
+    async def add_order_detail(self, order_id, product_id, quantity, unit_price):
+        subtotal = OrderModel._subtotal(quantity, unit_price)
+        return await self.db.execute_query(OrderModel.INSERT_DETAIL_QUERY,
+                                           (order_id, product_id, quantity, unit_price, subtotal))
+
+    async def add_order_details_bulk(self, details, chunk_size=None):
+        rows = [
+            (d['order_id'], d['product_id'], d['quantity'], d['unit_price'],
+             OrderModel._subtotal(d['quantity'], d['unit_price']))
+            for d in details
+        ]
+        return await self._bulk_insert(OrderModel.INSERT_DETAIL_QUERY, rows, chunk_size)
+
+    async def get_order_by_id(self, order_id):
+        query = """
+        SELECT o.*,
+               b.name as buyer_name, b.phone as buyer_phone,
+               s.name as seller_name, s.phone as seller_phone
+        FROM orders o
+        JOIN users b ON o.buyer_id = b.id
+        JOIN users s ON o.seller_id = s.id
+        WHERE o.id = %s
+        """
+        return await self.db.fetch_one(query, (order_id,))
+
+    async def get_order_details(self, order_id):
+        query = """
+        SELECT od.*, p.name as product_name, p.unit
+        FROM order_details od
+        JOIN products p ON od.product_id = p.id
+        WHERE od.order_id = %s
+        """
+        return await self.db.fetch_all(query, (order_id,))
+
+    async def get_order_details_many(self, order_ids):
+        order_ids = list(dict.fromkeys(order_ids))
+        if not order_ids:
+            return {}
+        query = f"""
+        SELECT od.*, p.name as product_name, p.unit
+        FROM order_details od
+        JOIN products p ON od.product_id = p.id
+        WHERE od.order_id IN ({_placeholders(order_ids)})
+        """
+        details = self._group_by(await self.db.fetch_all(query, tuple(order_ids)), 'order_id')
+        return {order_id: details.get(order_id, []) for order_id in order_ids}
+
+    async def _with_includes(self, result, include):
+        unknown = set(include) - {'details'}
+        if unknown:
+            raise ValueError(f"Relaciones no soportadas en include: {', '.join(sorted(unknown))}")
+        rows = result[0] if isinstance(result, tuple) else result
+        if 'details' in include and rows:
+            details = await self.get_order_details_many([row['id'] for row in rows])
+            for row in rows:
+                row['details'] = details[row['id']]
+        return result
+
+    async def get_orders_by_buyer(self, buyer_id, limit=None, after=None, include=()):
+        query = """
+        SELECT o.*, u.name as seller_name
+        FROM orders o
+        JOIN users u ON o.seller_id = u.id
+        WHERE o.buyer_id = %s
+        """
+        return await self._with_includes(await self._fetch_keyset(query, (buyer_id,), 'o', limit, after), include)
+
+    async def get_orders_by_seller(self, seller_id, limit=None, after=None, include=()):
+        query = """
+        SELECT o.*, u.name as buyer_name
+        FROM orders o
+        JOIN users u ON o.buyer_id = u.id
+        WHERE o.seller_id = %s
+        """
+        return await self._with_includes(await self._fetch_keyset(query, (seller_id,), 'o', limit, after), include)
+
+    async def update_order_status(self, order_id, status):
+        if not await self.db.execute_query("UPDATE orders SET status = %s WHERE id = %s",
+                                           (status, order_id)):
+            return False
+        await self._notify_status(order_id, status)
+        return True
+
+    async def _notify_status(self, order_id, status):
+        if self.broker is None:
+            return
+        order = await self.db.fetch_one("SELECT buyer_id, seller_id FROM orders WHERE id = %s", (order_id,))
+        if order:
+            self._notify([order['buyer_id'], order['seller_id']],
+                         {'type': 'order_status', 'order_id': order_id, 'status': status})
+
+    async def cancel_order(self, order_id):
+        async with self.db.transaction():
+            await self.db.execute_query(OrderModel.CANCEL_ORDER_QUERY, (order_id,))
+            if self.db.get_last_row_count() != 1:
+                return False
+            await self._notify_status(order_id, 'cancelled')
+            order = await self.db.fetch_one(OrderModel.STOCK_RESERVED_QUERY, (order_id,))
+            details = await self.get_order_details(order_id) if order and order['stock_reserved'] else None
+            if details:
+                await self.product_model.release_stock(details)
+        return True
+
+    async def complete_order(self, order_id):
+        # Transición condicional a 'delivered', como OrderModel.complete_order
+        async with self.db.transaction():
+            await self.db.execute_query(OrderModel.COMPLETE_ORDER_QUERY, (order_id,))
+            if self.db.get_last_row_count() != 1:
+                return False
+            await self._notify_status(order_id, 'delivered')
+            details = await self.get_order_details(order_id)
+            await self.product_model.mark_sold_out([detail['product_id'] for detail in details])
+        return True
+
+    async def update_payment_status(self, order_id, payment_status):
+        return await self.db.execute_query("UPDATE orders SET payment_status = %s WHERE id = %s",
+                                           (payment_status, order_id))
+
+
+class AsyncReviewModel(AsyncBaseModel):
+    async def create_review(self, reviewer_id, reviewed_id, rating, comment, order_id=None, product_id=None):
+        if rating not in (1, 2, 3, 4, 5):
+            raise ValueError(f"La calificación debe ser un entero entre 1 y 5: {rating!r}")
+        query = """
+        INSERT INTO reviews (reviewer_id, reviewed_id, rating, comment, order_id, product_id)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        """
+        params = (reviewer_id, reviewed_id, rating, comment, order_id, product_id)
+        histogram = tuple(int(rating == score) for score in range(1, 6))
+        summaries = [('user', reviewed_id, rating) + histogram]
+        if product_id is not None:
+            summaries.append(('product', product_id, rating) + histogram)
+        try:
+            async with self.db.transaction():
+                await self.db.execute_query(query, params)
+                review_id = self.db.get_last_insert_id()
+                await self.db.execute_many(ReviewModel.UPSERT_SUMMARY_QUERY, summaries)
+        except MySQLError:
+            if self.db.in_transaction():
+                raise
+            return None
+        self._invalidate(*[f"rating:{subject}:{subject_id}" for subject, subject_id, *_ in summaries])
+        return review_id
+
+    async def get_reviews_by_product(self, product_id, limit=None, after=None):
+        query = """
+        SELECT r.*, u.name as reviewer_name
+        FROM reviews r
+        JOIN users u ON r.reviewer_id = u.id
+        WHERE r.product_id = %s
+        """
+        return await self._fetch_keyset(query, (product_id,), 'r', limit, after)
+
+    async def get_reviews_by_user(self, user_id):
+        query = """
+        SELECT r.*, u.name as reviewer_name
+        FROM reviews r
+        JOIN users u ON r.reviewer_id = u.id
+        WHERE r.reviewed_id = %s
+        ORDER BY r.created_at DESC
+        """
+        return await self.db.fetch_all(query, (user_id,))
+
+    async def get_rating_summary_by_product(self, product_id):
+        return await self._get_rating_summary('product', product_id)
+
+    async def get_rating_summary_by_user(self, user_id):
+        return await self._get_rating_summary('user', user_id)
+
+    async def _get_rating_summary(self, subject_type, subject_id):
+        query = """
+        SELECT review_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5
+        FROM rating_summaries
+        WHERE subject_type = %s AND subject_id = %s
+        """
+        row = await self.db.fetch_one(query, (subject_type, subject_id))
+        return ReviewModel._summary_from_row(row)
+
+    async def get_rating_summaries_many(self, product_ids):
+        async def load(ids):
+            query = f"""
+            SELECT subject_id, review_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5
+            FROM rating_summaries
+            WHERE subject_type = 'product' AND subject_id IN ({_placeholders(ids)})
+            """
+            rows = await self.db.fetch_all(query, tuple(ids))
+            return {row['subject_id']: ReviewModel._summary_from_row(row) for row in rows}
+        return await self._cached_many("rating:product", product_ids, load,
+                                       lambda: ReviewModel._summary_from_row(None))
+
+    async def get_average_ratings_many(self, product_ids):
+        summaries = await self.get_rating_summaries_many(product_ids)
+        return {product_id: summary['average'] or 0 for product_id, summary in summaries.items()}
+
+    async def get_average_rating_by_product(self, product_id):
+        return (await self.get_rating_summary_by_product(product_id))['average'] or 0
+
+    async def get_average_rating_by_user(self, user_id):
+        return (await self.get_rating_summary_by_user(user_id))['average'] or 0
+
+
+class AsyncMessageModel(AsyncBaseModel):
+    def __init__(self, db_manager, user_model=None, broker=None):
+        super().__init__(db_manager)
+        # Modelo de usuarios para resolver nombres desde su caché
+        self.user_model = user_model or AsyncUserModel(db_manager)
+        self.broker = broker
+
+    async def send_message(self, sender_id, receiver_id, message):
+        try:
+            async with self.db.transaction():
+                await self.db.execute_query(MessageModel.INSERT_MESSAGE_QUERY, (sender_id, receiver_id, message))
+                message_id = self.db.get_last_insert_id()
+                await self.db.execute_query(
+                    MessageModel.UPSERT_CONVERSATION_QUERY,
+                    MessageModel._conversation_params(sender_id, receiver_id, message_id, message))
+                self._notify([receiver_id, sender_id], {
+                    'type': 'message', 'message_id': message_id, 'sender_id': sender_id,
+                    'receiver_id': receiver_id, 'preview': message[:MessageModel.PREVIEW_LENGTH],
+                })
+        except MySQLError:
+            if self.db.in_transaction():
+                raise
+            return None
+        return message_id
+
+    async def get_conversation(self, user1_id, user2_id, before=None, since_id=None, limit=50):
+        query, params, newest_first = MessageModel._conversation_query(user1_id, user2_id, before,
+                                                                      since_id, limit)
+        rows = await self.db.fetch_all(query, params)
+        if newest_first:
+            rows.reverse()
+        return MessageModel._with_names(rows, await self.user_model.get_user_names_many([user1_id, user2_id]))
+
+    async def mark_as_read(self, message_id):
+        try:
+            async with self.db.transaction():
+                await self.db.execute_query(MessageModel.MARK_READ_QUERY, (message_id,))
+                if self.db.get_last_row_count() == 1:
+                    await self.db.execute_query(MessageModel.DECREMENT_MESSAGE_UNREAD_QUERY, (message_id,))
+        except MySQLError:
+            if self.db.in_transaction():
+                raise
+            return False
+        return True
+
+    async def mark_conversation_read(self, user_id, other_user_id):
+        try:
+            async with self.db.transaction():
+                await self.db.execute_query(MessageModel.MARK_CONVERSATION_READ_QUERY, (user_id, other_user_id))
+                marked = self.db.get_last_row_count() or 0
+                if marked:
+                    await self.db.execute_query(MessageModel.DECREMENT_UNREAD_QUERY,
+                                                (marked, user_id, other_user_id))
+        except MySQLError:
+            if self.db.in_transaction():
+                raise
+            return None
+        return marked
+
+    async def get_unread_messages_count(self, user_id):
+        query = """
+        SELECT COALESCE(SUM(unread_count), 0) as unread_count
+        FROM user_conversations
+        WHERE user_id = %s
+        """
+        result = await self.db.fetch_one(query, (user_id,))
+        return int(result['unread_count']) if result else 0
+
+    async def get_inbox(self, user_id, limit=20, after=None):
+        query = MessageModel.INBOX_QUERY
+        params = (user_id,)
+        if after:
+            _, last_message_id = decode_cursor(after)
+            query += " AND uc.last_message_id < %s"
+            params += (last_message_id,)
+        rows = await self.db.fetch_all(query + " ORDER BY uc.last_message_id DESC LIMIT %s",
+                                       params + (limit + 1,))
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['last_message_at'], rows[-1]['last_message_id'])
+        return rows, next_cursor
+
+
+class AsyncCampoDigitalApp:
+    def __init__(self, pool_config=None, password_hasher=None, broker=None, cache=None):
+        self.db_manager = AsyncDatabaseManager(pool_config=pool_config, cache=cache)
+        self.broker = broker
+        self.user_model = AsyncUserModel(self.db_manager, password_hasher)
+        self.product_model = AsyncProductModel(self.db_manager)
+        self.order_model = AsyncOrderModel(self.db_manager, self.product_model, broker)
+        self.review_model = AsyncReviewModel(self.db_manager)
+        self.message_model = AsyncMessageModel(self.db_manager, self.user_model, broker)
+
+    async def connect(self):
+        return await self.db_manager.connect()
+
+    async def close(self):
+        await self.db_manager.disconnect()
@@ -0,0 +1,480 @@
+# CampoDigital - Mediciones de rendimiento de la capa de datos
+# Requieren una base de datos campodigital migrada (python migrations.py migrate) con datos de
+# prueba (ver database.sql).
+#   python benchmarks.py async-vs-sync --requests 5000 --concurrency 100
+#   python benchmarks.py prepared-vs-text --iterations 20000
+#   python benchmarks.py stock-stress --threads 32 --checkouts 5000
+#   python benchmarks.py notify-fanout --users 1000 --events 20000  (sin base de datos)
+#   python benchmarks.py instrumentation-overhead --iterations 20000
+#   python benchmarks.py logging-overhead --rows 100000 [--no-db] > /dev/null
+#   python benchmarks.py hash-tuning --rate 50 --target-p99-ms 250  (sin base de datos)
+import argparse
+import asyncio
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from decimal import Decimal
+
+from app import POOL_CONFIG, DatabaseManager, InsufficientStockError, MessageModel, ProductModel
+from passwords import HashingBusyError
+
+
+def summarize(name, latencies, elapsed):
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    print(f"{name}: {len(latencies)} operaciones en {elapsed:.2f}s "
+          f"({len(latencies) / elapsed:.0f} ops/s) "
+          f"p50={quantiles[49] * 1000:.2f}ms p95={quantiles[94] * 1000:.2f}ms "
+          f"p99={quantiles[98] * 1000:.2f}ms")
+
+
+def bench_sync_lookups(product_ids, concurrency):
+    # Camino síncrono: un hilo por consulta concurrente sobre el pool de conexiones
+    db = DatabaseManager(pool_config=dict(POOL_CONFIG, max_size=concurrency))
+    db.connect()
+    model = ProductModel(db)
+
+    def lookup(product_id):
+        start = time.perf_counter()
+        model.get_product_by_id(product_id)
+        return time.perf_counter() - start
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(lookup, product_ids))
+        summarize("sync (hilos)", latencies, time.perf_counter() - start)
+    finally:
+        db.disconnect()
+
+
+async def bench_async_lookups(product_ids, concurrency):
+    # Camino asíncrono: un único bucle de eventos con tantas tareas como concurrency
+    from async_app import AsyncDatabaseManager, AsyncProductModel
+
+    db = AsyncDatabaseManager(pool_config=dict(POOL_CONFIG, max_size=concurrency))
+    await db.connect()
+    model = AsyncProductModel(db)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def lookup(product_id):
+        async with semaphore:
+            start = time.perf_counter()
+            await model.get_product_by_id(product_id)
+            return time.perf_counter() - start
+
+    try:
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(lookup(product_id) for product_id in product_ids))
+        summarize("async (asyncio)", latencies, time.perf_counter() - start)
+    finally:
+        await db.disconnect()
+
+
+def async_vs_sync(args):
+    product_ids = [1 + i % args.max_product_id for i in range(args.requests)]
+    bench_sync_lookups(product_ids, args.concurrency)
+    asyncio.run(bench_async_lookups(product_ids, args.concurrency))
+
+
+def server_counters(db):
+    # Contadores de la sesión: cuántas sentencias de texto y preparadas analizó el servidor
+    rows = db.fetch_all("SHOW SESSION STATUS WHERE Variable_name IN "
+                        "('Com_select', 'Com_stmt_prepare', 'Com_stmt_execute')")
+    return {row['Variable_name']: int(row['Value']) for row in rows}
+
+
+def bench_hot_lookups(statement_cache_size, iterations, max_id):
+    # Las consultas fijas más calientes sobre una sola conexión, con o sin caché de
+    # sentencias preparadas
+    db = DatabaseManager(statement_cache_size=statement_cache_size)
+    db.connect()
+    products = ProductModel(db)
+    messages = MessageModel(db)
+    lookups = {
+        'get_product_by_id': lambda i: products.get_product_by_id(i),
+        'get_conversation': lambda i: messages.get_conversation(i, i + 1),
+        'get_unread_messages_count': lambda i: messages.get_unread_messages_count(i),
+    }
+    label = f"preparadas (caché {statement_cache_size})" if statement_cache_size else "texto"
+    try:
+        before = server_counters(db)
+        for name, lookup in lookups.items():
+            latencies = []
+            start = time.perf_counter()
+            for i in range(iterations):
+                call_start = time.perf_counter()
+                lookup(1 + i % max_id)
+                latencies.append(time.perf_counter() - call_start)
+            summarize(f"{name} [{label}]", latencies, time.perf_counter() - start)
+        after = server_counters(db)
+        print("  servidor: " + ", ".join(f"{key}={after[key] - before.get(key, 0)}" for key in sorted(after)))
+        if statement_cache_size:
+            print(f"  caché de sentencias: {db.statement_cache_stats()}")
+    finally:
+        db.disconnect()
+
+
+def prepared_vs_text(args):
+    bench_hot_lookups(0, args.iterations, args.max_id)
+    bench_hot_lookups(args.cache_size, args.iterations, args.max_id)
+
+
+def stock_stress(args):
+    # Compras concurrentes de varios productos (en orden aleatorio) contra el mismo
+    # inventario: al final lo reservado debe cuadrar exactamente y nada queda negativo
+    db = DatabaseManager(pool_config=dict(POOL_CONFIG, max_size=args.threads))
+    db.connect()
+    products = ProductModel(db)
+    product_ids = [
+        products.create_product(args.seller_id, f"Prueba de inventario {i}", "stock-stress",
+                                args.stock, args.stock, 'kg')
+        for i in range(args.products)
+    ]
+    reserved = {product_id: Decimal(0) for product_id in product_ids}
+    counters = {'ok': 0, 'rejected': 0, 'errors': 0}
+    lock = threading.Lock()
+    remaining = iter(range(args.checkouts))
+
+    def worker():
+        rng = random.Random()
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            chosen = rng.sample(product_ids, rng.randint(1, len(product_ids)))
+            items = [{'product_id': product_id, 'quantity': rng.randint(1, 3)} for product_id in chosen]
+            try:
+                products.reserve_stock(items)
+            except InsufficientStockError:
+                with lock:
+                    counters['rejected'] += 1
+                continue
+            except Exception:
+                with lock:
+                    counters['errors'] += 1
+                continue
+            with lock:
+                counters['ok'] += 1
+                for item in items:
+                    reserved[item['product_id']] += item['quantity']
+
+    try:
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        print(f"{args.checkouts} compras en {elapsed:.2f}s ({args.checkouts / elapsed:.0f}/s): "
+              f"{counters['ok']} reservadas, {counters['rejected']} sin stock, {counters['errors']} errores")
+
+        oversold = False
+        for product_id in product_ids:
+            row = db.fetch_one("SELECT quantity, status FROM products WHERE id = %s", (product_id,))
+            expected = Decimal(args.stock) - reserved[product_id]
+            ok = row['quantity'] == expected and row['quantity'] >= 0
+            oversold = oversold or not ok
+            print(f"  producto {product_id}: quedan {row['quantity']} (esperado {expected}), "
+                  f"estado {row['status']} {'OK' if ok else 'INCONSISTENTE'}")
+        print("Sin sobreventa" if not oversold else "SOBREVENTA DETECTADA")
+        return 0 if not oversold else 1
+    finally:
+        for product_id in product_ids:
+            products.delete_product(product_id)
+        db.disconnect()
+
+
+async def bench_notify_fanout(users, clients_per_user, events, rate):
+    # Clientes en long-poll sobre el Broker en proceso; otro hilo publica eventos como
+    # lo harían send_message/update_order_status. Mide publicación -> entrega.
+    from notifications import Broker
+
+    broker = Broker(max_waiters_per_user=clients_per_user)
+    latencies = []
+    done = asyncio.Event()
+    received = 0
+
+    async def client(user_id):
+        nonlocal received
+        cursor = None
+        while not done.is_set():
+            result = await broker.poll(user_id, cursor, timeout=1.0)
+            now = time.perf_counter()
+            cursor = result['cursor']
+            for event in result['events']:
+                latencies.append(now - event['sent_at'])
+                received += 1
+            if received >= events * clients_per_user:
+                done.set()
+
+    def publisher():
+        rng = random.Random(1)
+        for i in range(events):
+            broker.publish(rng.randrange(users), {'type': 'message', 'sent_at': time.perf_counter()})
+            if rate:
+                time.sleep(1.0 / rate)
+
+    tasks = [asyncio.create_task(client(user_id)) for user_id in range(users)
+             for _ in range(clients_per_user)]
+    await asyncio.sleep(0.1)
+    start = time.perf_counter()
+    thread = threading.Thread(target=publisher)
+    thread.start()
+    try:
+        await asyncio.wait_for(done.wait(), timeout=max(30.0, events / (rate or events) * 2))
+    except asyncio.TimeoutError:
+        print("Tiempo agotado antes de recibir todos los eventos")
+    elapsed = time.perf_counter() - start
+    thread.join()
+    done.set()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    summarize(f"entrega ({users} usuarios x {clients_per_user} clientes)", latencies, elapsed)
+    print(f"  broker: {broker.stats()}")
+    # Equivalente en consultas: cada cliente sondeando get_unread_messages_count cada segundo
+    print(f"  sondeo a 1/s habría hecho {int(users * clients_per_user * elapsed)} consultas; "
+          f"long-poll: 0 consultas de sondeo")
+
+
+def notify_fanout(args):
+    asyncio.run(bench_notify_fanout(args.users, args.clients_per_user, args.events, args.rate))
+
+
+def instrumentation_overhead(args):
+    # La misma lectura caliente con y sin instrumentación; se alternan rondas para que
+    # la deriva del servidor no favorezca a ninguna
+    from instrumentation import Instrumentation
+
+    instrumentation = Instrumentation()
+    db = DatabaseManager()
+    db.connect()
+    products = ProductModel(db)
+    totals = {'sin instrumentación': 0.0, 'con instrumentación': 0.0}
+    try:
+        for _ in range(args.rounds):
+            for label, value in (('sin instrumentación', None), ('con instrumentación', instrumentation)):
+                db.instrumentation = value
+                start = time.perf_counter()
+                for i in range(args.iterations):
+                    products.get_product_by_id(1 + i % args.max_id)
+                totals[label] += time.perf_counter() - start
+        calls = args.iterations * args.rounds
+        for label, elapsed in totals.items():
+            print(f"{label}: {elapsed / calls * 1e6:.1f} µs por consulta")
+        base = totals['sin instrumentación']
+        print(f"Sobrecoste: {(totals['con instrumentación'] - base) / base * 100:+.2f}%")
+        for query, stats in instrumentation.top(3):
+            print(f"  {stats['count']} x p50={stats['p50_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms {query[:80]}")
+    finally:
+        db.disconnect()
+
+
+def logging_overhead(args):
+    # Coste por consulta del registro de éxito en una carga de filas una a una:
+    # escritura síncrona en stdout en cada consulta (como el antiguo print) frente a la
+    # cola no bloqueante con nivel INFO y con DEBUG muestreado. Con --no-db solo se
+    # mide la llamada de registro que hace execute_query.
+    import logging
+    import sys
+
+    from log_config import ROOT_LOGGER, configure_logging, shutdown_logging
+
+    db_logger = logging.getLogger('campodigital.db')
+    root = logging.getLogger(ROOT_LOGGER)
+
+    def stdout_every_query():
+        shutdown_logging()
+        handler = logging.StreamHandler(sys.stdout)
+        root.addHandler(handler)
+        root.setLevel(logging.DEBUG)
+        return lambda: root.removeHandler(handler)
+
+    def queue_info():
+        configure_logging(level='INFO', stream=sys.stdout)
+        return shutdown_logging
+
+    def queue_debug_sampled():
+        configure_logging(level='DEBUG', stream=sys.stdout, sample_every=1000)
+        return shutdown_logging
+
+    modes = [("stdout síncrono en cada consulta", stdout_every_query),
+             ("cola, nivel INFO", queue_info),
+             ("cola, DEBUG muestreado 1/1000", queue_debug_sampled)]
+
+    db = None
+    if not args.no_db:
+        db = DatabaseManager()
+        db.connect()
+    results = []
+    try:
+        for label, setup in modes:
+            teardown = setup()
+            try:
+                start = time.perf_counter()
+                if db is None:
+                    for i in range(args.rows):
+                        db_logger.debug("Consulta ejecutada exitosamente: %s filas", 1)
+                else:
+                    for offset in range(0, args.rows, BATCH_ROWS):
+                        with db.transaction():
+                            for i in range(offset, min(offset + BATCH_ROWS, args.rows)):
+                                db.execute_query(
+                                    "INSERT INTO products (user_id, name, price, quantity, unit, description) "
+                                    "VALUES (%s, %s, %s, %s, %s, %s)",
+                                    (args.seller_id, f"Carga {i}", 1000, 1, 'kg', 'logging-overhead'))
+                elapsed = time.perf_counter() - start
+            finally:
+                teardown()
+            results.append((label, elapsed))
+            if db is not None:
+                db.execute_query("DELETE FROM products WHERE description = 'logging-overhead'")
+    finally:
+        if db is not None:
+            db.disconnect()
+    # El informe va a stderr para que stdout pueda redirigirse a /dev/null o a una tubería
+    for label, elapsed in results:
+        print(f"{label}: {args.rows} consultas en {elapsed:.2f}s "
+              f"({elapsed / args.rows * 1e6:.1f} µs por consulta)", file=sys.stderr)
+
+
+# Filas por transacción en logging-overhead
+BATCH_ROWS = 1000
+
+
+async def bench_logins(hasher, stored_hash, rate, duration):
+    # Carga de lazo abierto: los inicios de sesión llegan según un proceso de Poisson a
+    # `rate` por segundo, vayan como vayan los anteriores. La latencia se mide desde la
+    # llegada programada, así que incluye la espera en cola.
+    loop = asyncio.get_running_loop()
+    latencies = []
+    rejected = 0
+
+    async def login(arrival):
+        nonlocal rejected
+        try:
+            await hasher.verify_async(stored_hash, 'contraseña-de-prueba')
+        except HashingBusyError:
+            rejected += 1
+            return
+        latencies.append(loop.time() - arrival)
+
+    tasks = []
+    start = loop.time()
+    arrival = start
+    while arrival - start < duration:
+        arrival += random.expovariate(rate)
+        await asyncio.sleep(max(0.0, arrival - loop.time()))
+        tasks.append(asyncio.create_task(login(arrival)))
+    await asyncio.gather(*tasks)
+    return latencies, rejected, loop.time() - start
+
+
+def hash_tuning(args):
+    # Prueba scrypt con n creciente (r y p fijos) y recomienda el mayor coste cuyo p99
+    # de inicio de sesión cumple el objetivo a la tasa pedida sin rechazos
+    from passwords import PasswordHasher
+
+    recommended = None
+    for exponent in range(args.min_log_n, args.max_log_n + 1):
+        hasher = PasswordHasher(n=2 ** exponent, r=args.r, p=args.p, workers=args.workers,
+                                max_pending=args.max_pending)
+        try:
+            hasher.warm_up()
+            stored_hash = hasher.hash('contraseña-de-prueba')
+            latencies, rejected, elapsed = asyncio.run(
+                bench_logins(hasher, stored_hash, args.rate, args.duration))
+        finally:
+            hasher.close()
+        if not latencies:
+            print(f"n=2^{exponent}: todos los inicios de sesión rechazados ({rejected})")
+            break
+        summarize(f"n=2^{exponent} r={args.r} p={args.p}", latencies, elapsed)
+        p99 = (statistics.quantiles(latencies, n=100)[98] if len(latencies) > 1 else latencies[0]) * 1000
+        if rejected:
+            print(f"  rechazados por cola llena: {rejected}")
+        if p99 > args.target_p99_ms or rejected:
+            # Más coste solo puede empeorar la latencia
+            break
+        recommended = exponent
+    if recommended is None:
+        print(f"Ningún coste cumple p99 <= {args.target_p99_ms}ms a {args.rate} inicios/s: "
+              f"hacen falta más procesos (--workers)")
+        return 1
+    print(f"Recomendado: PasswordHasher(n=2**{recommended}, r={args.r}, p={args.p}, "
+          f"workers={args.workers or 'núcleos'}, max_pending={args.max_pending})")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de CampoDigital")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('async-vs-sync', help="get_product_by_id concurrente: hilos vs asyncio")
+    command.add_argument('--requests', type=int, default=5000)
+    command.add_argument('--concurrency', type=int, default=50)
+    command.add_argument('--max-product-id', type=int, default=1000)
+    command.set_defaults(func=async_vs_sync)
+
+    command = commands.add_parser('prepared-vs-text',
+                                  help="Consultas calientes como texto vs sentencias preparadas en caché")
+    command.add_argument('--iterations', type=int, default=20000)
+    command.add_argument('--cache-size', type=int, default=64)
+    command.add_argument('--max-id', type=int, default=1000)
+    command.set_defaults(func=prepared_vs_text)
+
+    command = commands.add_parser('stock-stress',
+                                  help="Reservas de inventario concurrentes: comprueba que no hay sobreventa")
+    command.add_argument('--threads', type=int, default=32)
+    command.add_argument('--checkouts', type=int, default=5000)
+    command.add_argument('--products', type=int, default=3)
+    command.add_argument('--stock', type=int, default=2000)
+    command.add_argument('--seller-id', type=int, default=1)
+    command.set_defaults(func=stock_stress)
+
+    command = commands.add_parser('notify-fanout',
+                                  help="Latencia de entrega de notificaciones con clientes en long-poll")
+    command.add_argument('--users', type=int, default=1000)
+    command.add_argument('--clients-per-user', type=int, default=2)
+    command.add_argument('--events', type=int, default=20000)
+    command.add_argument('--rate', type=float, default=0, help="Eventos por segundo (0 = sin límite)")
+    command.set_defaults(func=notify_fanout)
+
+    command = commands.add_parser('instrumentation-overhead',
+                                  help="Coste de la instrumentación de consultas en una lectura caliente")
+    command.add_argument('--iterations', type=int, default=20000)
+    command.add_argument('--rounds', type=int, default=3)
+    command.add_argument('--max-id', type=int, default=1000)
+    command.set_defaults(func=instrumentation_overhead)
+
+    command = commands.add_parser('logging-overhead',
+                                  help="Coste del registro de consultas: stdout síncrono vs cola no bloqueante")
+    command.add_argument('--rows', type=int, default=100000)
+    command.add_argument('--seller-id', type=int, default=1)
+    command.add_argument('--no-db', action='store_true', help="Mide solo la llamada de registro")
+    command.set_defaults(func=logging_overhead)
+
+    command = commands.add_parser('hash-tuning',
+                                  help="Parámetros de scrypt para un p99 de inicio de sesión a N inicios/s")
+    command.add_argument('--rate', type=float, default=50.0, help="Inicios de sesión por segundo")
+    command.add_argument('--target-p99-ms', type=float, default=250.0)
+    command.add_argument('--duration', type=float, default=10.0, help="Segundos de carga por coste")
+    command.add_argument('--workers', type=int, default=None, help="Procesos del pool (por defecto, núcleos)")
+    command.add_argument('--max-pending', type=int, default=64)
+    command.add_argument('--min-log-n', type=int, default=12)
+    command.add_argument('--max-log-n', type=int, default=18)
+    command.add_argument('-r', type=int, default=8)
+    command.add_argument('-p', type=int, default=1)
+    command.set_defaults(func=hash_tuning)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,114 @@
+# Caché de lectura para las consultas más frecuentes de los modelos
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+# Valor centinela para distinguir "no está en caché" de un valor guardado
+MISS = object()
+
+
+class LRUCache:
+    # Caché en proceso con expiración por TTL y límite de entradas (LRU)
+    def __init__(self, max_entries=10000, ttl=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0,
+                       'expirations': 0, 'invalidations': 0}
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return MISS
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._data[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return MISS
+            self._data.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            self._stats['sets'] += 1
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                if self._data.pop(key, None) is not None:
+                    self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._data))
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+class RedisCache:
+    # Backend compatible con Redis (servidor local o compartido) con la misma interfaz
+    # que LRUCache. Los valores se serializan con pickle porque las filas traen
+    # Decimal y datetime.
+    def __init__(self, client=None, url='redis://localhost:6379/0', ttl=60.0, prefix='campodigital:'):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise ImportError("RedisCache requiere el paquete 'redis' (pip install redis)") from e
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'invalidations': 0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            self._count('misses')
+            return MISS
+        self._count('hits')
+        return pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.client.set(self.prefix + key, pickle.dumps(value), px=max(1, int(ttl * 1000)))
+        self._count('sets')
+
+    def delete(self, *keys):
+        if keys:
+            removed = self.client.delete(*[self.prefix + key for key in keys])
+            self._count('invalidations', removed or 0)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
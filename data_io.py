@@ -0,0 +1,310 @@
+# CampoDigital - Importación y exportación masiva del catálogo y los pedidos (pandas, Parquet/CSV)
+#   python data_io.py export products catalogo.parquet
+#   python data_io.py import-products catalogo.csv --method load_data
+import argparse
+import csv
+import logging
+import os
+import tempfile
+from decimal import Decimal
+
+import pandas as pd
+
+from app import BULK_CHUNK_SIZE, DatabaseManager, ProductModel
+from log_config import configure_logging
+
+logger = logging.getLogger('campodigital.data_io')
+
+EXPORT_CHUNK_ROWS = 50000
+
+# Tablas exportables y su orden de volcado (el nombre se interpola en la consulta,
+# por eso se valida contra esta lista)
+EXPORTABLE_TABLES = {
+    'users': 'id', 'products': 'id', 'product_images': 'id', 'orders': 'id',
+    'order_details': 'id', 'reviews': 'id', 'messages': 'id',
+    'rating_summaries': 'subject_type, subject_id',
+}
+
+PRODUCT_COLUMNS = ['user_id', 'name', 'description', 'price', 'quantity', 'unit',
+                   'category', 'harvest_date', 'is_organic', 'location_lat', 'location_lng']
+REQUIRED_PRODUCT_COLUMNS = ['user_id', 'name', 'price', 'quantity', 'unit']
+
+_DECIMAL_RE = r"^\d{1,8}(\.\d{1,2})?$"
+_TRUE_VALUES = {'1', 'true', 't', 'si', 'sí', 's', 'yes', 'y', 'x'}
+_FALSE_VALUES = {'0', 'false', 'f', 'no', 'n', ''}
+
+
+def _arrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet requiere el paquete 'pyarrow' (pip install pyarrow)") from e
+    return pyarrow
+
+
+def _arrow_schema(db, table):
+    # Esquema Arrow a partir de los tipos MySQL de la tabla, así todos los bloques
+    # comparten tipos aunque el primero traiga columnas completamente nulas
+    pa = _arrow()
+    query = """
+    SELECT COLUMN_NAME, DATA_TYPE, NUMERIC_PRECISION, NUMERIC_SCALE
+    FROM INFORMATION_SCHEMA.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    ORDER BY ORDINAL_POSITION
+    """
+    fields = []
+    for column in db.fetch_all(query, (table,)):
+        data_type = column['DATA_TYPE'].lower()
+        if data_type in ('tinyint', 'smallint', 'mediumint', 'int', 'integer', 'bigint', 'year'):
+            arrow_type = pa.int64()
+        elif data_type == 'decimal':
+            arrow_type = pa.decimal128(column['NUMERIC_PRECISION'], column['NUMERIC_SCALE'])
+        elif data_type in ('float', 'double'):
+            arrow_type = pa.float64()
+        elif data_type in ('timestamp', 'datetime'):
+            arrow_type = pa.timestamp('us')
+        elif data_type == 'date':
+            arrow_type = pa.date32()
+        elif data_type in ('blob', 'binary', 'varbinary', 'longblob', 'mediumblob', 'tinyblob'):
+            arrow_type = pa.binary()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column['COLUMN_NAME'], arrow_type))
+    if not fields:
+        raise ValueError(f"La tabla {table} no existe en la base de datos")
+    return pa.schema(fields)
+
+
+def export_table_to_parquet(db, table, path, chunk_rows=None, file_format=None):
+    # Vuelca la tabla completa a Parquet o CSV leyendo con un cursor sin buffer:
+    # en memoria nunca hay más de chunk_rows filas. El formato sale de la extensión.
+    # Si la lectura falla a medias se propaga el error y se borra el archivo parcial.
+    if table not in EXPORTABLE_TABLES:
+        raise ValueError(f"Tabla no exportable: {table}")
+    chunk_rows = chunk_rows or EXPORT_CHUNK_ROWS
+    file_format = file_format or ('csv' if path.lower().endswith('.csv') else 'parquet')
+
+    if file_format not in ('parquet', 'csv'):
+        raise ValueError(f"Formato no soportado: {file_format}")
+
+    rows = db.iter_query(f"SELECT * FROM {table} ORDER BY {EXPORTABLE_TABLES[table]}",
+                         batch_size=chunk_rows, strict=True)
+    total = 0
+    try:
+        if file_format == 'parquet':
+            pa = _arrow()
+            schema = _arrow_schema(db, table)
+            with pa.parquet.ParquetWriter(path, schema) as writer:
+                for chunk in _chunks(rows, chunk_rows):
+                    writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+                    total += len(chunk)
+        else:
+            with open(path, 'w', newline='', encoding='utf-8') as output:
+                header = True
+                for chunk in _chunks(rows, chunk_rows):
+                    pd.DataFrame.from_records(chunk).to_csv(output, header=header, index=False)
+                    header = False
+                    total += len(chunk)
+    except BaseException:
+        logger.error("Exportación de %s interrumpida tras %d filas; se elimina %s", table, total, path)
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    logger.info("%d filas de %s exportadas a %s", total, table, path)
+    return total
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _decimal_column(series):
+    # Valida y normaliza importes DECIMAL(10, 2) sin pasar por float: el texto validado
+    # se convierte a Decimal exacto
+    if pd.api.types.is_numeric_dtype(series):
+        text = series.round(2).map(lambda value: None if pd.isna(value) else f"{value:.2f}")
+    else:
+        text = series.astype('string').str.strip().str.replace(',', '.', regex=False)
+    valid = text.str.fullmatch(_DECIMAL_RE).fillna(False).astype(bool)
+    return text.where(valid).map(lambda value: None if pd.isna(value) else Decimal(value)), valid
+
+
+def validate_products_frame(df):
+    # Coerción vectorizada de un DataFrame de productos. Devuelve (válidos, rechazados);
+    # los rechazados llevan la columna 'error' con el motivo.
+    missing = [column for column in REQUIRED_PRODUCT_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f"Faltan columnas obligatorias: {', '.join(missing)}")
+    df = df.reset_index(drop=True)
+    out = pd.DataFrame(index=df.index)
+    errors = pd.Series(pd.NA, index=df.index, dtype='string')
+
+    def reject(mask, reason):
+        errors.loc[mask & errors.isna()] = reason
+
+    user_id = pd.to_numeric(df['user_id'], errors='coerce')
+    bad_user_id = user_id.isna() | (user_id <= 0) | (user_id % 1 != 0)
+    reject(bad_user_id, 'user_id inválido')
+    # Solo se convierten los válidos: 1.5 no tiene equivalente entero y abortaría el cast
+    out['user_id'] = user_id.where(~bad_user_id).astype('Int64')
+
+    for column in ('name', 'unit'):
+        text = df[column].astype('string').str.strip()
+        limit = 255 if column == 'name' else 50
+        reject(text.isna() | (text.str.len() == 0) | (text.str.len() > limit), f'{column} vacío o demasiado largo')
+        out[column] = text
+
+    for column in ('price', 'quantity'):
+        values, valid = _decimal_column(df[column])
+        reject(~valid, f'{column} no es un DECIMAL(10, 2) válido')
+        out[column] = values
+
+    for column in ('description', 'category'):
+        out[column] = df[column].astype('string').str.strip() if column in df.columns else pd.NA
+    if 'category' in df.columns:
+        reject(out['category'].str.len() > 100, 'category demasiado larga')
+
+    if 'harvest_date' in df.columns:
+        raw = df['harvest_date']
+        parsed = pd.to_datetime(raw, errors='coerce')
+        reject(raw.notna() & (raw.astype('string').str.strip() != '') & parsed.isna(), 'harvest_date inválida')
+        out['harvest_date'] = parsed.dt.date
+    else:
+        out['harvest_date'] = None
+
+    if 'is_organic' in df.columns:
+        text = df['is_organic'].astype('string').str.strip().str.lower().fillna('')
+        is_true = text.isin(_TRUE_VALUES)
+        reject(~is_true & ~text.isin(_FALSE_VALUES), 'is_organic no es booleano')
+        out['is_organic'] = is_true
+    else:
+        out['is_organic'] = False
+
+    for column, bound in (('location_lat', 90), ('location_lng', 180)):
+        if column in df.columns:
+            values = pd.to_numeric(df[column], errors='coerce')
+            reject(df[column].notna() & (values.isna() | (values.abs() > bound)), f'{column} fuera de rango')
+            out[column] = values
+        else:
+            out[column] = None
+
+    bad = errors.notna()
+    rejected = df[bad].assign(error=errors[bad])
+    valid = out[~bad][PRODUCT_COLUMNS].astype(object)
+    return valid.where(valid.notna(), None), rejected
+
+
+def import_products_from_frame(db, df, chunk_size=None, method='executemany', product_model=None):
+    # Valida el DataFrame y carga los productos válidos.
+    # method='executemany': ProductModel.create_products_bulk (INSERT multi-fila por
+    # bloques, con los índices en memoria de product_model al día); devuelve los ids.
+    # method='load_data': LOAD DATA LOCAL INFILE por bloques (requiere allow_local_infile
+    # en la configuración de conexión y local_infile=ON en el servidor); no devuelve ids
+    # ni actualiza los índices en memoria (se reconstruyen con build_*_index).
+    valid, rejected = validate_products_frame(df)
+    if method == 'executemany':
+        products = product_model or ProductModel(db)
+        ids = products.create_products_bulk(valid.to_dict('records'), chunk_size)
+        inserted = len(ids) if ids is not None else 0
+    elif method == 'load_data':
+        ids = None
+        rows = list(valid.itertuples(index=False, name=None))
+        inserted = _load_data_infile(db, 'products', PRODUCT_COLUMNS, rows, chunk_size or EXPORT_CHUNK_ROWS)
+    else:
+        raise ValueError(f"Método de carga no soportado: {method}")
+    logger.info("Productos importados: %d; rechazados: %d", inserted, len(rejected))
+    return {'inserted': inserted, 'ids': ids, 'rejected': rejected}
+
+
+def _load_data_value(value):
+    # \N es NULL para LOAD DATA; los booleanos van como 0/1 y las barras invertidas
+    # del texto se duplican para que no se lean como secuencias de escape
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, str):
+        return value.replace('\\', '\\\\')
+    return value
+
+
+def _load_data_infile(db, table, columns, rows, chunk_size):
+    inserted = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        try:
+            with os.fdopen(handle, 'w', newline='', encoding='utf-8') as output:
+                writer = csv.writer(output, lineterminator='\n')
+                for row in chunk:
+                    writer.writerow([_load_data_value(value) for value in row])
+            escaped = path.replace('\\', '\\\\').replace("'", "\\'")
+            # Escape por defecto (barra invertida): así \N se lee como NULL
+            query = (f"LOAD DATA LOCAL INFILE '{escaped}' INTO TABLE {table} "
+                     f"CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+                     f"LINES TERMINATED BY '\\n' ({', '.join(columns)})")
+            if not db.execute_query(query):
+                logger.warning("Carga interrumpida: %d de %d filas confirmadas", inserted, len(rows))
+                return inserted
+            inserted += len(chunk)
+        finally:
+            os.remove(path)
+    return inserted
+
+
+def import_products_from_file(db, path, chunk_rows=None, method='executemany', product_model=None):
+    # Importa un CSV o Parquet por bloques para no cargar el archivo completo en memoria
+    chunk_rows = chunk_rows or EXPORT_CHUNK_ROWS
+    if path.lower().endswith('.csv'):
+        frames = pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False, na_values=[''])
+    else:
+        parquet = _arrow().parquet.ParquetFile(path)
+        frames = (batch.to_pandas() for batch in parquet.iter_batches(batch_size=chunk_rows))
+    totals = {'inserted': 0, 'rejected': 0}
+    for frame in frames:
+        result = import_products_from_frame(db, frame, chunk_size=BULK_CHUNK_SIZE, method=method,
+                                            product_model=product_model)
+        totals['inserted'] += result['inserted']
+        totals['rejected'] += len(result['rejected'])
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importación y exportación masiva de CampoDigital")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help="Exporta una tabla a Parquet o CSV")
+    export.add_argument('table', choices=sorted(EXPORTABLE_TABLES))
+    export.add_argument('path')
+    export.add_argument('--chunk-rows', type=int, default=EXPORT_CHUNK_ROWS)
+
+    load = commands.add_parser('import-products', help="Importa productos desde Parquet o CSV")
+    load.add_argument('path')
+    load.add_argument('--chunk-rows', type=int, default=EXPORT_CHUNK_ROWS)
+    load.add_argument('--method', choices=['executemany', 'load_data'], default='executemany')
+
+    args = parser.parse_args(argv)
+    configure_logging(json_format=False)
+    db = DatabaseManager()
+    if args.command == 'import-products' and args.method == 'load_data':
+        db.config = dict(db.config, allow_local_infile=True)
+    db.connect()
+    try:
+        if args.command == 'export':
+            export_table_to_parquet(db, args.table, args.path, args.chunk_rows)
+        else:
+            print(import_products_from_file(db, args.path, args.chunk_rows, args.method))
+    finally:
+        db.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# Índice geográfico en memoria para búsquedas de productos cercanos
+import heapq
+import math
+import threading
+
+EARTH_RADIUS_KM = 6371.0088
+# Kilómetros por grado de latitud (aproximación esférica)
+KM_PER_DEGREE = 111.045
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    # Distancia real sobre la esfera entre dos puntos en grados
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lng, radius_km):
+    # Rectángulo (min_lat, max_lat, min_lng, max_lng) que contiene el círculo de búsqueda
+    dlat = radius_km / KM_PER_DEGREE
+    cos_lat = math.cos(math.radians(lat))
+    # Cerca de los polos el círculo cubre todas las longitudes
+    dlng = 180.0 if cos_lat < 1e-6 else min(180.0, radius_km / (KM_PER_DEGREE * cos_lat))
+    return lat - dlat, lat + dlat, lng - dlng, lng + dlng
+
+
+class GridIndex:
+    def __init__(self, cell_km=1.0, bounds=None):
+        # bounds: (min_lat, max_lat, min_lng, max_lng) de la región cargada, o None si es global
+        self.cell_deg = cell_km / KM_PER_DEGREE
+        self.bounds = bounds
+        self._cells = {}
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, item_id):
+        return item_id in self._entries
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    def contains_point(self, lat, lng):
+        if self.bounds is None:
+            return True
+        min_lat, max_lat, min_lng, max_lng = self.bounds
+        return min_lat <= lat <= max_lat and min_lng <= lng <= max_lng
+
+    def covers(self, lat, lng, radius_km):
+        # Indica si el círculo de búsqueda cae completo dentro de la región cargada
+        if self.bounds is None:
+            return True
+        min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+        return self.contains_point(min_lat, min_lng) and self.contains_point(max_lat, max_lng)
+
+    def insert(self, item_id, lat, lng, payload=None):
+        lat, lng = float(lat), float(lng)
+        cell = self._cell(lat, lng)
+        with self._lock:
+            self._discard_locked(item_id)
+            self._entries[item_id] = (lat, lng, cell, payload)
+            self._cells.setdefault(cell, set()).add(item_id)
+
+    def discard(self, item_id):
+        with self._lock:
+            self._discard_locked(item_id)
+
+    def _discard_locked(self, item_id):
+        entry = self._entries.pop(item_id, None)
+        if entry is None:
+            return
+        cell = entry[2]
+        members = self._cells[cell]
+        members.discard(item_id)
+        if not members:
+            del self._cells[cell]
+
+    def nearby(self, lat, lng, radius_km, limit=20, predicate=None):
+        # Devuelve [(distancia_km, id, payload)] ordenado por distancia, revisando
+        # solo las celdas que tocan el rectángulo de búsqueda
+        min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+        row_lo, col_lo = self._cell(min_lat, min_lng)
+        row_hi, col_hi = self._cell(max_lat, max_lng)
+
+        candidates = []
+        with self._lock:
+            for row in range(row_lo, row_hi + 1):
+                for col in range(col_lo, col_hi + 1):
+                    for item_id in self._cells.get((row, col), ()):
+                        item_lat, item_lng, _, payload = self._entries[item_id]
+                        if not (min_lat <= item_lat <= max_lat and min_lng <= item_lng <= max_lng):
+                            continue
+                        if predicate is not None and not predicate(payload):
+                            continue
+                        distance = haversine_km(lat, lng, item_lat, item_lng)
+                        if distance <= radius_km:
+                            candidates.append((distance, item_id, payload))
+        return heapq.nsmallest(limit, candidates, key=lambda c: (c[0], c[1]))
@@ -0,0 +1,307 @@
+# Instrumentación de consultas: latencia, filas, bytes y errores por huella de SQL y por
+# método del modelo que la lanzó, con destinos intercambiables (logs estructurados,
+# texto Prometheus, colector en memoria) y captura de consultas lentas con EXPLAIN.
+import bisect
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Límites superiores (segundos) de los tramos del histograma: de 50 µs a ~100 s,
+# cada tramo un 25 % mayor que el anterior (error de los percentiles < 12,5 %)
+BUCKET_BOUNDS = tuple(0.00005 * 1.25 ** i for i in range(66))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bIN\s*\((?:\s*(?:\?|%s)\s*,?)+\)", re.IGNORECASE)
+_VALUES_RE = re.compile(r"\bVALUES\s*(\([^()]*\))(?:\s*,\s*\([^()]*\))+", re.IGNORECASE)
+_UNION_VALUES_RE = re.compile(r"(SELECT (?:%s|\?)(?: AS \w+)?(?:, (?:%s|\?)(?: AS \w+)?)*)"
+                              r"(?: UNION ALL SELECT (?:%s|\?)(?:, (?:%s|\?))*)+", re.IGNORECASE)
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(query):
+    # Forma normalizada de la consulta: literales como ?, espacios colapsados y listas
+    # IN (...) / VALUES (...), (...) de cualquier longitud reducidas a una sola forma.
+    # Las consultas de los modelos son textos fijos, así que la caché casi siempre acierta.
+    text = _WHITESPACE_RE.sub(' ', query).strip()
+    text = _STRING_RE.sub('?', text)
+    text = _NUMBER_RE.sub('?', text)
+    text = _IN_LIST_RE.sub('IN (...)', text)
+    text = _VALUES_RE.sub(r'VALUES \1, ...', text)
+    text = _UNION_VALUES_RE.sub(r'\1 UNION ALL ...', text)
+    return text
+
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.total += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.total += other.total
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        # Límite superior del tramo que contiene el cuantil (acotado por el máximo visto)
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return min(BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.max, self.max)
+        return self.max
+
+
+class QueryStats:
+    __slots__ = ('histogram', 'rows', 'bytes', 'errors')
+
+    def __init__(self):
+        self.histogram = Histogram()
+        self.rows = 0
+        self.bytes = 0
+        self.errors = 0
+
+    def merge(self, other):
+        self.histogram.merge(other.histogram)
+        self.rows += other.rows
+        self.bytes += other.bytes
+        self.errors += other.errors
+
+    def summary(self):
+        histogram = self.histogram
+        return {
+            'count': histogram.count,
+            'errors': self.errors,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'total_ms': histogram.total * 1000,
+            'p50_ms': histogram.quantile(0.50) * 1000,
+            'p95_ms': histogram.quantile(0.95) * 1000,
+            'p99_ms': histogram.quantile(0.99) * 1000,
+            'max_ms': histogram.max * 1000,
+        }
+
+
+def approximate_bytes(rows):
+    # Tamaño aproximado del resultado: la primera fila medida por el número de filas.
+    # Recorrer todas las celdas costaría más que la propia medición.
+    if not rows:
+        return 0
+    first = rows[0]
+    values = first.values() if isinstance(first, dict) else first
+    size = 0
+    for value in values:
+        if isinstance(value, (str, bytes, bytearray)):
+            size += len(value)
+        elif value is not None:
+            size += 8
+    return size * len(rows)
+
+
+# Funciones de la capa de datos que no cuentan como "quién lanzó la consulta"
+_INTERNAL_NAMES = frozenset({
+    'execute_query', 'execute_many', 'fetch_all', 'fetch_one', 'iter_query', '_iter_query', '_read',
+    '_execute', 'session', '_cached', '_cached_many', '_bulk_insert', '_fetch_keyset', '_update_row', '_with_includes',
+    'load', 'loader', '<lambda>', '<listcomp>', '<dictcomp>', '<genexpr>', '__enter__', '__exit__',
+})
+
+
+class Instrumentation:
+    def __init__(self, sinks=(), slow_query_ms=200.0, slow_query_log_size=100, capture_callers=True):
+        self.sinks = list(sinks)
+        self.slow_query_seconds = slow_query_ms / 1000.0
+        self.capture_callers = capture_callers
+        self.slow_queries = deque(maxlen=slow_query_log_size)
+        self._stats = {}
+        self._callers = {}
+        self._lock = threading.Lock()
+        # Los destinos que quieren cada consulta (no solo lentas y errores)
+        self._all_query_sinks = [sink for sink in self.sinks if getattr(sink, 'all_queries', False)]
+
+    def _caller(self):
+        # Primer marco fuera de la capa de datos, como 'ProductModel.get_product_by_id'.
+        # El resultado se guarda por objeto de código, así que cada marco cuesta un
+        # acceso a diccionario.
+        frame = sys._getframe(3)
+        callers = self._callers
+        while frame is not None:
+            code = frame.f_code
+            name = callers.get(code)
+            if name is None:
+                qualname = getattr(code, 'co_qualname', code.co_name)
+                internal = (code.co_name in _INTERNAL_NAMES or code.co_filename == __file__
+                            or code.co_filename.endswith('contextlib.py'))
+                name = callers[code] = '' if internal else qualname
+            if name:
+                return name
+            frame = frame.f_back
+        return '?'
+
+    def observe(self, query, params, start, rows=None, row_count=None, error=None):
+        # Llamado por DatabaseManager al terminar cada consulta. rows es el resultado
+        # leído (lista de filas) o None en sentencias de escritura.
+        elapsed = time.perf_counter() - start
+        key = (fingerprint(query), self._caller() if self.capture_callers else '?')
+        if rows is not None:
+            row_count = len(rows)
+        size = approximate_bytes(rows)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = QueryStats()
+            stats.histogram.record(elapsed)
+            stats.rows += row_count or 0
+            stats.bytes += size
+            if error is not None:
+                stats.errors += 1
+
+        slow = elapsed >= self.slow_query_seconds
+        if not (slow or error is not None or self._all_query_sinks):
+            return
+        event = {
+            'fingerprint': key[0], 'caller': key[1], 'elapsed_ms': round(elapsed * 1000, 3),
+            'rows': row_count, 'bytes': size, 'slow': slow,
+            'error': str(error) if error is not None else None,
+        }
+        if slow:
+            self.slow_queries.append(dict(event, query=query, params=params))
+        for sink in (self.sinks if slow or error is not None else self._all_query_sinks):
+            try:
+                sink.handle(event)
+            except Exception as e:
+                logging.getLogger('campodigital.queries').error(
+                    "Error en el destino de métricas %s: %s", type(sink).__name__, e)
+
+    def snapshot(self, by='query'):
+        # by='query': por huella; by='caller': por método; by='both': por (huella, método)
+        with self._lock:
+            items = [(key, stats) for key, stats in self._stats.items()]
+        grouped = {}
+        for (query, caller), stats in items:
+            key = {'query': query, 'caller': caller, 'both': (query, caller)}[by]
+            merged = grouped.get(key)
+            if merged is None:
+                merged = grouped[key] = QueryStats()
+            merged.merge(stats)
+        return {key: stats.summary() for key, stats in grouped.items()}
+
+    def top(self, n=10, by='query', order='total_ms'):
+        snapshot = self.snapshot(by)
+        return sorted(snapshot.items(), key=lambda item: item[1][order], reverse=True)[:n]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+        self.slow_queries.clear()
+
+    def explain(self, db, entry=None):
+        # EXPLAIN de una consulta lenta capturada (por defecto la última). Solo SELECT:
+        # explicar escrituras no las ejecuta, pero no aporta para los listados.
+        if entry is None:
+            if not self.slow_queries:
+                return None
+            entry = self.slow_queries[-1]
+        if not entry['query'].lstrip().upper().startswith('SELECT'):
+            return None
+        plan = db.fetch_all("EXPLAIN " + entry['query'], entry['params'])
+        entry['explain'] = plan
+        return plan
+
+    def render_prometheus(self, prefix='campodigital_db'):
+        # Exposición en formato de texto de Prometheus (histogramas acumulativos)
+        with self._lock:
+            items = [(key, stats) for key, stats in self._stats.items()]
+        lines = [
+            f"# TYPE {prefix}_query_duration_seconds histogram",
+            f"# TYPE {prefix}_query_rows_total counter",
+            f"# TYPE {prefix}_query_bytes_total counter",
+            f"# TYPE {prefix}_query_errors_total counter",
+        ]
+        for (query, caller), stats in items:
+            labels = f'query="{_label(query)}",caller="{_label(caller)}"'
+            cumulative = 0
+            for bound, count in zip(BUCKET_BOUNDS, stats.histogram.counts):
+                cumulative += count
+                lines.append(f'{prefix}_query_duration_seconds_bucket{{{labels},le="{bound:.6g}"}} {cumulative}')
+            lines.append(f'{prefix}_query_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.histogram.count}')
+            lines.append(f'{prefix}_query_duration_seconds_sum{{{labels}}} {stats.histogram.total:.6f}')
+            lines.append(f'{prefix}_query_duration_seconds_count{{{labels}}} {stats.histogram.count}')
+            lines.append(f'{prefix}_query_rows_total{{{labels}}} {stats.rows}')
+            lines.append(f'{prefix}_query_bytes_total{{{labels}}} {stats.bytes}')
+            lines.append(f'{prefix}_query_errors_total{{{labels}}} {stats.errors}')
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port=9108, host='0.0.0.0'):
+        # Servidor HTTP en un hilo de fondo que expone /metrics
+        instrumentation = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = instrumentation.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+        return server
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+class LogSink:
+    # Consultas lentas y errores como una línea JSON por evento
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger('campodigital.queries')
+
+    def handle(self, event):
+        level = logging.ERROR if event['error'] else logging.WARNING
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, json.dumps(event, ensure_ascii=False))
+
+
+class MemorySink:
+    # Guarda todos los eventos (también los rápidos); pensado para pruebas
+    all_queries = True
+
+    def __init__(self, max_events=10000):
+        self.events = deque(maxlen=max_events)
+
+    def handle(self, event):
+        self.events.append(event)
+
+    def clear(self):
+        self.events.clear()
@@ -0,0 +1,137 @@
+# Configuración de logging de CampoDigital: registros estructurados (JSON), escritura en
+# un hilo aparte a través de una cola acotada, niveles por módulo y muestreo de los
+# mensajes repetitivos de éxito.
+#   CAMPODIGITAL_LOG_LEVEL=INFO
+#   CAMPODIGITAL_LOG_LEVELS="campodigital.db=DEBUG,campodigital.pool=WARNING"
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+ROOT_LOGGER = 'campodigital'
+
+# Atributos propios de LogRecord; el resto son campos extra= del registro
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    # Deja pasar 1 de cada `every` registros con la misma plantilla de mensaje hasta
+    # max_level; los de nivel superior (avisos y errores) pasan siempre. Cada registro
+    # que pasa lleva sample_rate para poder reconstruir los totales.
+    def __init__(self, every=100, max_level=logging.INFO):
+        super().__init__()
+        self.every = every
+        self.max_level = max_level
+        self._counts = {}
+
+    def filter(self, record):
+        if record.levelno > self.max_level or self.every <= 1:
+            return True
+        key = (record.name, record.msg)
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        if count % self.every:
+            return False
+        record.sample_rate = self.every
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    # Nunca bloquea a quien registra: con la cola llena el registro se descarta y se
+    # cuenta. Solo se resuelve el mensaje (el formateo completo ocurre en el hilo de escritura).
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_handler = None
+
+
+def parse_levels(spec):
+    # "campodigital.db=DEBUG,campodigital.pool=WARNING" -> {nombre: nivel}
+    levels = {}
+    for item in (spec or '').split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level=None, levels=None, json_format=True, stream=None, sample_every=100,
+                      queue_size=10000):
+    # Instala el manejador de cola en el logger 'campodigital' y arranca el hilo que
+    # escribe en stream (stderr por defecto). Se puede llamar de nuevo para reconfigurar.
+    global _listener, _handler
+    shutdown_logging()
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level or os.environ.get('CAMPODIGITAL_LOG_LEVEL', 'INFO').upper())
+    module_levels = parse_levels(os.environ.get('CAMPODIGITAL_LOG_LEVELS'))
+    module_levels.update(levels or {})
+    for name, module_level in module_levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if json_format else
+                        logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    _handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+    if sample_every and sample_every > 1:
+        _handler.addFilter(SamplingFilter(sample_every))
+    root.addHandler(_handler)
+    root.propagate = False
+    _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    return _handler
+
+
+def shutdown_logging():
+    # Vacía la cola y detiene el hilo de escritura
+    global _listener, _handler
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _handler is not None:
+        logging.getLogger(ROOT_LOGGER).removeHandler(_handler)
+        _handler = None
+
+
+atexit.register(shutdown_logging)
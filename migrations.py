@@ -0,0 +1,622 @@
+# CampoDigital - Migraciones versionadas del esquema
+# Cada migración es una lista de pasos (sentencias SQL o funciones que reciben el
+# DatabaseManager) que se aplican en orden y se registran en schema_migrations. MySQL
+# confirma cada DDL por separado, así que los pasos son idempotentes (IF NOT EXISTS o
+# comprobación en INFORMATION_SCHEMA): si una migración se interrumpe basta con volver a
+# ejecutarla. Sirven tanto para una base vacía como para una creada con el database.sql
+# anterior (mensajes colgados de conversations, sin pedidos ni reseñas).
+#   python migrations.py status
+#   python migrations.py migrate [--to VERSION]
+#   python migrations.py check-indexes
+import argparse
+import datetime
+import logging
+import re
+from types import SimpleNamespace
+
+import mysql.connector
+from mysql.connector import Error
+
+from app import (DB_CONFIG, DatabaseManager, MessageModel, OrderModel, ProductModel,
+                 ReviewModel, RollupModel, UserModel, encode_cursor)
+from instrumentation import fingerprint
+from log_config import configure_logging
+from passwords import PasswordHasher
+
+logger = logging.getLogger('campodigital.migrations')
+
+
+class MigrationError(Exception):
+    pass
+
+
+def _run(db, sql, params=None):
+    # Ejecuta y confirma una sentencia; los errores se propagan (a diferencia de
+    # execute_query, que los registra y devuelve False)
+    with db.session() as (connection, cursor):
+        cursor.execute(sql, params or ())
+        connection.commit()
+
+
+def _schema_has(db, table, column=None, index=None):
+    if index is not None:
+        query = """
+        SELECT 1 FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s LIMIT 1
+        """
+        params = (table, index)
+    elif column is not None:
+        query = """
+        SELECT 1 FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+        """
+        params = (table, column)
+    else:
+        query = """
+        SELECT 1 FROM INFORMATION_SCHEMA.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        """
+        params = (table,)
+    with db.session() as (connection, cursor):
+        cursor.execute(query, params)
+        return cursor.fetchone() is not None
+
+
+def add_column(table, column, definition):
+    def step(db):
+        if not _schema_has(db, table, column=column):
+            _run(db, f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    step.__doc__ = f"{table}.{column}"
+    return step
+
+
+def add_index(table, name, columns, kind='INDEX'):
+    # kind: 'INDEX', 'UNIQUE INDEX' o 'FULLTEXT INDEX'
+    def step(db):
+        if not _schema_has(db, table, index=name):
+            _run(db, f"CREATE {kind} {name} ON {table} {columns}")
+    step.__doc__ = f"{table}.{name}"
+    return step
+
+
+def _adapt_legacy_messages(db):
+    # El database.sql anterior guardaba los mensajes por conversación (producto,
+    # comprador, vendedor) con read_at. Los modelos usan mensajes directos con
+    # receiver_id e is_read: se deducen de la conversación y conversation_id pasa a
+    # ser opcional. Las tablas conversations, transactions y ratings se conservan.
+    if not _schema_has(db, 'messages', column='conversation_id'):
+        return
+    add_column('messages', 'receiver_id', 'INT NULL AFTER sender_id')(db)
+    add_column('messages', 'is_read', 'BOOLEAN NOT NULL DEFAULT FALSE AFTER message')(db)
+    _run(db, """
+    UPDATE messages m
+    JOIN conversations c ON c.id = m.conversation_id
+    SET m.receiver_id = IF(m.sender_id = c.buyer_id, c.seller_id, c.buyer_id),
+        m.is_read = m.read_at IS NOT NULL
+    WHERE m.receiver_id IS NULL
+    """)
+    add_index('messages', 'idx_messages_receiver_sender_unread', '(receiver_id, sender_id, is_read)')(db)
+    with db.session() as (connection, cursor):
+        cursor.execute("""
+        SELECT IS_NULLABLE FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'messages' AND COLUMN_NAME = 'receiver_id'
+        """)
+        nullable = cursor.fetchone()['IS_NULLABLE'] == 'YES'
+    if nullable:
+        _run(db, """
+        ALTER TABLE messages
+            MODIFY conversation_id INT NULL,
+            MODIFY receiver_id INT NOT NULL,
+            ADD CONSTRAINT fk_messages_receiver FOREIGN KEY (receiver_id) REFERENCES users(id) ON DELETE CASCADE
+        """)
+
+
+def _rebuild_inbox(db):
+    # Mensajes existentes (base anterior) -> bandeja desnormalizada
+    MessageModel(db, UserModel(db, PasswordHasher(workers=0))).rebuild_conversation_state()
+
+
+MIGRATIONS = [
+    (1, "Usuarios, productos e imágenes", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            email VARCHAR(255) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,  -- scrypt$n$r$p$sal$clave (ver passwords.py)
+            name VARCHAR(255),
+            phone VARCHAR(20),
+            user_type ENUM('agricultor', 'consumidor') NOT NULL,
+            location_lat DECIMAL(10, 8),
+            location_lng DECIMAL(11, 8),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            verified BOOLEAN DEFAULT FALSE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS products (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            price DECIMAL(10, 2) NOT NULL,
+            description TEXT,
+            category VARCHAR(100),
+            quantity DECIMAL(10, 2),
+            unit VARCHAR(50),  -- kg, unidad, bulto, etc.
+            location_lat DECIMAL(10, 8),
+            location_lng DECIMAL(11, 8),
+            status ENUM('available', 'reserved', 'sold') DEFAULT 'available',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS product_images (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            product_id INT NOT NULL,
+            image_url VARCHAR(255) NOT NULL,
+            is_primary BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+        )
+        """,
+    ]),
+    (2, "Columnas de usuarios y productos que usan los modelos", [
+        add_column('users', 'address', 'VARCHAR(255) AFTER location_lng'),
+        add_column('users', 'bio', 'TEXT AFTER address'),
+        add_column('products', 'harvest_date', 'DATE AFTER unit'),
+        add_column('products', 'is_organic', 'BOOLEAN NOT NULL DEFAULT FALSE AFTER harvest_date'),
+    ]),
+    (3, "Pedidos y detalles de pedido", [
+        # Listados paginados por (created_at, id) de comprador y vendedor; created_at y
+        # updated_at para los agregados diarios (días tocados y recálculo de un día)
+        """
+        CREATE TABLE IF NOT EXISTS orders (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            buyer_id INT NOT NULL,
+            seller_id INT NOT NULL,
+            total_amount DECIMAL(12, 2) NOT NULL,
+            status ENUM('pending', 'confirmed', 'shipped', 'delivered', 'cancelled') NOT NULL DEFAULT 'pending',
+            payment_method VARCHAR(50) DEFAULT 'cash',
+            payment_status ENUM('pending', 'completed', 'failed', 'refunded') NOT NULL DEFAULT 'pending',
+            delivery_address VARCHAR(255),
+            delivery_date DATE,
+            notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            KEY idx_orders_buyer_created (buyer_id, created_at, id),
+            KEY idx_orders_seller_created (seller_id, created_at, id),
+            KEY idx_orders_created (created_at),
+            KEY idx_orders_updated (updated_at),
+            FOREIGN KEY (buyer_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (seller_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+        """,
+        # Un producto con ventas no se puede borrar: el historial de pedidos lo necesita
+        """
+        CREATE TABLE IF NOT EXISTS order_details (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            order_id INT NOT NULL,
+            product_id INT NOT NULL,
+            quantity DECIMAL(10, 2) NOT NULL,
+            unit_price DECIMAL(10, 2) NOT NULL,
+            subtotal DECIMAL(12, 2) NOT NULL,
+            FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+        """,
+    ]),
+    (4, "Reseñas y agregados de calificaciones", [
+        """
+        CREATE TABLE IF NOT EXISTS reviews (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            reviewer_id INT NOT NULL,
+            reviewed_id INT NOT NULL,
+            order_id INT NULL,
+            product_id INT NULL,
+            rating TINYINT NOT NULL CHECK (rating BETWEEN 1 AND 5),
+            comment TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            KEY idx_reviews_product_created (product_id, created_at, id),
+            KEY idx_reviews_reviewed_created (reviewed_id, created_at),
+            FOREIGN KEY (reviewer_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (reviewed_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE SET NULL,
+            FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE SET NULL
+        )
+        """,
+        # Agregados por producto y por usuario calificado, actualizados en la misma
+        # transacción que cada reseña (ReviewModel.create_review). Se reconstruyen con:
+        #   python app.py rebuild-ratings
+        """
+        CREATE TABLE IF NOT EXISTS rating_summaries (
+            subject_type ENUM('product', 'user') NOT NULL,
+            subject_id INT NOT NULL,
+            review_count INT NOT NULL DEFAULT 0,
+            rating_sum INT NOT NULL DEFAULT 0,
+            rating_1 INT NOT NULL DEFAULT 0,
+            rating_2 INT NOT NULL DEFAULT 0,
+            rating_3 INT NOT NULL DEFAULT 0,
+            rating_4 INT NOT NULL DEFAULT 0,
+            rating_5 INT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (subject_type, subject_id)
+        )
+        """,
+    ]),
+    (5, "Mensajes directos entre usuarios", [
+        # (receiver_id, sender_id, is_read): marcar como leída una conversación completa
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            sender_id INT NOT NULL,
+            receiver_id INT NOT NULL,
+            message TEXT NOT NULL,
+            is_read BOOLEAN NOT NULL DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            KEY idx_messages_receiver_sender_unread (receiver_id, sender_id, is_read),
+            FOREIGN KEY (sender_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (receiver_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+        """,
+        _adapt_legacy_messages,
+        # Clave canónica del par de usuarios: los dos sentidos de una conversación son un
+        # único rango del índice (MessageModel.get_conversation)
+        add_column('messages', 'user_low', 'INT AS (LEAST(sender_id, receiver_id)) STORED'),
+        add_column('messages', 'user_high', 'INT AS (GREATEST(sender_id, receiver_id)) STORED'),
+        add_index('messages', 'idx_messages_pair', '(user_low, user_high, id)'),
+    ]),
+    (6, "Bandeja de conversaciones", [
+        # Una fila por participante con el último mensaje y sus no leídos. La mantienen
+        # MessageModel.send_message, mark_as_read y mark_conversation_read; se lee con un
+        # recorrido de rango de (user_id, last_message_id). Se reconstruye con:
+        #   python app.py rebuild-inbox
+        """
+        CREATE TABLE IF NOT EXISTS user_conversations (
+            user_id INT NOT NULL,
+            other_user_id INT NOT NULL,
+            last_message_id INT NOT NULL,
+            last_sender_id INT,
+            last_message_preview VARCHAR(255),
+            last_message_at TIMESTAMP NULL,
+            unread_count INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, other_user_id),
+            KEY idx_user_conversations_recent (user_id, last_message_id)
+        )
+        """,
+        _rebuild_inbox,
+    ]),
+    (7, "Agregados diarios de ventas", [
+        # Pedidos no cancelados por día de creación. Los mantiene
+        # RollupModel.refresh_daily_rollups, que solo recalcula los días con pedidos
+        # modificados desde la última marca:
+        #   python app.py refresh-rollups [--full]
+        #   python app.py check-rollups --sample-days 7
+        """
+        CREATE TABLE IF NOT EXISTS seller_daily_sales (
+            day DATE NOT NULL,
+            seller_id INT NOT NULL,
+            orders INT NOT NULL DEFAULT 0,
+            revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            units DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, seller_id),
+            KEY idx_seller_daily_sales_seller (seller_id, day)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS product_daily_sales (
+            day DATE NOT NULL,
+            product_id INT NOT NULL,
+            seller_id INT NOT NULL,
+            orders INT NOT NULL DEFAULT 0,
+            units DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, product_id),
+            KEY idx_product_daily_sales_product (product_id, day)
+        )
+        """,
+        # Hasta dónde (updated_at de orders) llegó cada recarga incremental
+        """
+        CREATE TABLE IF NOT EXISTS rollup_watermarks (
+            name VARCHAR(64) PRIMARY KEY,
+            watermark TIMESTAMP NULL
+        )
+        """,
+    ]),
+    (8, "Índices de usuarios y productos", [
+        add_index('users', 'idx_users_type', '(user_type)'),
+        add_index('products', 'idx_products_location', '(location_lat, location_lng)'),
+        # Paginación por cursor (created_at, id): cada página es un recorrido de rango
+        add_index('products', 'idx_products_status_created', '(status, created_at, id)'),
+        add_index('products', 'idx_products_category_created', '(category, status, created_at, id)'),
+        # Búsqueda por texto (ProductModel.search); la intercalación por defecto
+        # utf8mb4_0900_ai_ci hace que 'organico' encuentre 'orgánico'
+        add_index('products', 'idx_products_fulltext', '(name, description, category)', 'FULLTEXT INDEX'),
+    ]),
+    (9, "Pedidos con inventario reservado", [
+        # Lo marca place_order; cancel_order solo devuelve inventario de estos pedidos.
+        # Los pedidos anteriores quedan en FALSE: nunca descontaron existencias.
+        add_column('orders', 'stock_reserved', 'BOOLEAN NOT NULL DEFAULT FALSE AFTER payment_status'),
+    ]),
+]
+
+
+class MigrationRunner:
+    def __init__(self, db, migrations=MIGRATIONS):
+        versions = [version for version, _, _ in migrations]
+        if versions != sorted(set(versions)):
+            raise ValueError("Las versiones de las migraciones deben ser únicas y crecientes")
+        self.db = db
+        self.migrations = migrations
+
+    def _ensure_table(self):
+        _run(self.db, """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+
+    def applied(self):
+        # {versión: fecha de aplicación}
+        self._ensure_table()
+        rows = self.db.fetch_all("SELECT version, applied_at FROM schema_migrations")
+        return {row['version']: row['applied_at'] for row in rows}
+
+    def pending(self, target=None):
+        applied = self.applied()
+        return [migration for migration in self.migrations
+                if migration[0] not in applied and (target is None or migration[0] <= target)]
+
+    def migrate(self, target=None):
+        # Aplica en orden las migraciones pendientes hasta target (incluida) y devuelve
+        # las versiones aplicadas. Una migración se registra solo si todos sus pasos terminan.
+        done = []
+        for version, description, steps in self.pending(target):
+            logger.info("Aplicando migración %d: %s", version, description)
+            for step in steps:
+                try:
+                    if callable(step):
+                        step(self.db)
+                    else:
+                        _run(self.db, step)
+                except Error as e:
+                    raise MigrationError(f"Migración {version} ({description}) interrumpida: {e}") from e
+            _run(self.db, "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                 (version, description))
+            done.append(version)
+        return done
+
+    def status(self):
+        applied = self.applied()
+        return [(version, description, applied.get(version)) for version, description, _ in self.migrations]
+
+
+def ensure_database(config=DB_CONFIG):
+    # Crea la base de datos de config si no existe (la conexión normal la requiere)
+    server_config = {key: value for key, value in config.items() if key != 'database'}
+    connection = mysql.connector.connect(**server_config)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{config['database']}`")
+        cursor.close()
+    finally:
+        connection.close()
+
+
+class _NoopCursor:
+    # Resultado simulado de una escritura no ejecutada: una fila afectada
+    rowcount = 1
+    lastrowid = 1
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+
+class _RecordingDatabaseManager(DatabaseManager):
+    # Registra cada sentencia de los modelos. Las lecturas se ejecutan (los métodos
+    # siguen su flujo normal con los datos que haya); las escrituras no, y cuentan como
+    # una fila afectada para que se recorran también las ramas que dependen de ello.
+    def __init__(self, config=DB_CONFIG):
+        super().__init__(config)
+        self.label = None
+        self.statements = []
+
+    def _execute(self, connection, cursor, query, params):
+        self.statements.append((self.label, query, params))
+        if query.lstrip().upper().startswith('SELECT'):
+            return super()._execute(connection, cursor, query, params)
+        return _NoopCursor()
+
+    def execute_many(self, query, params_list):
+        self.statements.append((self.label, query, params_list[0] if params_list else None))
+        self._local.last_insert_id = 1
+        return True
+
+    def iter_query(self, query, params=None, batch_size=None, strict=False):
+        self.statements.append((self.label, query, params))
+        return iter(())
+
+
+def _incremental_refresh(models):
+    # Camino incremental de refresh_daily_rollups (con marca), aunque la base de la
+    # comprobación aún no tenga ninguna: la primera recarga recorre todo el historial
+    rollups = models.rollups
+    rollups.db.fetch_one("SELECT MAX(updated_at) AS watermark FROM orders")
+    rollups._get_watermark()
+    rollups._touched_days(datetime.datetime.now())
+
+
+# Métodos de los modelos que recorre check_index_coverage, con argumentos de ejemplo.
+# Las reconstrucciones completas (rebuild_*, check_daily_rollups, refresh con full=True)
+# recorren tablas enteras a propósito y no se incluyen.
+COVERAGE_CHECKS = [
+    ('UserModel.get_user_by_id', lambda m: m.users.get_user_by_id(1)),
+    ('UserModel.get_user_by_email', lambda m: m.users.get_user_by_email('agricultor1@example.com')),
+    ('UserModel.get_user_names_many', lambda m: m.users.get_user_names_many([1, 2])),
+    ('UserModel.get_all_farmers', lambda m: m.users.get_all_farmers()),
+    ('UserModel.update_user', lambda m: m.users.update_user(1, name='Nombre')),
+    ('UserModel.REHASH_QUERY', lambda m: m.db.execute_query(UserModel.REHASH_QUERY, ('hash', 1, 'anterior'))),
+    ('ProductModel.get_product_by_id', lambda m: m.products.get_product_by_id(1)),
+    ('ProductModel.get_products_by_user', lambda m: m.products.get_products_by_user(1)),
+    ('ProductModel.get_available_products',
+     lambda m: m.products.get_available_products(limit=20, include=('images', 'rating'))),
+    ('ProductModel.get_available_products (cursor)',
+     lambda m: m.products.get_available_products(limit=20, after=encode_cursor(datetime.datetime.now(), 1000))),
+    ('ProductModel.get_products_by_category',
+     lambda m: m.products.get_products_by_category('Verduras', limit=20, after=encode_cursor(datetime.datetime.now(), 1000))),
+    ('ProductModel.iter_available_products', lambda m: m.products.iter_available_products()),
+    ('ProductModel.iter_products_by_category', lambda m: m.products.iter_products_by_category('Verduras')),
+    ('ProductModel.find_nearby', lambda m: m.products.find_nearby(4.6097, -74.0817, 5)),
+    ('ProductModel.search', lambda m: m.products.search('tomate orgánico', {'max_price': 10000})),
+    ('ProductModel.get_product_images', lambda m: m.products.get_product_images(1)),
+    ('ProductModel.get_product_images_many', lambda m: m.products.get_product_images_many([1, 2])),
+    ('ProductModel.update_product', lambda m: m.products.update_product(1, price=1000)),
+    ('ProductModel.delete_product', lambda m: m.products.delete_product(1)),
+    ('ProductModel.reserve_stock', lambda m: m.products.reserve_stock([{'product_id': 1, 'quantity': 1}])),
+    ('ProductModel.release_stock', lambda m: m.products.release_stock([{'product_id': 1, 'quantity': 1}])),
+    ('ProductModel.mark_sold_out', lambda m: m.products.mark_sold_out([1, 2])),
+    ('OrderModel.get_order_by_id', lambda m: m.orders.get_order_by_id(1)),
+    ('OrderModel.get_order_details', lambda m: m.orders.get_order_details(1)),
+    ('OrderModel.get_order_details_many', lambda m: m.orders.get_order_details_many([1, 2])),
+    ('OrderModel.get_orders_by_buyer',
+     lambda m: m.orders.get_orders_by_buyer(2, limit=20, after=encode_cursor(datetime.datetime.now(), 1000))),
+    ('OrderModel.get_orders_by_seller', lambda m: m.orders.get_orders_by_seller(1, limit=20)),
+    ('OrderModel.update_order_status', lambda m: m.orders.update_order_status(1, 'confirmed')),
+    ('OrderModel.update_payment_status', lambda m: m.orders.update_payment_status(1, 'completed')),
+    ('OrderModel.cancel_order', lambda m: m.orders.cancel_order(1)),
+    ('OrderModel.complete_order', lambda m: m.orders.complete_order(1)),
+    ('ReviewModel.get_reviews_by_product', lambda m: m.reviews.get_reviews_by_product(1, limit=20)),
+    ('ReviewModel.get_reviews_by_user', lambda m: m.reviews.get_reviews_by_user(1)),
+    ('ReviewModel.get_rating_summary_by_user', lambda m: m.reviews.get_rating_summary_by_user(1)),
+    ('ReviewModel.get_rating_summaries_many', lambda m: m.reviews.get_rating_summaries_many([1, 2])),
+    ('RollupModel.refresh_daily_rollups', _incremental_refresh),
+    ('RollupModel.refresh_day', lambda m: m.rollups.refresh_day(datetime.date.today())),
+    ('RollupModel.get_seller_daily_sales',
+     lambda m: m.rollups.get_seller_daily_sales(1, datetime.date.today() - datetime.timedelta(days=30),
+                                                datetime.date.today())),
+    ('RollupModel.get_seller_monthly_sales',
+     lambda m: m.rollups.get_seller_monthly_sales(1, datetime.date(2020, 1, 1), datetime.date.today())),
+    ('RollupModel.get_product_daily_sales',
+     lambda m: m.rollups.get_product_daily_sales(1, datetime.date(2020, 1, 1), datetime.date.today())),
+    ('MessageModel.send_message', lambda m: m.messages.send_message(2, 1, 'Hola')),
+    ('MessageModel.get_conversation', lambda m: m.messages.get_conversation(1, 2)),
+    ('MessageModel.get_conversation (before)', lambda m: m.messages.get_conversation(1, 2, before=1000)),
+    ('MessageModel.get_conversation (since_id)', lambda m: m.messages.get_conversation(1, 2, since_id=1)),
+    ('MessageModel.mark_as_read', lambda m: m.messages.mark_as_read(1)),
+    ('MessageModel.mark_conversation_read', lambda m: m.messages.mark_conversation_read(1, 2)),
+    ('MessageModel.get_unread_messages_count', lambda m: m.messages.get_unread_messages_count(1)),
+    ('MessageModel.get_inbox', lambda m: m.messages.get_inbox(1, after=encode_cursor(datetime.datetime.now(), 1000))),
+]
+
+
+# Recorridos completos aceptados: (método, tabla) -> motivo, con la tabla como la muestra
+# EXPLAIN (el alias si la consulta lo usa). Cualquier otro type=ALL sobre una tabla base
+# hace fallar la comprobación.
+FULL_SCAN_ALLOWED = {
+    ('UserModel.get_all_farmers', 'users'):
+        "devuelve una fracción grande de la tabla; user_type solo tiene dos valores",
+    ('ProductModel.iter_available_products', 'p'):
+        "recorrido por lotes de todo el catálogo disponible",
+}
+
+# Por debajo de estas filas el plan de una tabla no es representativo: el optimizador
+# prefiere leerla entera aunque tenga un índice adecuado
+SMALL_TABLE_ROWS = 1000
+
+
+def check_index_coverage(db, checks=COVERAGE_CHECKS, allowed=FULL_SCAN_ALLOWED):
+    # Recorre los métodos de los modelos, hace EXPLAIN de cada sentencia distinta y
+    # devuelve las que leen una tabla base completa (type=ALL), salvo las de allowed.
+    # Con tablas pequeñas el optimizador elige recorridos completos aunque haya índice:
+    # hay que ejecutarla contra una base con volúmenes representativos (cada problema
+    # lleva table_rows para distinguirlo). db debe ser un _RecordingDatabaseManager conectado.
+    hasher = PasswordHasher(workers=0)
+    users = UserModel(db, hasher)
+    products = ProductModel(db)
+    models = SimpleNamespace(
+        db=db, users=users, products=products, orders=OrderModel(db, products),
+        reviews=ReviewModel(db), rollups=RollupModel(db), messages=MessageModel(db, users))
+    for label, call in checks:
+        db.label = label
+        call(models)
+
+    problems = []
+    seen = set()
+    for label, query, params in db.statements:
+        key = fingerprint(query)
+        if key in seen or key.upper().startswith('INSERT INTO') and 'SELECT' not in key.upper():
+            continue
+        seen.add(key)
+        with db.session() as (connection, cursor):
+            cursor.execute("EXPLAIN " + query, params or ())
+            plan = cursor.fetchall()
+        for row in plan:
+            table = row.get('table') or ''
+            if row.get('type') != 'ALL' or table.startswith('<'):
+                continue
+            problems.append({'caller': label, 'table': table, 'query': key,
+                             'possible_keys': row.get('possible_keys'), 'rows': row.get('rows')})
+    problems = [problem for problem in problems if (problem['caller'], problem['table']) not in allowed]
+    if problems:
+        sizes = {row['TABLE_NAME']: row['TABLE_ROWS'] for row in db.fetch_all("""
+        SELECT TABLE_NAME, TABLE_ROWS FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_SCHEMA = DATABASE()
+        """)}
+        for problem in problems:
+            problem['table_rows'] = sizes.get(_table_for_alias(problem['query'], problem['table']))
+    return problems
+
+
+def _table_for_alias(query, name):
+    # EXPLAIN muestra el alias ('p' en "FROM products p"); se busca la tabla que lo define
+    match = re.search(rf"\b(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?{re.escape(name)}\b", query, re.IGNORECASE)
+    return match.group(1) if match else name
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migraciones del esquema de CampoDigital")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status', help="Migraciones aplicadas y pendientes")
+    command = commands.add_parser('migrate', help="Aplica las migraciones pendientes")
+    command.add_argument('--to', type=int, help="Última versión a aplicar")
+    commands.add_parser('check-indexes', help="EXPLAIN de las consultas de los modelos; falla si alguna "
+                                              "recorre una tabla completa")
+    args = parser.parse_args(argv)
+
+    configure_logging(json_format=False)
+    if args.command == 'migrate':
+        ensure_database()
+    db = _RecordingDatabaseManager() if args.command == 'check-indexes' else DatabaseManager()
+    if not db.connect():
+        return 1
+    try:
+        if args.command == 'status':
+            for version, description, applied_at in MigrationRunner(db).status():
+                print(f"{version:4d} {'aplicada ' + str(applied_at) if applied_at else 'pendiente':<30} {description}")
+            return 0
+        if args.command == 'migrate':
+            done = MigrationRunner(db).migrate(args.to)
+            print(f"Migraciones aplicadas: {done or 'ninguna'}")
+            return 0
+        problems = check_index_coverage(db)
+        for problem in problems:
+            print(f"- {problem['caller']}: recorrido completo de {problem['table']} "
+                  f"(índices posibles: {problem['possible_keys'] or 'ninguno'})\n    {problem['query']}")
+        small = sorted({problem['table'] for problem in problems
+                        if problem['table_rows'] is not None and problem['table_rows'] < SMALL_TABLE_ROWS})
+        if small:
+            print(f"Aviso: {', '.join(small)} tienen menos de {SMALL_TABLE_ROWS} filas; con datos "
+                  f"representativos el plan puede usar el índice")
+        print(f"Sentencias revisadas: {len({fingerprint(query) for _, query, _ in db.statements})}; "
+              f"recorridos completos: {len(problems)}")
+        return 1 if problems else 0
+    finally:
+        db.disconnect()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,206 @@
+# Notificaciones en tiempo real: los modelos publican eventos (mensajes nuevos, cambios
+# de estado de pedidos) y los clientes los esperan con long-poll en lugar de consultar
+# MySQL periódicamente.
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+logger = logging.getLogger('campodigital.notifications')
+
+
+class FanOutLimitError(Exception):
+    def __init__(self, user_id, limit):
+        super().__init__(f"El usuario {user_id} ya tiene {limit} esperas abiertas")
+        self.user_id = user_id
+        self.limit = limit
+
+
+class _UserChannel:
+    __slots__ = ('events', 'waiters', 'dropped_upto')
+
+    def __init__(self, buffer_size, dropped_upto):
+        self.events = deque(maxlen=buffer_size)  # (seq, evento)
+        self.waiters = set()                     # (loop, future)
+        # Secuencia del último evento descartado: un cursor anterior perdió eventos
+        self.dropped_upto = dropped_upto
+
+
+class Broker:
+    # Distribuidor en proceso. Cada usuario tiene un búfer circular de sus últimos
+    # eventos con número de secuencia; un cliente pide "lo posterior a mi cursor" y,
+    # si no hay nada, espera hasta que llegue un evento o venza el plazo.
+    # Contrapresión: el búfer es acotado, así que un cliente lento no retiene memoria;
+    # si su cursor quedó fuera del búfer se le responde reset=True para que recargue
+    # desde la base de datos (get_inbox). publish() es seguro desde cualquier hilo.
+    def __init__(self, buffer_size=100, max_waiters_per_user=8, max_users=100000,
+                 max_batch=50, relay=None):
+        self.buffer_size = buffer_size
+        self.max_waiters_per_user = max_waiters_per_user
+        self.max_users = max_users
+        self.max_batch = max_batch
+        self.relay = relay
+        self._channels = OrderedDict()
+        self._seq = itertools.count(1)
+        self._last_seq = 0
+        self._forgotten_upto = 0
+        self._lock = threading.Lock()
+        self._stats = {'published': 0, 'delivered': 0, 'dropped': 0, 'rejected': 0,
+                       'polls': 0, 'timeouts': 0}
+        if relay is not None:
+            relay.attach(self)
+
+    def publish(self, user_id, event):
+        # Con un relay (Redis) el evento pasa por él y vuelve a cada proceso por deliver()
+        if self.relay is not None:
+            self.relay.publish(user_id, event)
+        else:
+            self.deliver(user_id, event)
+
+    def deliver(self, user_id, event):
+        with self._lock:
+            seq = next(self._seq)
+            self._last_seq = seq
+            channel = self._channel(user_id)
+            if len(channel.events) == channel.events.maxlen:
+                channel.dropped_upto = channel.events[0][0]
+                self._stats['dropped'] += 1
+            channel.events.append((seq, event))
+            waiters = channel.waiters
+            channel.waiters = set()
+            self._stats['published'] += 1
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+        return seq
+
+    def _channel(self, user_id):
+        # Se llama con el lock tomado. Los canales sin esperas se olvidan por LRU al
+        # superar max_users; su última secuencia pasa a _forgotten_upto.
+        channel = self._channels.get(user_id)
+        if channel is None:
+            channel = self._channels[user_id] = _UserChannel(self.buffer_size, self._forgotten_upto)
+            while len(self._channels) > self.max_users:
+                oldest_id, oldest = next(iter(self._channels.items()))
+                if oldest.waiters:
+                    break
+                del self._channels[oldest_id]
+                if oldest.events:
+                    self._forgotten_upto = max(self._forgotten_upto, oldest.events[-1][0])
+        else:
+            self._channels.move_to_end(user_id)
+        return channel
+
+    def _collect(self, user_id, after):
+        # Se llama con el lock tomado
+        channel = self._channels.get(user_id)
+        dropped_upto = channel.dropped_upto if channel else self._forgotten_upto
+        events = [(seq, event) for seq, event in (channel.events if channel else ()) if seq > after]
+        return events[:self.max_batch], after < dropped_upto
+
+    async def poll(self, user_id, after=None, timeout=25.0):
+        # Long-poll: devuelve {'events', 'cursor', 'reset'}. Sin cursor solo se esperan
+        # eventos futuros. Lanza FanOutLimitError si el usuario ya tiene demasiadas esperas.
+        loop = asyncio.get_running_loop()
+        future = None
+        with self._lock:
+            self._stats['polls'] += 1
+            if after is None:
+                after = self._last_seq
+            events, reset = self._collect(user_id, after)
+            if not events and not reset:
+                channel = self._channel(user_id)
+                if len(channel.waiters) >= self.max_waiters_per_user:
+                    self._stats['rejected'] += 1
+                    raise FanOutLimitError(user_id, self.max_waiters_per_user)
+                future = loop.create_future()
+                channel.waiters.add((loop, future))
+
+        if future is not None:
+            try:
+                await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self._stats['timeouts'] += 1
+            finally:
+                with self._lock:
+                    channel = self._channels.get(user_id)
+                    if channel is not None:
+                        channel.waiters.discard((loop, future))
+            with self._lock:
+                events, reset = self._collect(user_id, after)
+
+        with self._lock:
+            self._stats['delivered'] += len(events)
+        cursor = events[-1][0] if events else after
+        return {'events': [event for _, event in events], 'cursor': cursor, 'reset': reset}
+
+    async def stream(self, user_id, after=None, timeout=25.0):
+        # Generador asíncrono para un WebSocket o SSE: encadena long-polls y entrega
+        # cada lote de eventos del usuario (los lotes vacíos sirven de keep-alive)
+        while True:
+            result = await self.poll(user_id, after, timeout)
+            after = result['cursor']
+            yield result
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, users=len(self._channels),
+                        waiters=sum(len(channel.waiters) for channel in self._channels.values()))
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class RedisRelay:
+    # Reparte los eventos entre procesos por Redis pub/sub: publish() envía al canal del
+    # usuario y un hilo suscrito entrega cada mensaje al Broker local con deliver()
+    def __init__(self, client=None, url='redis://localhost:6379/0', prefix='campodigital:events:'):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise ImportError("RedisRelay requiere el paquete 'redis' (pip install redis)") from e
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self._broker = None
+        self._thread = None
+        self._pubsub = None
+
+    def attach(self, broker):
+        self._broker = broker
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.psubscribe(self.prefix + '*')
+        self._thread = threading.Thread(target=self._listen, name='redis-relay', daemon=True)
+        self._thread.start()
+
+    def publish(self, user_id, event):
+        self.client.publish(f"{self.prefix}{user_id}", json.dumps(event, default=str))
+
+    def _listen(self):
+        while self._pubsub is not None:
+            try:
+                message = self._pubsub.get_message(timeout=1.0)
+            except Exception as e:
+                logger.error("Error en la suscripción a Redis: %s", e)
+                time.sleep(1.0)
+                continue
+            if message is None:
+                continue
+            channel = message['channel']
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            user_id = channel[len(self.prefix):]
+            self._broker.deliver(int(user_id) if user_id.isdigit() else user_id, json.loads(message['data']))
+
+    def close(self):
+        pubsub, self._pubsub = self._pubsub, None
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        if pubsub is not None:
+            pubsub.close()
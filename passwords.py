@@ -0,0 +1,192 @@
+# Hash de contraseñas con scrypt (hashlib, sin dependencias externas) y sal por usuario.
+# El cálculo cuesta decenas de milisegundos a propósito, así que se hace en un pool de
+# procesos acotado y no en los hilos que atienden peticiones; con demasiadas operaciones
+# en cola se rechaza (HashingBusyError) en lugar de alargar la espera de todos.
+# Formato guardado: scrypt$n$r$p$sal$clave (base64). Los hashes SHA-256 antiguos
+# (64 caracteres hexadecimales, sin sal) se reconocen y se sustituyen al iniciar sesión.
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+# Coste por defecto: ~16 MB de memoria y unas decenas de ms por hash en un núcleo
+# actual. Ajustar con `python benchmarks.py hash-tuning`.
+SCRYPT_PARAMS = {'n': 2 ** 14, 'r': 8, 'p': 1}
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+_LEGACY_RE = re.compile(r"[0-9a-f]{64}")
+
+
+class HashingBusyError(Exception):
+    def __init__(self, limit):
+        super().__init__(f"Demasiadas operaciones de hash en cola (límite {limit})")
+        self.limit = limit
+
+
+def _scrypt(password, salt, n, r, p, key_bytes=KEY_BYTES):
+    # Función de módulo para poder enviarla a los procesos del pool
+    return hashlib.scrypt(password, salt=salt, n=n, r=r, p=p, dklen=key_bytes,
+                          maxmem=128 * r * (n + p + 2) + (1 << 20))
+
+
+def _b64encode(raw):
+    return base64.b64encode(raw).decode().rstrip('=')
+
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def _parse(stored_hash):
+    # scrypt$n$r$p$sal$clave -> (n, r, p, sal, clave); None si no tiene ese formato
+    parts = stored_hash.split('$') if stored_hash else ()
+    if len(parts) != 6 or parts[0] != 'scrypt':
+        return None
+    try:
+        return int(parts[1]), int(parts[2]), int(parts[3]), _b64decode(parts[4]), _b64decode(parts[5])
+    except ValueError:
+        return None
+
+
+def is_legacy_hash(stored_hash):
+    return bool(stored_hash) and _LEGACY_RE.fullmatch(stored_hash) is not None
+
+
+def _process_context():
+    # forkserver evita heredar los hilos y sockets del proceso principal al crear
+    # los procesos del pool; spawn donde no existe (Windows)
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class PasswordHasher:
+    # workers=0 calcula en el hilo que llama (scripts, pruebas). max_pending limita las
+    # operaciones en curso más las que esperan un proceso libre.
+    def __init__(self, n=SCRYPT_PARAMS['n'], r=SCRYPT_PARAMS['r'], p=SCRYPT_PARAMS['p'],
+                 workers=None, max_pending=64, salt_bytes=SALT_BYTES):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_pending = max_pending
+        self.salt_bytes = salt_bytes
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {'hashes': 0, 'verifications': 0, 'failures': 0, 'legacy': 0, 'rejected': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=_process_context())
+            return self._executor
+
+    def _submit(self, password, salt, n, r, p):
+        # Future con la clave derivada; sin hueco en la cola se rechaza al momento
+        if not self.workers:
+            future = Future()
+            future.set_result(_scrypt(password, salt, n, r, p))
+            return future
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise HashingBusyError(self.max_pending)
+        try:
+            future = self._pool().submit(_scrypt, password, salt, n, r, p)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _encode(self, salt, key):
+        return f"scrypt${self.n}${self.r}${self.p}${_b64encode(salt)}${_b64encode(key)}"
+
+    def _start_verify(self, stored_hash, password):
+        # (future con la clave derivada, clave esperada), o (None, resultado) si se
+        # resuelve sin scrypt (hash antiguo o con formato desconocido)
+        self._count('verifications')
+        if is_legacy_hash(stored_hash):
+            self._count('legacy')
+            legacy = hashlib.sha256(password.encode()).hexdigest()
+            return None, hmac.compare_digest(legacy, stored_hash)
+        parsed = _parse(stored_hash)
+        if parsed is None:
+            return None, False
+        n, r, p, salt, expected = parsed
+        return self._submit(password.encode(), salt, n, r, p), expected
+
+    def _finish_verify(self, key, expected):
+        matches = hmac.compare_digest(key, expected)
+        if not matches:
+            self._count('failures')
+        return matches
+
+    def hash(self, password):
+        salt = os.urandom(self.salt_bytes)
+        key = self._submit(password.encode(), salt, self.n, self.r, self.p).result()
+        self._count('hashes')
+        return self._encode(salt, key)
+
+    async def hash_async(self, password):
+        salt = os.urandom(self.salt_bytes)
+        key = await asyncio.wrap_future(self._submit(password.encode(), salt, self.n, self.r, self.p))
+        self._count('hashes')
+        return self._encode(salt, key)
+
+    def verify(self, stored_hash, password):
+        # Comparación en tiempo constante; acepta también hashes SHA-256 antiguos
+        future, expected = self._start_verify(stored_hash, password)
+        if future is None:
+            return expected
+        return self._finish_verify(future.result(), expected)
+
+    async def verify_async(self, stored_hash, password):
+        future, expected = self._start_verify(stored_hash, password)
+        if future is None:
+            return expected
+        return self._finish_verify(await asyncio.wrap_future(future), expected)
+
+    def needs_rehash(self, stored_hash):
+        # Hashes antiguos o calculados con otros parámetros de coste
+        parsed = _parse(stored_hash)
+        return parsed is None or parsed[:3] != (self.n, self.r, self.p)
+
+    def warm_up(self):
+        # Arranca los procesos del pool para que el primer inicio de sesión no lo pague
+        futures = [self._submit(b'', b'warm-up', 2, 1, 1) for _ in range(min(self.workers, self.max_pending))]
+        for future in futures:
+            future.result()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, workers=self.workers, max_pending=self.max_pending,
+                        n=self.n, r=self.r, p=self.p)
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+_default_hasher = None
+_default_lock = threading.Lock()
+
+
+def default_hasher():
+    # Servicio compartido por los modelos del proceso; los procesos se crean al primer uso
+    global _default_hasher
+    with _default_lock:
+        if _default_hasher is None:
+            _default_hasher = PasswordHasher()
+        return _default_hasher
@@ -0,0 +1,27 @@
+# Las pruebas que necesitan MySQL usan la base CAMPODIGITAL_TEST_DATABASE (por defecto
+# campodigital_test) con el resto de DB_CONFIG, migrada con migrations.py. Sin servidor
+# se omiten; las demás no usan la base de datos.
+import os
+
+import pytest
+from mysql.connector import Error
+
+from app import DB_CONFIG, DatabaseManager
+from migrations import MigrationRunner, ensure_database
+
+
+@pytest.fixture(scope='session')
+def mysql_config():
+    config = dict(DB_CONFIG, database=os.environ.get('CAMPODIGITAL_TEST_DATABASE', 'campodigital_test'))
+    try:
+        ensure_database(config)
+    except Error as e:
+        pytest.skip(f"MySQL no disponible: {e}")
+    db = DatabaseManager(config)
+    if not db.connect():
+        pytest.skip("MySQL no disponible")
+    try:
+        MigrationRunner(db).migrate()
+    finally:
+        db.disconnect()
+    return config
@@ -0,0 +1,204 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+import async_app
+from app import OrderModel, ProductModel
+from async_app import AsyncDatabaseManager, AsyncMessageModel, AsyncOrderModel, AsyncProductModel
+from cache import LRUCache
+
+# session() pide un aiomysql.DictCursor
+needs_aiomysql = pytest.mark.skipif(async_app.aiomysql is None, reason="aiomysql no está instalado")
+
+
+class FakeCursor:
+    async def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.pings = 0
+
+    async def ping(self, reconnect=False):
+        self.pings += 1
+
+    async def cursor(self, cursor_class=None):
+        return FakeCursor()
+
+    def get_transaction_status(self):
+        return False
+
+
+class FakePool:
+    def __init__(self):
+        self.connection = FakeConnection()
+
+    async def acquire(self):
+        return self.connection
+
+    def release(self, connection):
+        pass
+
+
+def _manager(**pool_config):
+    db = AsyncDatabaseManager(pool_config=pool_config)
+    db.pool = FakePool()
+    return db
+
+
+@needs_aiomysql
+def test_recently_released_connection_is_not_pinged():
+    db = _manager(health_check_after=5.0)
+
+    async def checkouts():
+        for _ in range(5):
+            async with db.session():
+                pass
+
+    asyncio.run(checkouts())
+    # Solo la primera vez, cuando aún no se sabe cuándo se devolvió
+    assert db.pool.connection.pings == 1
+    assert db._stats['health_checks'] == 1 and db._stats['checkouts'] == 5
+
+
+@needs_aiomysql
+def test_idle_connection_is_pinged(monkeypatch):
+    db = _manager(health_check_after=5.0)
+    clock = [100.0]
+    monkeypatch.setattr(async_app.time, 'monotonic', lambda: clock[0])
+
+    async def checkout():
+        async with db.session():
+            pass
+
+    asyncio.run(checkout())
+    clock[0] += 1.0
+    asyncio.run(checkout())
+    clock[0] += 10.0
+    asyncio.run(checkout())
+    assert db.pool.connection.pings == 2
+
+
+@needs_aiomysql
+def test_health_check_disabled():
+    db = _manager(health_check=False)
+
+    async def checkout():
+        async with db.session():
+            pass
+
+    asyncio.run(checkout())
+    assert db.pool.connection.pings == 0
+
+
+class FakeAsyncDb:
+    # Registra las sentencias; row_count es el resultado de cada UPDATE condicional
+    cache = None
+
+    def __init__(self, row_count=1, details=()):
+        self.row_count = row_count
+        self.details = list(details)
+        self.queries = []
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield None
+
+    def in_transaction(self):
+        return True
+
+    def after_commit(self, callback):
+        callback()
+
+    async def execute_query(self, query, params=None):
+        self.queries.append((query, tuple(params or ())))
+        return True
+
+    async def fetch_all(self, query, params=None):
+        return [dict(detail) for detail in self.details]
+
+    async def fetch_one(self, query, params=None):
+        return {'buyer_id': 1, 'seller_id': 2, 'stock_reserved': True}
+
+    def get_last_row_count(self):
+        return self.row_count
+
+
+def test_complete_order_marks_depleted_products_sold():
+    db = FakeAsyncDb(details=[{'product_id': 9, 'quantity': 1}, {'product_id': 4, 'quantity': 2}])
+    orders = AsyncOrderModel(db)
+    assert asyncio.run(orders.complete_order(7))
+    (complete, complete_params), (sold_out, sold_out_params) = db.queries
+    assert complete == OrderModel.COMPLETE_ORDER_QUERY and complete_params == (7,)
+    assert sold_out == ProductModel.MARK_SOLD_OUT_QUERY.format(placeholders="%s, %s")
+    assert sold_out_params == (4, 9)
+
+
+def test_complete_order_skips_cancelled_or_delivered_orders():
+    db = FakeAsyncDb(row_count=0, details=[{'product_id': 9, 'quantity': 1}])
+    assert not asyncio.run(AsyncOrderModel(db).complete_order(7))
+    assert [query for query, _ in db.queries] == [OrderModel.COMPLETE_ORDER_QUERY]
+
+
+class FakeReadDb(FakeAsyncDb):
+    # Devuelve las filas de la primera tabla que aparezca en la consulta
+    def __init__(self, tables, cache=None):
+        super().__init__()
+        self.tables = tables
+        self.cache = cache
+
+    def in_transaction(self):
+        return False
+
+    async def fetch_all(self, query, params=None):
+        self.queries.append((query, tuple(params or ())))
+        for table, rows in self.tables.items():
+            if f"FROM {table}" in query:
+                return [dict(row) for row in rows]
+        return []
+
+
+def test_conversation_names_come_from_the_user_name_cache():
+    db = FakeReadDb({'messages': [{'id': 1, 'sender_id': 1, 'receiver_id': 2}],
+                     'users': [{'id': 1, 'name': 'Juan'}, {'id': 2, 'name': 'María'}]},
+                    cache=LRUCache())
+    messages = AsyncMessageModel(db)
+
+    async def read_twice():
+        await messages.get_conversation(1, 2)
+        return await messages.get_conversation(1, 2)
+
+    row, = asyncio.run(read_twice())
+    assert row['sender_name'] == 'Juan' and row['receiver_name'] == 'María'
+    assert sum('FROM users' in query for query, _ in db.queries) == 1
+
+    # Un cambio de nombre invalida la entrada
+    asyncio.run(messages.user_model.update_user(1, name='Juan Pérez'))
+    assert db.cache.get('user_name:1') is async_app.MISS
+
+
+def test_product_includes_load_each_relation_once():
+    db = FakeReadDb({
+        'products p': [{'id': 1, 'name': 'Tomates'}, {'id': 2, 'name': 'Papas'}],
+        'product_images': [{'product_id': 1, 'image_url': 'a.jpg'}, {'product_id': 1, 'image_url': 'b.jpg'}],
+        'rating_summaries': [{'subject_id': 2, 'review_count': 2, 'rating_sum': 9, 'rating_1': 0,
+                              'rating_2': 0, 'rating_3': 0, 'rating_4': 1, 'rating_5': 1}],
+    })
+    rows = asyncio.run(AsyncProductModel(db).get_available_products(include=('images', 'rating')))
+    assert [len(row['images']) for row in rows] == [2, 0]
+    assert [str(row['average_rating']) for row in rows] == ['0', '4.5000']
+    assert len(db.queries) == 3
+    with pytest.raises(ValueError):
+        asyncio.run(AsyncProductModel(db).get_available_products(include=('seller',)))
+
+
+def test_order_details_include():
+    db = FakeReadDb({
+        'orders o': [{'id': 5}, {'id': 6}],
+        'order_details od': [{'order_id': 6, 'product_id': 1}],
+    })
+    rows = asyncio.run(AsyncOrderModel(db).get_orders_by_buyer(1, include=('details',)))
+    assert [row['details'] for row in rows] == [[], [{'order_id': 6, 'product_id': 1}]]
+    assert asyncio.run(AsyncOrderModel(db).get_order_details_many([])) == {}
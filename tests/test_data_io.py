@@ -0,0 +1,115 @@
+import re
+from datetime import date
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+from data_io import (PRODUCT_COLUMNS, _load_data_infile, _load_data_value, import_products_from_frame,
+                     validate_products_frame)
+
+
+def _frame(**overrides):
+    row = {'user_id': 1, 'name': 'Tomates', 'description': 'Cosecha fresca', 'price': '5000',
+           'quantity': '10.5', 'unit': 'kg', 'category': 'Verduras', 'harvest_date': '2024-03-01',
+           'is_organic': 'sí', 'location_lat': 4.60971, 'location_lng': -74.081749}
+    row.update(overrides)
+    return pd.DataFrame([row])
+
+
+def test_valid_row_is_normalized():
+    valid, rejected = validate_products_frame(_frame(price=' 5000,50 '))
+    assert rejected.empty
+    assert list(valid.columns) == PRODUCT_COLUMNS
+    row = valid.iloc[0].to_dict()
+    assert row['user_id'] == 1
+    assert row['price'] == Decimal('5000.50') and row['quantity'] == Decimal('10.5')
+    assert row['harvest_date'] == date(2024, 3, 1)
+    assert row['is_organic'] is True
+    assert row['location_lat'] == 4.60971
+
+
+def test_optional_columns_default_to_null():
+    df = pd.DataFrame([{'user_id': '2', 'name': 'Papas', 'price': 1200.0, 'quantity': 3, 'unit': 'kg'}])
+    valid, rejected = validate_products_frame(df)
+    assert rejected.empty
+    row = valid.iloc[0].to_dict()
+    assert row['price'] == Decimal('1200.00')
+    assert row['description'] is None and row['category'] is None
+    assert row['harvest_date'] is None and row['location_lat'] is None
+    assert row['is_organic'] is False
+
+
+@pytest.mark.parametrize('overrides, reason', [
+    ({'user_id': 'abc'}, 'user_id inválido'),
+    ({'user_id': 0}, 'user_id inválido'),
+    ({'user_id': 1.5}, 'user_id inválido'),
+    ({'name': '   '}, 'name vacío o demasiado largo'),
+    ({'unit': 'u' * 51}, 'unit vacío o demasiado largo'),
+    ({'price': '12.345'}, 'price no es un DECIMAL(10, 2) válido'),
+    ({'quantity': '-1'}, 'quantity no es un DECIMAL(10, 2) válido'),
+    ({'harvest_date': 'ayer'}, 'harvest_date inválida'),
+    ({'is_organic': 'quizás'}, 'is_organic no es booleano'),
+    ({'location_lat': 91}, 'location_lat fuera de rango'),
+])
+def test_invalid_rows_are_rejected_with_reason(overrides, reason):
+    valid, rejected = validate_products_frame(_frame(**overrides))
+    assert valid.empty
+    assert list(rejected['error']) == [reason]
+
+
+def test_fractional_user_id_does_not_abort_the_batch():
+    df = pd.concat([_frame(user_id=1.5), _frame(user_id=2.0), _frame(user_id=None)], ignore_index=True)
+    valid, rejected = validate_products_frame(df)
+    assert list(valid['user_id']) == [2]
+    assert list(rejected['error']) == ['user_id inválido', 'user_id inválido']
+
+
+def test_missing_required_columns():
+    with pytest.raises(ValueError, match='price, quantity'):
+        validate_products_frame(pd.DataFrame([{'user_id': 1, 'name': 'Tomates', 'unit': 'kg'}]))
+
+
+def test_load_data_value():
+    assert _load_data_value(None) == '\\N'
+    assert _load_data_value(True) == 1 and _load_data_value(False) == 0
+    assert _load_data_value('C:\\fincas') == 'C:\\\\fincas'
+    assert _load_data_value(Decimal('1.50')) == Decimal('1.50')
+
+
+def test_load_data_infile_writes_nulls_and_chunks():
+    class FakeDb:
+        def __init__(self):
+            self.files = []
+
+        def execute_query(self, query):
+            path = re.search(r"INFILE '(.*?)' INTO", query).group(1)
+            with open(path, encoding='utf-8') as handle:
+                self.files.append(handle.read())
+            return True
+
+    db = FakeDb()
+    rows = [(1, 'Tomates, "chonto"', None, True), (2, 'Papas', Decimal('3.50'), False), (3, 'Yuca', None, False)]
+    assert _load_data_infile(db, 'products', ['user_id', 'name', 'price', 'is_organic'], rows, 2) == 3
+    assert db.files == ['1,"Tomates, ""chonto""",\\N,1\n2,Papas,3.50,0\n', '3,Yuca,\\N,0\n']
+
+
+def test_import_goes_through_create_products_bulk():
+    class FakeProducts:
+        def __init__(self):
+            self.calls = []
+
+        def create_products_bulk(self, products, chunk_size=None):
+            self.calls.append((products, chunk_size))
+            return list(range(10, 10 + len(products)))
+
+    products = FakeProducts()
+    df = pd.concat([_frame(), _frame(user_id='x'), _frame(name='Papas', is_organic='no')], ignore_index=True)
+    result = import_products_from_frame(None, df, chunk_size=500, product_model=products)
+    assert result['inserted'] == 2 and result['ids'] == [10, 11]
+    assert list(result['rejected']['error']) == ['user_id inválido']
+    (rows, chunk_size), = products.calls
+    assert chunk_size == 500
+    assert [(row['name'], row['is_organic'], row['price']) for row in rows] == [
+        ('Tomates', True, Decimal('5000.00')), ('Papas', False, Decimal('5000.00'))]
+    assert set(rows[0]) == set(PRODUCT_COLUMNS)
@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from geo_index import GridIndex, bounding_box, haversine_km
+
+BOGOTA = (4.609710, -74.081749)
+
+
+def test_haversine_km():
+    assert haversine_km(*BOGOTA, *BOGOTA) == 0
+    # Bogotá - Medellín, unos 246 km en línea recta
+    assert haversine_km(*BOGOTA, 6.244203, -75.581212) == pytest.approx(246, abs=1)
+    # Un grado de latitud
+    assert haversine_km(0, 0, 1, 0) == pytest.approx(111.2, abs=0.1)
+
+
+def test_bounding_box_contains_circle():
+    min_lat, max_lat, min_lng, max_lng = bounding_box(*BOGOTA, 5)
+    assert haversine_km(min_lat, BOGOTA[1], *BOGOTA) == pytest.approx(5, rel=0.01)
+    assert haversine_km(BOGOTA[0], max_lng, *BOGOTA) == pytest.approx(5, rel=0.01)
+    assert max_lat - min_lat > 0 and max_lng - min_lng > 0
+    # En el polo el rectángulo cubre todas las longitudes
+    assert bounding_box(90, 0, 10)[2:] == (-180.0, 180.0)
+
+
+def test_nearby_matches_brute_force():
+    rng = random.Random(7)
+    index = GridIndex(cell_km=2.0)
+    points = {}
+    for item_id in range(500):
+        lat = BOGOTA[0] + rng.uniform(-0.2, 0.2)
+        lng = BOGOTA[1] + rng.uniform(-0.2, 0.2)
+        points[item_id] = (lat, lng)
+        index.insert(item_id, lat, lng, {'id': item_id})
+    assert len(index) == 500
+
+    expected = sorted((haversine_km(*BOGOTA, lat, lng), item_id)
+                      for item_id, (lat, lng) in points.items()
+                      if haversine_km(*BOGOTA, lat, lng) <= 7)
+    found = index.nearby(*BOGOTA, 7, limit=1000)
+    assert [(d, item_id) for d, item_id, _ in found] == expected
+    assert [item_id for _, item_id, _ in index.nearby(*BOGOTA, 7, limit=5)] == \
+        [item_id for _, item_id in expected[:5]]
+
+
+def test_insert_moves_and_discard_removes():
+    index = GridIndex(cell_km=1.0)
+    index.insert('a', *BOGOTA, 'tomates')
+    assert 'a' in index
+    assert index.nearby(*BOGOTA, 1) == [(0.0, 'a', 'tomates')]
+
+    # Reinsertar mueve el punto de celda sin dejar copias
+    index.insert('a', 6.244203, -75.581212, 'tomates')
+    assert len(index) == 1
+    assert index.nearby(*BOGOTA, 1) == []
+    assert index.nearby(6.244203, -75.581212, 1)[0][1] == 'a'
+
+    index.discard('a')
+    index.discard('a')
+    assert 'a' not in index
+    assert len(index) == 0
+    assert index._cells == {}
+
+
+def test_nearby_predicate():
+    index = GridIndex()
+    index.insert(1, *BOGOTA, {'organic': True})
+    index.insert(2, BOGOTA[0] + 0.001, BOGOTA[1], {'organic': False})
+    assert [item_id for _, item_id, _ in index.nearby(*BOGOTA, 1)] == [1, 2]
+    assert [item_id for _, item_id, _ in index.nearby(*BOGOTA, 1, predicate=lambda p: not p['organic'])] == [2]
+
+
+def test_bounds_coverage():
+    index = GridIndex(bounds=(4.0, 5.0, -75.0, -74.0))
+    assert index.contains_point(*BOGOTA)
+    assert not index.contains_point(6.244203, -75.581212)
+    assert index.covers(*BOGOTA, 5)
+    # El círculo se sale de la región cargada por el este
+    assert not index.covers(*BOGOTA, 20)
+    assert GridIndex().covers(6.244203, -75.581212, 1000)
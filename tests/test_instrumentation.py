@@ -0,0 +1,73 @@
+from app import DatabaseManager, UserModel
+from instrumentation import BUCKET_BOUNDS, Histogram, Instrumentation, MemorySink, fingerprint
+from passwords import PasswordHasher
+
+
+class FakeCursor:
+    rowcount = 1
+    lastrowid = 1
+
+    def __init__(self, row):
+        self.row = row
+
+    def execute(self, query, params=()):
+        pass
+
+    def fetchone(self):
+        return self.row
+
+    def fetchall(self):
+        return [self.row]
+
+
+def test_fingerprint_normalizes_literals_and_lists():
+    assert fingerprint("SELECT *\n  FROM users\tWHERE id = 42 AND email = 'a@b.co'") == \
+        "SELECT * FROM users WHERE id = ? AND email = ?"
+    assert fingerprint("SELECT * FROM products WHERE id IN (%s, %s, %s)") == \
+        fingerprint("SELECT * FROM products WHERE id IN (%s)") == \
+        "SELECT * FROM products WHERE id IN (...)"
+    assert fingerprint("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s), (%s, %s)") == \
+        "INSERT INTO t (a, b) VALUES (%s, %s), ..."
+
+
+def test_histogram_quantiles_are_bounded_by_bucket_error():
+    histogram = Histogram()
+    for ms in range(1, 101):
+        histogram.record(ms / 1000)
+    assert histogram.count == 100
+    assert histogram.max == 0.1
+    assert abs(histogram.total - 5.05) < 1e-9
+    # Cada tramo es un 25 % mayor que el anterior: el límite superior no se aleja más
+    assert 0.050 <= histogram.quantile(0.50) <= 0.050 * 1.25
+    assert 0.099 <= histogram.quantile(0.99) <= 0.1
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_histogram_merge_and_overflow_bucket():
+    a, b = Histogram(), Histogram()
+    a.record(0.001)
+    b.record(BUCKET_BOUNDS[-1] * 10)
+    a.merge(b)
+    assert a.count == 2
+    assert a.counts[-1] == 1
+    assert a.quantile(1.0) == a.max == BUCKET_BOUNDS[-1] * 10
+
+
+def test_memory_sink_records_queries_by_model_method():
+    sink = MemorySink()
+    instrumentation = Instrumentation(sinks=[sink], slow_query_ms=0)
+    db = DatabaseManager(instrumentation=instrumentation)
+    db.cursor = FakeCursor({'id': 7, 'name': 'Ana'})
+    users = UserModel(db, PasswordHasher(workers=0))
+
+    assert users.get_user_by_id(7) == {'id': 7, 'name': 'Ana'}
+
+    event, = sink.events
+    assert event['fingerprint'] == "SELECT * FROM users WHERE id = %s"
+    assert event['caller'] == 'UserModel.get_user_by_id'
+    assert event['rows'] == 1 and event['slow'] and event['error'] is None
+    assert instrumentation.slow_queries[-1]['params'] == (7,)
+    stats = instrumentation.snapshot(by='caller')['UserModel.get_user_by_id']
+    assert stats['count'] == 1 and stats['rows'] == 1
+    sink.clear()
+    assert not sink.events
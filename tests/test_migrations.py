@@ -0,0 +1,199 @@
+import pytest
+from mysql.connector import ProgrammingError
+
+from app import DatabaseManager
+from migrations import (MigrationError, MigrationRunner, _RecordingDatabaseManager, _adapt_legacy_messages,
+                        _table_for_alias, add_column, add_index, check_index_coverage)
+
+
+class FakeServer:
+    # Lo justo de MySQL para las migraciones: el esquema como conjuntos, schema_migrations
+    # y planes de EXPLAIN por fragmento de consulta
+    def __init__(self):
+        self.tables = set()
+        self.columns = set()
+        self.indexes = set()
+        self.nullable = 'YES'
+        self.applied = {}
+        self.plans = []
+        self.table_rows = {}
+        self.statements = []
+        self.fail_on = None
+
+
+class FakeCursor:
+    rowcount = 1
+    lastrowid = 1
+
+    def __init__(self, server):
+        self.server = server
+        self.result = []
+
+    def execute(self, query, params=()):
+        server = self.server
+        sql = ' '.join(query.split())
+        params = tuple(params or ())
+        server.statements.append(sql)
+        if server.fail_on and server.fail_on in sql:
+            raise ProgrammingError(msg=f"falla: {sql}")
+        self.result = []
+        if sql.startswith('EXPLAIN '):
+            self.result = next((plan for fragment, plan in server.plans if fragment in sql), [])
+        elif 'INFORMATION_SCHEMA.STATISTICS' in sql:
+            self.result = [{'1': 1}] if params in server.indexes else []
+        elif 'IS_NULLABLE' in sql:
+            self.result = [{'IS_NULLABLE': server.nullable}]
+        elif 'INFORMATION_SCHEMA.COLUMNS' in sql:
+            self.result = [{'1': 1}] if params in server.columns else []
+        elif 'INFORMATION_SCHEMA.TABLES' in sql and params:
+            self.result = [{'1': 1}] if params[0] in server.tables else []
+        elif 'INFORMATION_SCHEMA.TABLES' in sql:
+            self.result = [{'TABLE_NAME': name, 'TABLE_ROWS': rows} for name, rows in server.table_rows.items()]
+        elif sql.startswith('SELECT version, applied_at FROM schema_migrations'):
+            self.result = [{'version': version, 'applied_at': at} for version, at in server.applied.items()]
+        elif sql.startswith('INSERT INTO schema_migrations'):
+            server.applied[params[0]] = 'ahora'
+        elif sql.startswith('ALTER TABLE') and ' ADD COLUMN ' in sql:
+            words = sql.split()
+            server.columns.add((words[2], words[5]))
+        elif sql.startswith('CREATE') and ' INDEX ' in sql:
+            words = sql.split()
+            server.indexes.add((words[words.index('ON') + 1], words[words.index('ON') - 1]))
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return list(self.result)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+
+def _connect(db, server):
+    db.statement_cache_size = 0
+    db.connection = FakeConnection()
+    db.cursor = FakeCursor(server)
+    return db
+
+
+def _ddl(server):
+    return [sql for sql in server.statements if sql.startswith(('ALTER', 'CREATE INDEX', 'CREATE TABLE t'))]
+
+
+MIGRATIONS = [
+    (1, "Tabla", ["CREATE TABLE t (id INT PRIMARY KEY)"]),
+    (2, "Columna", [add_column('t', 'c', 'INT NULL')]),
+    (3, "Índice", [add_index('t', 'idx_t_c', '(c)')]),
+]
+
+
+def test_migrate_applies_pending_versions_once(server):
+    runner = MigrationRunner(_connect(DatabaseManager(), server), MIGRATIONS)
+    assert runner.migrate(target=2) == [1, 2]
+    assert [applied is not None for _, _, applied in runner.status()] == [True, True, False]
+    assert runner.migrate() == [3]
+    assert _ddl(server) == ["CREATE TABLE t (id INT PRIMARY KEY)", "ALTER TABLE t ADD COLUMN c INT NULL",
+                            "CREATE INDEX idx_t_c ON t (c)"]
+
+    server.statements.clear()
+    assert runner.migrate() == []
+    assert _ddl(server) == []
+
+
+def test_steps_are_idempotent(server):
+    # Migración interrumpida tras crear la columna: al repetirla no se vuelve a crear
+    server.columns.add(('t', 'c'))
+    server.fail_on = 'CREATE INDEX'
+    runner = MigrationRunner(_connect(DatabaseManager(), server), MIGRATIONS[1:])
+    with pytest.raises(MigrationError, match='Migración 3'):
+        runner.migrate()
+    assert set(server.applied) == {2}
+
+    server.fail_on = None
+    assert runner.migrate() == [3]
+    assert _ddl(server) == ["CREATE INDEX idx_t_c ON t (c)", "CREATE INDEX idx_t_c ON t (c)"]
+    assert not any(sql.startswith('ALTER') for sql in server.statements)
+
+
+def test_versions_must_increase():
+    with pytest.raises(ValueError):
+        MigrationRunner(DatabaseManager(), [(2, "b", []), (1, "a", [])])
+    with pytest.raises(ValueError):
+        MigrationRunner(DatabaseManager(), [(1, "a", []), (1, "b", [])])
+
+
+def test_legacy_messages_are_adapted_once(server):
+    db = _connect(DatabaseManager(), server)
+    _adapt_legacy_messages(db)
+    assert _ddl(server) == []
+
+    server.columns.add(('messages', 'conversation_id'))
+    _adapt_legacy_messages(db)
+    assert any(sql.startswith('UPDATE messages m JOIN conversations c') for sql in server.statements)
+    assert [sql.split(',')[0] for sql in _ddl(server)] == [
+        "ALTER TABLE messages ADD COLUMN receiver_id INT NULL AFTER sender_id",
+        "ALTER TABLE messages ADD COLUMN is_read BOOLEAN NOT NULL DEFAULT FALSE AFTER message",
+        "CREATE INDEX idx_messages_receiver_sender_unread ON messages (receiver_id",
+        "ALTER TABLE messages MODIFY conversation_id INT NULL",
+    ]
+
+    # Segunda pasada sobre la base ya adaptada: receiver_id ya es NOT NULL
+    server.statements.clear()
+    server.nullable = 'NO'
+    _adapt_legacy_messages(db)
+    assert _ddl(server) == []
+
+
+def test_check_index_coverage_flags_full_scans(server):
+    server.plans = [
+        ("FROM products p", [{'table': 'p', 'type': 'ALL', 'possible_keys': 'idx_products_category_created',
+                              'rows': 5000}]),
+        ("FROM users WHERE id", [{'table': 'users', 'type': 'const', 'possible_keys': 'PRIMARY', 'rows': 1}]),
+        ("FROM users", [{'table': 'users', 'type': 'ALL', 'possible_keys': None, 'rows': 2}]),
+        ("FROM (SELECT", [{'table': '<derived2>', 'type': 'ALL'}, {'table': 'orders', 'type': 'ref'}]),
+    ]
+    server.table_rows = {'products': 5000, 'users': 2}
+    db = _connect(_RecordingDatabaseManager(), server)
+    checks = [
+        ('Products.scan', lambda m: m.db.fetch_all("SELECT * FROM products p WHERE p.category = %s", ('x',))),
+        ('Users.by_id', lambda m: m.db.fetch_one("SELECT * FROM users WHERE id = %s", (1,))),
+        ('Users.all', lambda m: m.db.fetch_all("SELECT * FROM users")),
+        ('Orders.derived', lambda m: m.db.fetch_all("SELECT * FROM (SELECT 1) t JOIN orders o ON o.id = 1")),
+        ('Products.write', lambda m: m.db.execute_query("UPDATE products SET price = %s WHERE id = %s", (1, 2))),
+    ]
+    problems = check_index_coverage(db, checks, allowed={('Users.all', 'users'): "tabla pequeña"})
+    assert problems == [{
+        'caller': 'Products.scan', 'table': 'p', 'query': "SELECT * FROM products p WHERE p.category = %s",
+        'possible_keys': 'idx_products_category_created', 'rows': 5000, 'table_rows': 5000,
+    }]
+    # Las escrituras solo se registran y se revisan con EXPLAIN, nunca se ejecutan
+    assert "EXPLAIN UPDATE products SET price = %s WHERE id = %s" in server.statements
+    assert not any(sql.startswith('UPDATE') for sql in server.statements)
+
+    # Sin la excepción, el recorrido de users también falla la comprobación
+    db = _connect(_RecordingDatabaseManager(), server)
+    problems = check_index_coverage(db, checks, allowed={})
+    assert [(problem['caller'], problem['table']) for problem in problems] == [
+        ('Products.scan', 'p'), ('Users.all', 'users')]
+
+
+def test_table_for_alias():
+    query = "SELECT * FROM orders o JOIN users AS u ON u.id = o.buyer_id JOIN products p ON p.id = 1"
+    assert _table_for_alias(query, 'o') == 'orders'
+    assert _table_for_alias(query, 'u') == 'users'
+    assert _table_for_alias(query, 'p') == 'products'
+    assert _table_for_alias("SELECT * FROM users", 'users') == 'users'
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+
+import pytest
+
+from notifications import Broker, FanOutLimitError
+
+
+def test_poll_returns_events_after_cursor_in_order():
+    broker = Broker()
+    first = broker.deliver(1, {'type': 'message', 'n': 1})
+    second = broker.deliver(1, {'type': 'message', 'n': 2})
+    broker.deliver(2, {'type': 'message', 'n': 3})
+    assert second == first + 1
+
+    result = asyncio.run(broker.poll(1, after=0, timeout=0.1))
+    assert result == {'events': [{'type': 'message', 'n': 1}, {'type': 'message', 'n': 2}],
+                      'cursor': second, 'reset': False}
+    result = asyncio.run(broker.poll(1, after=first, timeout=0.1))
+    assert result['events'] == [{'type': 'message', 'n': 2}]
+
+
+def test_poll_without_cursor_waits_for_future_events_and_times_out():
+    broker = Broker()
+    seq = broker.deliver(1, {'n': 1})
+    result = asyncio.run(broker.poll(1, timeout=0.05))
+    assert result == {'events': [], 'cursor': seq, 'reset': False}
+    stats = broker.stats()
+    assert stats['timeouts'] == 1 and stats['waiters'] == 0
+
+
+def test_publish_from_another_thread_wakes_waiter():
+    broker = Broker()
+
+    async def wait():
+        timer = threading.Timer(0.05, broker.publish, (1, {'n': 1}))
+        timer.start()
+        try:
+            return await broker.poll(1, after=0, timeout=5)
+        finally:
+            timer.join()
+
+    result = asyncio.run(wait())
+    assert result['events'] == [{'n': 1}]
+    assert broker.stats()['timeouts'] == 0
+
+
+def test_cursor_outside_buffer_is_reset():
+    broker = Broker(buffer_size=2)
+    seqs = [broker.deliver(1, {'n': n}) for n in range(3)]
+
+    result = asyncio.run(broker.poll(1, after=0, timeout=0.1))
+    assert result['reset']
+    assert result['events'] == [{'n': 1}, {'n': 2}]
+    assert result['cursor'] == seqs[-1]
+    # Con el cursor al día ya no hay reinicio
+    assert not asyncio.run(broker.poll(1, after=seqs[0], timeout=0.01))['reset']
+    assert broker.stats()['dropped'] == 1
+
+
+def test_forgotten_channels_reset_old_cursors():
+    broker = Broker(max_users=1)
+    seq = broker.deliver(1, {'n': 1})
+    broker.deliver(2, {'n': 2})
+    assert broker.stats()['users'] == 1
+    assert asyncio.run(broker.poll(1, after=0, timeout=0.01))['reset']
+    assert not asyncio.run(broker.poll(1, after=seq, timeout=0.01))['reset']
+
+
+def test_max_batch_limits_events_per_poll():
+    broker = Broker(max_batch=2)
+    for n in range(5):
+        broker.deliver(1, {'n': n})
+    result = asyncio.run(broker.poll(1, after=0, timeout=0.1))
+    assert [e['n'] for e in result['events']] == [0, 1]
+    result = asyncio.run(broker.poll(1, after=result['cursor'], timeout=0.1))
+    assert [e['n'] for e in result['events']] == [2, 3]
+
+
+def test_fan_out_limit():
+    broker = Broker(max_waiters_per_user=1)
+
+    async def two_waiters():
+        first = asyncio.ensure_future(broker.poll(1, timeout=5))
+        await asyncio.sleep(0)
+        with pytest.raises(FanOutLimitError) as excinfo:
+            await broker.poll(1, timeout=5)
+        broker.publish(1, {'n': 1})
+        return excinfo.value, await first
+
+    error, result = asyncio.run(two_waiters())
+    assert error.user_id == 1 and error.limit == 1
+    assert result['events'] == [{'n': 1}]
+    assert broker.stats()['rejected'] == 1
+
+
+def test_publish_goes_through_relay():
+    class FakeRelay:
+        def attach(self, broker):
+            self.broker = broker
+
+        def publish(self, user_id, event):
+            self.broker.deliver(user_id, dict(event, relayed=True))
+
+    broker = Broker(relay=FakeRelay())
+    broker.publish(1, {'n': 1})
+    assert asyncio.run(broker.poll(1, after=0, timeout=0.1))['events'] == [{'n': 1, 'relayed': True}]
@@ -0,0 +1,146 @@
+import pytest
+
+from app import DatabaseManager, ProductModel, build_bulk_update_query, pending_changes
+from geo_index import GridIndex
+from text_search import InvertedIndex
+
+
+class FakeCursor:
+    rowcount = 1
+    lastrowid = 1
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def execute(self, query, params=()):
+        self.queries.append((query, tuple(params)))
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return [dict(row) for row in self.rows]
+
+
+class FakeConnection:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def _row(**overrides):
+    return dict({'id': 1, 'name': 'Tomates', 'description': 'Cosecha fresca', 'category': 'Verduras',
+                 'status': 'available', 'location_lat': 4.60971, 'location_lng': -74.081749,
+                 'seller_name': 'Juan'}, **overrides)
+
+
+@pytest.fixture
+def products():
+    db = DatabaseManager(statement_cache_size=0)
+    db.connection = FakeConnection()
+    db.cursor = FakeCursor([_row()])
+    model = ProductModel(db, geo_index=GridIndex(), search_index=InvertedIndex())
+    model._reindex([1])
+    return model
+
+
+def _nearby_ids(products):
+    return [product_id for _, product_id, _ in products.geo_index.nearby(4.60971, -74.081749, 1)]
+
+
+def test_indexes_follow_writes_outside_transactions(products):
+    products.db.cursor.rows = [_row(status='reserved')]
+    assert products.update_product(1, status='reserved')
+    assert _nearby_ids(products) == []
+    assert products.search_index.search('tomates')[0][2]['status'] == 'reserved'
+
+
+def test_indexes_wait_for_commit(products):
+    db = products.db
+    db.cursor.rows = [_row(status='reserved')]
+    with db.transaction():
+        assert products.update_product(1, status='reserved')
+        assert _nearby_ids(products) == [1]
+    assert _nearby_ids(products) == []
+
+
+def test_rolled_back_writes_leave_indexes_untouched(products):
+    db = products.db
+    db.cursor = FakeCursor([_row(status='reserved')])
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            products.update_product(1, status='reserved')
+            products.delete_product(1)
+            raise RuntimeError("falla create_order")
+    assert db.connection.rollbacks == 1
+    assert _nearby_ids(products) == [1]
+    assert products.search_index.search('tomates')[0][2]['status'] == 'available'
+    # Ni siquiera se consultaron las filas sin confirmar
+    assert not any(query.lstrip().startswith('SELECT') for query, _ in db.cursor.queries)
+
+
+def test_build_bulk_update_query():
+    query = build_bulk_update_query('products', ('price', 'quantity'), 3)
+    assert query == (
+        "UPDATE products t JOIN ("
+        "SELECT %s AS id, %s AS price, %s AS quantity"
+        " UNION ALL SELECT %s, %s, %s"
+        " UNION ALL SELECT %s, %s, %s"
+        ") v ON t.id = v.id SET t.price = v.price, t.quantity = v.quantity")
+    # Mismo conjunto de campos y tamaño: el mismo objeto (caché de sentencias preparadas)
+    assert build_bulk_update_query('products', ('price', 'quantity'), 3) is query
+
+
+def test_pending_changes_whitelist_and_snapshot():
+    with pytest.raises(ValueError, match='password_hash, user_id'):
+        pending_changes(ProductModel.UPDATABLE_COLUMNS, {'price': 1, 'user_id': 2, 'password_hash': 'x'})
+    columns, changes = pending_changes(ProductModel.UPDATABLE_COLUMNS, {'quantity': 5, 'price': 10},
+                                       snapshot={'price': 10, 'quantity': 4})
+    assert columns == ('quantity',) and changes == {'quantity': 5}
+
+
+def _bulk_updates(products):
+    db = products.db
+    db.cursor = FakeCursor([])
+    return db.cursor.queries
+
+
+def test_update_products_bulk_groups_by_field_set_and_chunks(products):
+    queries = _bulk_updates(products)
+    products.search_index = products.geo_index = None
+    assert products.update_products_bulk([
+        (1, {'quantity': 5, 'price': 10}),
+        (2, {'status': 'sold'}),
+        (3, {'price': 12, 'quantity': 6}),
+        (4, {'price': 14, 'quantity': 7}),
+    ], chunk_size=2)
+    assert queries == [
+        (build_bulk_update_query('products', ('price', 'quantity'), 2), (1, 10, 5, 3, 12, 6)),
+        (build_bulk_update_query('products', ('price', 'quantity'), 1), (4, 14, 7)),
+        (build_bulk_update_query('products', ('status',), 1), (2, 'sold')),
+    ]
+    assert products.db.connection.commits == 1
+
+
+def test_update_products_bulk_rejects_unknown_columns(products):
+    queries = _bulk_updates(products)
+    with pytest.raises(ValueError, match='user_id'):
+        products.update_products_bulk([(1, {'price': 10}), (2, {'user_id': 9})])
+    assert queries == []
+
+
+def test_update_products_bulk_skips_unchanged_rows(products):
+    queries = _bulk_updates(products)
+    snapshots = {1: {'price': 10, 'quantity': 5}, 2: {'price': 20, 'quantity': 1}}
+    assert products.update_products_bulk([(1, {'price': 10, 'quantity': 5})], snapshots)
+    assert queries == [] and products.db.connection.commits == 0
+
+    assert products.update_products_bulk([(1, {'price': 10}), (2, {'price': 20, 'quantity': 2})], snapshots)
+    assert queries[0] == (build_bulk_update_query('products', ('quantity',), 1), (2, 2))
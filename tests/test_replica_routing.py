@@ -0,0 +1,206 @@
+import threading
+
+import pytest
+from mysql.connector import OperationalError
+
+import app
+from app import DatabaseManager
+
+
+class FakeCursor:
+    rowcount = 1
+    lastrowid = 1
+
+    def __init__(self, server):
+        self.server = server
+        self.row = None
+
+    def execute(self, query, params=()):
+        if self.server.down:
+            raise OperationalError(msg=f"Servidor {self.server.port} caído")
+        self.server.queries.append(query)
+        if query.startswith('SHOW'):
+            self.row = None if self.server.lag is None else {'Seconds_Behind_Source': self.server.lag}
+        else:
+            self.row = {'port': self.server.port}
+
+    def fetchone(self):
+        return self.row
+
+    def fetchall(self):
+        return [self.row]
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+
+    def cursor(self, **kwargs):
+        return FakeCursor(self.server)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.server.rollbacks += 1
+
+    def close(self):
+        pass
+
+
+class FakeServer:
+    def __init__(self, port):
+        self.port = port
+        self.down = False
+        self.lag = None
+        self.queries = []
+        self.rollbacks = 0
+
+
+@pytest.fixture
+def servers(monkeypatch):
+    servers = {port: FakeServer(port) for port in (3306, 3307, 3308)}
+    monkeypatch.setattr(app.mysql.connector, 'connect',
+                        lambda **config: FakeConnection(servers[config['port']]))
+    return servers
+
+
+def _manager(servers, **replica_config):
+    db = DatabaseManager(dict(app.DB_CONFIG, port=3306), statement_cache_size=0,
+                         replicas=[{'port': 3307}, {'port': 3308}],
+                         replica_config=dict({'max_lag_seconds': None}, **replica_config))
+    db.connection = FakeConnection(servers[3306])
+    db.cursor = db.connection.cursor()
+    return db
+
+
+def _read_port(db):
+    with db.replica_reads():
+        return db.fetch_one("SELECT 1")['port']
+
+
+def test_reads_outside_replica_reads_stay_on_primary(servers):
+    db = _manager(servers)
+    assert db.fetch_one("SELECT 1")['port'] == 3306
+    with db.replica_reads(), db.transaction():
+        assert db.fetch_one("SELECT 1")['port'] == 3306
+    assert db.replica_stats()['replica_reads'] == 0
+
+
+def test_round_robin_between_replicas(servers):
+    db = _manager(servers)
+    assert [_read_port(db) for _ in range(4)] == [3307, 3308, 3307, 3308]
+    stats = db.replica_stats()
+    assert stats['replica_reads'] == 4 and stats['primary_reads'] == 0
+    assert [replica['reads'] for replica in stats['replicas']] == [2, 2]
+
+
+def test_least_latency_prefers_fastest_replica(servers):
+    db = _manager(servers, balance='least_latency')
+    db.replicas[0].latency = 0.050
+    db.replicas[1].latency = 0.005
+    assert _read_port(db) == 3308
+    with pytest.raises(ValueError):
+        DatabaseManager(replicas=[{'port': 3307}], replica_config={'balance': 'random'})
+
+
+def test_reads_after_write_are_pinned_to_primary(servers):
+    db = _manager(servers)
+    assert db.execute_query("UPDATE products SET quantity = 1")
+    assert _read_port(db) == 3306
+    assert db.replica_stats()['pinned_reads'] == 1
+
+    # Otro hilo no escribió: sigue leyendo de las réplicas
+    ports = []
+    thread = threading.Thread(target=lambda: ports.append(_read_port(db)))
+    thread.start()
+    thread.join()
+    assert ports[0] in (3307, 3308)
+
+
+def test_acting_as_pins_the_user_across_threads(servers):
+    db = _manager(servers)
+    with db.acting_as(42):
+        assert db.execute_query("UPDATE users SET name = 'Ana'")
+
+    ports = {}
+
+    def read(user_id):
+        with db.acting_as(user_id):
+            ports[user_id] = _read_port(db)
+
+    for user_id in (42, 7):
+        thread = threading.Thread(target=read, args=(user_id,))
+        thread.start()
+        thread.join()
+    assert ports[42] == 3306
+    assert ports[7] in (3307, 3308)
+
+
+def test_zero_window_never_pins(servers):
+    db = _manager(servers, read_your_writes_window=0)
+    with db.acting_as(42):
+        assert db.execute_query("UPDATE users SET name = 'Ana'")
+        assert db.execute_query("UPDATE users SET name = 'Eva'")
+        assert _read_port(db) in (3307, 3308)
+    assert len(db._recent_writes) == 0
+
+
+def test_record_write_forgets_users_outside_window(servers, monkeypatch):
+    db = _manager(servers, read_your_writes_window=5.0)
+    clock = [100.0]
+    monkeypatch.setattr(app.time, 'monotonic', lambda: clock[0])
+    for user_id in (1, 2, 3):
+        with db.acting_as(user_id):
+            db._record_write()
+        clock[0] += 3.0
+    assert list(db._recent_writes) == [2, 3]
+    with db.acting_as(2):
+        assert db._wrote_recently()
+
+
+def test_mark_down_excludes_replica(servers):
+    db = _manager(servers)
+    db.replicas[0].mark_down(30.0, 'mantenimiento')
+    assert {_read_port(db) for _ in range(3)} == {3308}
+    assert db.replica_stats()['replicas'][0]['available'] is False
+
+
+def test_failed_replica_fails_over_then_falls_back_to_primary(servers):
+    db = _manager(servers)
+    servers[3307].down = True
+    assert _read_port(db) == 3308
+    stats = db.replica_stats()
+    assert stats['failovers'] == 1
+    assert stats['replicas'][0]['failures'] == 1 and stats['replicas'][0]['available'] is False
+
+    servers[3308].down = True
+    assert _read_port(db) == 3306
+    stats = db.replica_stats()
+    assert stats['failovers'] == 2 and stats['primary_reads'] == 1
+    # Ambas réplicas quedaron excluidas: la siguiente lectura va directa al primario
+    assert _read_port(db) == 3306
+    assert db.replica_stats()['failovers'] == 2
+
+
+def test_lagging_replica_is_excluded(servers):
+    db = _manager(servers, max_lag_seconds=10.0)
+    servers[3307].lag = 60
+    servers[3308].lag = 2
+    assert {_read_port(db) for _ in range(3)} == {3308}
+    assert [replica.lag for replica in db.replicas] == [60, 2]
+    # Las mediciones se repiten solo cada lag_check_interval
+    assert sum(query.startswith('SHOW') for query in servers[3308].queries) == 1
+
+
+def test_replica_session_ends_its_transaction(servers):
+    # Sin pool cada réplica usa una conexión única: cada lectura cierra su transacción
+    # para no quedarse con la instantánea de la primera consulta
+    db = _manager(servers)
+    for _ in range(4):
+        _read_port(db)
+    assert servers[3307].rollbacks == 2 and servers[3308].rollbacks == 2
+    assert len(servers[3307].queries) == 2
@@ -0,0 +1,151 @@
+import os
+import random
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from app import POOL_CONFIG, DatabaseManager, InsufficientStockError, OrderModel, ProductModel, UserModel
+from passwords import PasswordHasher
+
+STOCK = 2500
+PRODUCTS = 4
+THREADS = 32
+# Tope de seguridad; con una unidad por producto bastan unas pocas miles de compras
+MAX_CHECKOUTS = 50000
+# Ritmo mínimo exigido (compras por segundo); 0 solo lo informa
+MIN_CHECKOUTS_PER_SECOND = float(os.environ.get('CAMPODIGITAL_MIN_CHECKOUTS_PER_SECOND', 0))
+
+
+@pytest.fixture
+def store(mysql_config):
+    db = DatabaseManager(mysql_config, pool_config=dict(POOL_CONFIG, min_size=1, max_size=THREADS))
+    db.connect()
+    users = UserModel(db, PasswordHasher(n=2 ** 4, workers=0))
+    suffix = uuid.uuid4().hex[:8]
+    seller_id = users.create_user(f"vendedor-{suffix}@example.com", "clave", "Vendedor", None, 'agricultor')
+    buyer_id = users.create_user(f"comprador-{suffix}@example.com", "clave", "Comprador", None, 'consumidor')
+    products = ProductModel(db)
+    orders = OrderModel(db, products)
+    yield db, products, orders, seller_id, buyer_id
+    # Los detalles impiden borrar productos vendidos: primero los pedidos
+    db.execute_query("DELETE FROM orders WHERE seller_id = %s", (seller_id,))
+    db.execute_query("DELETE FROM users WHERE id IN (%s, %s)", (seller_id, buyer_id))
+    db.disconnect()
+
+
+def _product(db, product_id):
+    return db.fetch_one("SELECT quantity, status FROM products WHERE id = %s", (product_id,))
+
+
+def test_concurrent_checkouts_never_oversell(store, record_property):
+    # Como benchmarks.py stock-stress, pero con pedidos completos (place_order): cada
+    # compra lleva una unidad de varios productos y se compra hasta agotarlos todos
+    db, products, orders, seller_id, buyer_id = store
+    product_ids = [products.create_product(seller_id, f"Producto {i}", "prueba de inventario", 1000, STOCK, 'kg')
+                   for i in range(PRODUCTS)]
+    sold_out = set()
+    counters = {'placed': 0, 'rejected': 0}
+    errors = []
+    lock = threading.Lock()
+
+    def buyer(seed):
+        rng = random.Random(seed)
+        while True:
+            with lock:
+                open_products = [product_id for product_id in product_ids if product_id not in sold_out]
+                if not open_products or counters['placed'] + counters['rejected'] >= MAX_CHECKOUTS:
+                    return
+            chosen = rng.sample(open_products, rng.randint(1, len(open_products)))
+            items = [{'product_id': product_id, 'quantity': 1, 'unit_price': 1000} for product_id in chosen]
+            try:
+                orders.place_order(buyer_id, seller_id, items, "Calle 1", None)
+            except InsufficientStockError as e:
+                with lock:
+                    counters['rejected'] += 1
+                    sold_out.add(e.product_id)
+                continue
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+                return
+            with lock:
+                counters['placed'] += 1
+
+    threads = [threading.Thread(target=buyer, args=(seed,)) for seed in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    checkouts = counters['placed'] + counters['rejected']
+    rate = checkouts / elapsed
+    record_property('checkouts_per_second', round(rate))
+    print(f"{checkouts} compras en {elapsed:.2f}s ({rate:.0f}/s): "
+          f"{counters['placed']} pedidos, {counters['rejected']} sin stock")
+
+    assert errors == []
+    for product_id in product_ids:
+        row = _product(db, product_id)
+        sold = db.fetch_one("SELECT COALESCE(SUM(quantity), 0) AS units FROM order_details WHERE product_id = %s",
+                            (product_id,))['units']
+        assert row['quantity'] >= 0
+        assert sold == STOCK
+        assert row['quantity'] == 0 and row['status'] == 'reserved'
+    assert counters['placed'] >= STOCK
+    assert rate >= MIN_CHECKOUTS_PER_SECOND
+
+
+def test_cancel_releases_only_reserved_stock(store):
+    db, products, orders, seller_id, buyer_id = store
+    product_id = products.create_product(seller_id, "Lechugas", "prueba de inventario", 500, 10, 'unidad')
+
+    reserved_order = orders.place_order(buyer_id, seller_id,
+                                        [{'product_id': product_id, 'quantity': 4, 'unit_price': 500}],
+                                        "Calle 1", None)
+    assert _product(db, product_id)['quantity'] == Decimal(6)
+    assert orders.cancel_order(reserved_order)
+    assert _product(db, product_id)['quantity'] == Decimal(10)
+    assert not orders.cancel_order(reserved_order)
+    assert _product(db, product_id)['quantity'] == Decimal(10)
+
+    # Pedido armado a mano: nunca descontó inventario, así que cancelarlo no lo devuelve
+    manual_order = orders.create_order(buyer_id, seller_id, 1000, "Calle 1", None)
+    orders.add_order_detail(manual_order, product_id, 2, 500)
+    assert orders.cancel_order(manual_order)
+    assert _product(db, product_id)['quantity'] == Decimal(10)
+
+
+def test_complete_order_skips_cancelled_orders(store):
+    db, products, orders, seller_id, buyer_id = store
+    product_id = products.create_product(seller_id, "Papas", "prueba de inventario", 800, 2, 'kg')
+    order_id = orders.place_order(buyer_id, seller_id,
+                                  [{'product_id': product_id, 'quantity': 2, 'unit_price': 800}],
+                                  "Calle 1", None)
+    assert orders.cancel_order(order_id)
+    assert not orders.complete_order(order_id)
+    assert orders.get_order_by_id(order_id)['status'] == 'cancelled'
+    assert _product(db, product_id) == {'quantity': Decimal(2), 'status': 'available'}
+
+
+def test_cancel_after_other_order_completes_returns_stock(store):
+    db, products, orders, seller_id, buyer_id = store
+    product_id = products.create_product(seller_id, "Yuca", "prueba de inventario", 700, 5, 'kg')
+    first = orders.place_order(buyer_id, seller_id,
+                               [{'product_id': product_id, 'quantity': 3, 'unit_price': 700}],
+                               "Calle 1", None)
+    second = orders.place_order(buyer_id, seller_id,
+                                [{'product_id': product_id, 'quantity': 2, 'unit_price': 700}],
+                                "Calle 1", None)
+    assert _product(db, product_id) == {'quantity': Decimal(0), 'status': 'reserved'}
+
+    # El segundo pedido aún retiene unidades: completar el primero no agota el producto
+    assert orders.complete_order(first)
+    assert _product(db, product_id) == {'quantity': Decimal(0), 'status': 'reserved'}
+
+    assert orders.cancel_order(second)
+    assert _product(db, product_id) == {'quantity': Decimal(2), 'status': 'available'}
@@ -0,0 +1,64 @@
+from text_search import InvertedIndex, build_boolean_query, stem_es, strip_accents, tokenize
+
+
+def test_stem_unifies_plural_and_gender():
+    assert stem_es('tomates') == stem_es('tomate') == 'tomat'
+    assert stem_es('organicos') == stem_es('organicas') == 'organic'
+    assert stem_es('luces') == 'luz'
+    # Las palabras cortas se dejan como están
+    assert stem_es('mas') == 'mas'
+
+
+def test_tokenize_drops_accents_and_stopwords():
+    assert strip_accents('Orgánicos ñame') == 'Organicos name'
+    assert tokenize('Tomates orgánicos de la finca') == ['tomat', 'organic', 'finc']
+    assert tokenize(None) == []
+
+
+def test_build_boolean_query():
+    assert build_boolean_query('Tomates orgánicos de la finca') == 'tomat* organic* finc*'
+    assert build_boolean_query('tomate tomates TOMATE') == 'tomat*'
+    assert build_boolean_query('ají de la sal', min_token_size=3) == 'aji* sal*'
+    assert build_boolean_query('de la y') == ''
+
+
+def test_inverted_index_ranks_by_relevance():
+    index = InvertedIndex()
+    index.add(1, 'Tomates orgánicos de la finca', {'category': 'Verduras'})
+    index.add(2, 'Tomate chonto', {'category': 'Verduras'})
+    index.add(3, 'Lechugas verdes', {'category': 'Verduras'})
+    index.add(4, 'Salsa de tomate orgánica casera', {'category': 'Conservas'})
+    assert len(index) == 4
+
+    assert [doc_id for _, doc_id, _ in index.search('tomates')] == [2, 1, 4]
+    assert [doc_id for _, doc_id, _ in index.search('tomate organico')][:2] == [1, 4]
+    assert index.search('lechuga')[0][1] == 3
+    assert index.search('zanahoria') == []
+    assert index.search('de la') == []
+
+
+def test_inverted_index_prefix_predicate_and_limit():
+    index = InvertedIndex()
+    index.add(1, 'Tomates de árbol', {'category': 'Frutas'})
+    index.add(2, 'Tomatillos', {'category': 'Verduras'})
+    index.add(3, 'Tomate chonto', {'category': 'Verduras'})
+
+    # La raíz 'tomat' se expande a todo el vocabulario que empieza por ella
+    assert {doc_id for _, doc_id, _ in index.search('tomate')} == {1, 2, 3}
+    only_vegetables = index.search('tomate', predicate=lambda p: p['category'] == 'Verduras')
+    assert {doc_id for _, doc_id, _ in only_vegetables} == {2, 3}
+    assert len(index.search('tomate', limit=1)) == 1
+
+
+def test_inverted_index_reindex_and_remove():
+    index = InvertedIndex()
+    index.add(1, 'Papas criollas')
+    index.add(1, 'Yuca fresca')
+    assert len(index) == 1
+    assert index.search('papa') == []
+    assert index.search('yuca')[0][1] == 1
+
+    index.remove(1)
+    index.remove(1)
+    assert len(index) == 0
+    assert index.search('yuca') == []
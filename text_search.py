@@ -0,0 +1,130 @@
+# Normalización de texto en español e índice invertido en memoria para la búsqueda de productos
+import bisect
+import math
+import re
+import threading
+import unicodedata
+
+STOPWORDS = {
+    'a', 'al', 'con', 'de', 'del', 'el', 'en', 'la', 'las', 'lo', 'los',
+    'o', 'para', 'por', 'sin', 'su', 'un', 'una', 'unos', 'unas', 'y',
+}
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def strip_accents(text):
+    decomposed = unicodedata.normalize('NFD', text)
+    return ''.join(c for c in decomposed if unicodedata.category(c) != 'Mn')
+
+
+def stem_es(word):
+    # Lematizador ligero: unifica plural y género (tomate/tomates, orgánico/orgánicas)
+    if len(word) > 4 and word.endswith('ces'):
+        return word[:-3] + 'z'
+    if len(word) > 3 and word.endswith('s'):
+        word = word[:-1]
+    if len(word) > 3 and word[-1] in 'aeo':
+        word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    # Términos normalizados: minúsculas, sin tildes, sin palabras vacías y lematizados
+    words = _WORD_RE.findall(strip_accents((text or '').lower()))
+    return [stem_es(w) for w in words if w not in STOPWORDS]
+
+
+def build_boolean_query(text, min_token_size=3):
+    # Consulta para MATCH ... AGAINST (... IN BOOLEAN MODE): cada raíz con comodín de
+    # prefijo para que 'tomat*' encuentre tomate y tomates. Las tildes las resuelve la
+    # intercalación de la columna (utf8mb4_0900_ai_ci no distingue acentos).
+    terms = []
+    for term in tokenize(text):
+        if len(term) >= min_token_size and term not in terms:
+            terms.append(term)
+    return ' '.join(f'{term}*' for term in terms)
+
+
+class InvertedIndex:
+    # Índice invertido con ranking BM25 y coincidencia por prefijo de raíz, para pruebas
+    # o despliegues sin índice FULLTEXT
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}
+        self._docs = {}
+        self._total_length = 0
+        self._vocabulary = []
+        self._vocabulary_dirty = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, doc_id, text, payload=None):
+        terms = tokenize(text)
+        counts = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        with self._lock:
+            self._remove_locked(doc_id)
+            self._docs[doc_id] = (len(terms), counts, payload)
+            self._total_length += len(terms)
+            for term, tf in counts.items():
+                if term not in self._postings:
+                    self._postings[term] = {}
+                    self._vocabulary_dirty = True
+                self._postings[term][doc_id] = tf
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        length, counts, _ = doc
+        self._total_length -= length
+        for term in counts:
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+                self._vocabulary_dirty = True
+
+    def _expand(self, prefix):
+        # Términos del vocabulario que empiezan por la raíz buscada
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + '\uffff')
+        return self._vocabulary[start:end]
+
+    def search(self, text, limit=20, predicate=None):
+        # Devuelve [(puntuación, doc_id, payload)] de mayor a menor relevancia
+        query_terms = list(dict.fromkeys(tokenize(text)))
+        with self._lock:
+            if not query_terms or not self._docs:
+                return []
+            n_docs = len(self._docs)
+            avg_length = self._total_length / n_docs or 1.0
+            scores = {}
+            for prefix in query_terms:
+                for term in self._expand(prefix):
+                    postings = self._postings[term]
+                    idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for doc_id, tf in postings.items():
+                        length = self._docs[doc_id][0]
+                        norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                        scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+            results = []
+            for doc_id, score in scores.items():
+                payload = self._docs[doc_id][2]
+                if predicate is None or predicate(payload):
+                    results.append((score, doc_id, payload))
+        results.sort(key=lambda r: (-r[0], r[1]))
+        return results[:limit]